@@ -1,22 +1,20 @@
-from django.dispatch import receiver
-from resources.signals import reservation_modified, reservation_cancelled
+from resources.models import ReservationEventJob
+from resources.models.event import register_reservation_event_handler
 
 
-@receiver(reservation_modified)
-def handle_reservation_change(sender, instance, user, **kwargs):
-    catering_orders = instance.catering_orders.all()
-    if not catering_orders:
-        return
-
-    for order in catering_orders:
+def notify_catering_orders_modified(reservation, user):
+    for order in reservation.catering_orders.all():
         order.send_modified_notification()
 
 
-@receiver(reservation_cancelled)
-def handle_reservation_cancellation(sender, instance, user, **kwargs):
-    catering_orders = instance.catering_orders.all()
-    if not catering_orders:
-        return
-
-    for order in catering_orders:
+def notify_catering_orders_deleted(reservation, user):
+    for order in reservation.catering_orders.all():
         order.send_deleted_notification()
+
+
+register_reservation_event_handler(
+    ReservationEventJob.MODIFIED, 'caterings.notify_modified', notify_catering_orders_modified
+)
+register_reservation_event_handler(
+    ReservationEventJob.CANCELLED, 'caterings.notify_deleted', notify_catering_orders_deleted
+)
@@ -3,8 +3,6 @@
 from django.apps import apps
 from django.db.models.signals import pre_save
 
-from resources.signals import reservation_cancelled, reservation_confirmed, reservation_modified
-
 logger = logging.getLogger(__name__)
 
 
@@ -17,30 +15,20 @@ def _get_acr(resource):
     return acr[0]
 
 
-def handle_reservation_confirmed(sender, **kwargs):
-    reservation = kwargs.get('instance')
+def grant_reservation_access(reservation, user):
     acr = _get_acr(reservation.resource)
     if not acr:
         return
     acr.grant_access(reservation)
 
 
-def handle_reservation_cancelled(sender, **kwargs):
-    reservation = kwargs.get('instance')
+def revoke_reservation_access(reservation, user):
     acr = _get_acr(reservation.resource)
     if not acr:
         return
     acr.revoke_access(reservation)
 
 
-def handle_reservation_modified(sender, **kwargs):
-    reservation = kwargs.get('instance')
-    acr = _get_acr(reservation.resource)
-    if not acr:
-        return
-    acr.grant_access(reservation)
-
-
 def handle_respa_resource_save(sender, **kwargs):
     resource = kwargs.get('instance')
     acr = _get_acr(resource)
@@ -50,9 +38,20 @@ def handle_respa_resource_save(sender, **kwargs):
 
 
 def install_signal_handlers():
-    reservation_confirmed.connect(handle_reservation_confirmed)
-    reservation_cancelled.connect(handle_reservation_cancelled)
-    reservation_modified.connect(handle_reservation_modified)
+    from resources.models.event import register_reservation_event_handler
+
+    ReservationEventJob = apps.get_model(app_label='resources', model_name='ReservationEventJob')
+    # The access control systems are called one reservation at a time. Granting and revoking
+    # share a name, so that a retried grant can't run after the revocation of the reservation.
+    register_reservation_event_handler(
+        ReservationEventJob.CONFIRMED, 'kulkunen.access', grant_reservation_access, concurrency=1
+    )
+    register_reservation_event_handler(
+        ReservationEventJob.MODIFIED, 'kulkunen.access', grant_reservation_access, concurrency=1
+    )
+    register_reservation_event_handler(
+        ReservationEventJob.CANCELLED, 'kulkunen.access', revoke_reservation_access, concurrency=1
+    )
 
     Resource = apps.get_model(app_label='resources', model_name='Resource')
     pre_save.connect(handle_respa_resource_save, sender=Resource)
@@ -0,0 +1,53 @@
+import pytest
+from django.core.management import call_command
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from kulkunen.models import AccessControlResource
+from resources.models import Reservation, ReservationEventJob
+
+
+@pytest.mark.django_db
+@override_settings(RESPA_RESERVATION_EVENTS_RUN_IMMEDIATELY=False)
+def test_revoke_waits_for_retried_grant(ac_resource, user, monkeypatch):
+    calls = []
+    grant_failures = [Exception('access control system is down')]
+
+    def grant_access(self, reservation):
+        if grant_failures:
+            raise grant_failures.pop()
+        calls.append(('grant', reservation.id))
+
+    def revoke_access(self, reservation):
+        calls.append(('revoke', reservation.id))
+
+    monkeypatch.setattr(AccessControlResource, 'grant_access', grant_access)
+    monkeypatch.setattr(AccessControlResource, 'revoke_access', revoke_access)
+
+    reservation = Reservation.objects.create(
+        resource=ac_resource.resource,
+        begin='2115-04-04T09:00:00+02:00',
+        end='2115-04-04T10:00:00+02:00',
+        user=user,
+        state=Reservation.CREATED,
+    )
+    reservation.set_state(Reservation.CONFIRMED, user)
+    reservation.set_state(Reservation.CANCELLED, user)
+    grant_job, revoke_job = ReservationEventJob.objects.filter(handler='kulkunen.access').order_by('id')
+    assert (grant_job.event, revoke_job.event) == (ReservationEventJob.CONFIRMED, ReservationEventJob.CANCELLED)
+
+    # the grant fails, and the revocation waits for its retry
+    call_command('process_reservation_events')
+    grant_job.refresh_from_db()
+    revoke_job.refresh_from_db()
+    assert (grant_job.state, grant_job.attempts) == (ReservationEventJob.PENDING, 1)
+    assert (revoke_job.state, revoke_job.attempts) == (ReservationEventJob.PENDING, 0)
+    assert calls == []
+
+    grant_job.run_after = timezone.now()
+    grant_job.save()
+    call_command('process_reservation_events')
+    assert calls == [('grant', reservation.id), ('revoke', reservation.id)]
+    assert set(
+        ReservationEventJob.objects.filter(handler='kulkunen.access').values_list('state', flat=True)
+    ) == {ReservationEventJob.DONE}
@@ -1,7 +1,8 @@
 from parler.admin import TranslatableAdmin
 from parler.forms import TranslatableModelForm
+from django.contrib import admin
 from django.contrib.admin import site as admin_site
-from .models import NotificationTemplate
+from .models import NotificationTemplate, OutboxMessage
 
 
 class NotificationTemplateForm(TranslatableModelForm):
@@ -27,3 +28,12 @@ class NotificationTemplateAdmin(TranslatableAdmin):
 
 
 admin_site.register(NotificationTemplate, NotificationTemplateAdmin)
+
+
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ('email_address', 'subject', 'state', 'attempts', 'created_at', 'sent_at')
+    list_filter = ('state',)
+    readonly_fields = ('attempts', 'last_error', 'created_at', 'sent_at')
+
+
+admin_site.register(OutboxMessage, OutboxMessageAdmin)
@@ -5,3 +5,6 @@
 class NotificationsConfig(AppConfig):
     name = 'notifications'
     verbose_name = _('Notifications')
+
+    def ready(self):
+        import notifications.signal_handlers  # noqa
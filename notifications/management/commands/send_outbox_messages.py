@@ -0,0 +1,50 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from notifications.models import OutboxMessage, send_outbox_messages
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Sends the pending emails in the notification outbox.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, dest='batch_size',
+                            help='Number of messages sent over a single connection')
+        parser.add_argument('--loop', action='store_true', dest='loop', default=False,
+                            help='Keep polling the outbox instead of exiting when it is empty')
+        parser.add_argument('--interval', type=float, default=10, dest='interval',
+                            help='Seconds to wait between polls when looping')
+
+    def handle(self, *args, **options):
+        while True:
+            sent = failed = 0
+            while True:
+                batch_sent, batch_failed = self.send_batch(options['batch_size'])
+                if not batch_sent and not batch_failed:
+                    break
+                sent += batch_sent
+                failed += batch_failed
+            if sent or failed:
+                logger.info('Sent %d outbox message(s), %d failed.' % (sent, failed))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def send_batch(self, batch_size):
+        # Rows are locked with SKIP LOCKED so that several workers can drain the outbox concurrently.
+        with transaction.atomic():
+            messages = list(
+                OutboxMessage.objects.due().select_for_update(skip_locked=True).order_by('id')[:batch_size]
+            )
+            if not messages:
+                return 0, 0
+            try:
+                return send_outbox_messages(messages)
+            except Exception as e:
+                logger.error('Could not open a mail connection: %s' % e)
+                return 0, 0
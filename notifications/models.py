@@ -1,8 +1,12 @@
+import base64
+import datetime
 import logging
 
 from django.conf import settings
+from django.contrib.postgres.fields import JSONField
+from django.core.mail import EmailMultiAlternatives, get_connection
 from django.db import models
-from django.utils import translation
+from django.utils import timezone, translation
 from django.utils.html import strip_tags
 from django.utils.translation import ugettext_lazy as _
 from django.utils.formats import date_format
@@ -101,20 +105,15 @@ def render(self, context, language_code=DEFAULT_LANG):
 
         """
 
-        env = SandboxedEnvironment(trim_blocks=True, lstrip_blocks=True, undefined=StrictUndefined)
-        env.filters['reservation_time'] = reservation_time
-        env.filters['format_datetime'] = format_datetime
-        env.filters['format_datetime_tz'] = format_datetime_tz
-
         logger.debug('Rendering template for notification %s' % self.type)
         with switch_language(self, language_code):
             try:
                 rendered_notification = {
-                    attr: env.from_string(getattr(self, attr)).render(context)
+                    attr: self.get_compiled_template(attr).render(context)
                     for attr in ('short_message', 'subject', 'html_body')
                 }
                 if self.body:
-                    rendered_notification['body'] = env.from_string(self.body).render(context)
+                    rendered_notification['body'] = self.get_compiled_template('body').render(context)
                 else:
                     # if text body is empty use html body without tags as text body
                     rendered_notification['body'] = strip_tags(rendered_notification['html_body'])
@@ -122,6 +121,22 @@ def render(self, context, language_code=DEFAULT_LANG):
             except TemplateError as e:
                 raise NotificationTemplateException(e) from e
 
+    def get_compiled_template(self, attr):
+        """
+        Return the given field of this template in the current language compiled into a Jinja template
+
+        Compiled templates are cached for the lifetime of the process. The
+        source text is part of the cache key, so an edited template is never
+        served from a stale entry, even if the entry has not been cleared yet.
+        """
+        source = getattr(self, attr)
+        cache_key = (self.pk, self.get_current_language(), attr, source)
+        template = _compiled_templates.get(cache_key)
+        if template is None:
+            template = template_environment.from_string(source)
+            _compiled_templates[cache_key] = template
+        return template
+
 
 def reservation_time(res):
     if isinstance(res, dict):
@@ -146,6 +161,20 @@ def format_datetime_tz(dt, tz):
     return format_datetime(dt)
 
 
+template_environment = SandboxedEnvironment(trim_blocks=True, lstrip_blocks=True, undefined=StrictUndefined)
+template_environment.filters['reservation_time'] = reservation_time
+template_environment.filters['format_datetime'] = format_datetime
+template_environment.filters['format_datetime_tz'] = format_datetime_tz
+
+_compiled_templates = {}
+
+
+def clear_compiled_templates(template_id):
+    for cache_key in list(_compiled_templates):
+        if cache_key[0] == template_id:
+            _compiled_templates.pop(cache_key, None)
+
+
 def render_notification_template(notification_type, context, language_code=DEFAULT_LANG):
     try:
         template = NotificationTemplate.objects.get(type=notification_type)
@@ -153,3 +182,164 @@ def render_notification_template(notification_type, context, language_code=DEFAU
         raise NotificationTemplateException(e) from e
 
     return template.render(context, language_code)
+
+
+class OutboxMessageQuerySet(models.QuerySet):
+    def due(self):
+        return self.filter(state=OutboxMessage.PENDING, send_after__lte=timezone.now())
+
+    def enqueue(self, email_address, subject, body, html_body=None, attachments=None, from_address=None):
+        """
+        Store an email to be sent by the send_outbox_messages worker
+
+        The message is written in the current transaction, so it is only sent
+        if the transaction commits. When RESPA_MAILS_SEND_IMMEDIATELY is set,
+        the message is sent right away instead.
+        """
+        return self.enqueue_many([
+            dict(email_address=email_address, subject=subject, body=body, html_body=html_body,
+                 attachments=attachments, from_address=from_address)
+        ])[0]
+
+    def enqueue_many(self, messages):
+        """
+        Store many emails to be sent at once
+
+        Takes a list of dicts with the arguments of enqueue(). The messages
+        are inserted with a single query, and when sent immediately, they
+        share a single mail connection.
+        """
+        messages = self.bulk_create([
+            OutboxMessage(
+                email_address=message['email_address'],
+                from_address=message.get('from_address') or '',
+                subject=message['subject'],
+                body=message['body'],
+                html_body=message.get('html_body') or '',
+                attachments=[encode_attachment(*attachment) for attachment in message.get('attachments') or []],
+            ) for message in messages
+        ])
+        if messages and getattr(settings, 'RESPA_MAILS_SEND_IMMEDIATELY', False):
+            send_outbox_messages(messages)
+        return messages
+
+
+class OutboxMessage(models.Model):
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATE_CHOICES = (
+        (PENDING, _('pending')),
+        (SENT, _('sent')),
+        (FAILED, _('failed')),
+    )
+
+    email_address = models.CharField(verbose_name=_('Email address'), max_length=254)
+    from_address = models.CharField(verbose_name=_('From address'), max_length=254, blank=True)
+    subject = models.TextField(verbose_name=_('Subject'))
+    body = models.TextField(verbose_name=_('Body'), blank=True)
+    html_body = models.TextField(verbose_name=_('HTML body'), blank=True)
+    attachments = JSONField(verbose_name=_('Attachments'), default=list, blank=True)
+
+    state = models.CharField(verbose_name=_('State'), max_length=16, choices=STATE_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(verbose_name=_('Attempts'), default=0)
+    last_error = models.TextField(verbose_name=_('Last error'), blank=True)
+    created_at = models.DateTimeField(verbose_name=_('Created at'), auto_now_add=True)
+    send_after = models.DateTimeField(verbose_name=_('Send after'), default=timezone.now)
+    sent_at = models.DateTimeField(verbose_name=_('Sent at'), null=True, blank=True)
+
+    objects = OutboxMessageQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = _('Outbox message')
+        verbose_name_plural = _('Outbox messages')
+        indexes = [models.Index(fields=['state', 'send_after'])]
+
+    def __str__(self):
+        return '%s: %s (%s)' % (self.email_address, self.subject, self.state)
+
+    def build_email(self, connection=None):
+        attachments = [decode_attachment(attachment) for attachment in self.attachments]
+        msg = EmailMultiAlternatives(
+            self.subject, self.body, self.from_address or None, [self.email_address],
+            attachments=attachments, connection=connection
+        )
+        if self.html_body:
+            msg.attach_alternative(self.html_body, 'text/html')
+        return msg
+
+    def send(self, connection=None):
+        """
+        Send the message and record the outcome
+
+        Failed messages are retried with an exponential backoff until
+        RESPA_MAILS_OUTBOX_MAX_ATTEMPTS is reached. Returns True on success.
+        """
+        self.attempts += 1
+        try:
+            self.build_email(connection).send()
+        except Exception as e:
+            logger.warning('Sending outbox message %s failed: %s' % (self.pk, e))
+            self.last_error = str(e)
+            if self.attempts >= settings.RESPA_MAILS_OUTBOX_MAX_ATTEMPTS:
+                self.state = self.FAILED
+            else:
+                self.send_after = timezone.now() + datetime.timedelta(minutes=2 ** self.attempts)
+            self.save(update_fields=('attempts', 'last_error', 'state', 'send_after'))
+            return False
+
+        self.state = self.SENT
+        self.sent_at = timezone.now()
+        self.save(update_fields=('attempts', 'state', 'sent_at'))
+        return True
+
+
+def send_outbox_messages(messages):
+    """
+    Send the given outbox messages over a single mail connection
+
+    Returns a tuple of the numbers of sent and failed messages. Raises if
+    the connection cannot be opened.
+    """
+    connection = get_connection()
+    connection.open()
+    try:
+        results = [message.send(connection) for message in messages]
+    finally:
+        connection.close()
+    return results.count(True), results.count(False)
+
+
+def render_bulk_notification(template, recipients, get_context):
+    """
+    Render a notification template for many recipients
+
+    The context is built and the template is rendered only once per language.
+
+    :param template: the notification template to render
+    :type template: NotificationTemplate
+    :param recipients: (email address, language code) tuples
+    :type recipients: list[(str, str)]
+    :param get_context: callable returning the template context for a language code
+    :return: (email address, rendered notification) tuples
+    :rtype: list[(str, dict)]
+    """
+    rendered_by_language = {}
+    rendered_notifications = []
+    for email_address, language_code in recipients:
+        if language_code not in rendered_by_language:
+            rendered_by_language[language_code] = template.render(get_context(language_code), language_code)
+        rendered_notifications.append((email_address, rendered_by_language[language_code]))
+    return rendered_notifications
+
+
+def encode_attachment(file_name, content, mimetype=None):
+    if isinstance(content, bytes):
+        return {'name': file_name, 'content': base64.b64encode(content).decode('ascii'), 'mimetype': mimetype,
+                'base64': True}
+    return {'name': file_name, 'content': content, 'mimetype': mimetype, 'base64': False}
+
+
+def decode_attachment(data):
+    content = base64.b64decode(data['content']) if data['base64'] else data['content']
+    return (data['name'], content, data['mimetype'])
@@ -0,0 +1,18 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from notifications.models import NotificationTemplate, clear_compiled_templates
+
+NotificationTemplateTranslation = NotificationTemplate._parler_meta.root_model
+
+
+@receiver(post_save, sender=NotificationTemplate)
+@receiver(post_delete, sender=NotificationTemplate)
+def handle_template_change(sender, instance, **kwargs):
+    clear_compiled_templates(instance.pk)
+
+
+@receiver(post_save, sender=NotificationTemplateTranslation)
+@receiver(post_delete, sender=NotificationTemplateTranslation)
+def handle_template_translation_change(sender, instance, **kwargs):
+    clear_compiled_templates(instance.master_id)
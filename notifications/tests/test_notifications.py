@@ -1,7 +1,11 @@
+from unittest import mock
+
 import pytest
 from parler.utils.context import switch_language
 
-from notifications.models import NotificationType, NotificationTemplate, render_notification_template
+from notifications.models import (
+    NotificationType, NotificationTemplate, render_notification_template, template_environment
+)
 
 
 @pytest.fixture(scope='function')
@@ -94,3 +98,27 @@ def test_notification_template_rendering_empty_html_body(notification_template):
     assert rendered['subject'] == "testiotsikko, muuttujan arvo: bar!"
     assert rendered['body'] == "testiruumis, muuttujan arvo: baz!"
     assert rendered['html_body'] == ""
+
+
+@pytest.mark.django_db
+def test_notification_template_compiled_once(notification_template):
+    context = {
+        'short_message_var': 'foo',
+        'subject_var': 'bar',
+        'body_var': 'baz',
+        'html_body_var': 'foo <b>bar</b> baz',
+    }
+    template = NotificationTemplate.objects.get(type=NotificationType.TEST)
+
+    with mock.patch.object(template_environment, 'from_string', wraps=template_environment.from_string) as compile:
+        template.render(context, 'en')
+        template.render(context, 'en')
+        assert compile.call_count == 4
+
+        with switch_language(template, 'en'):
+            template.subject = 'new subject, variable value: {{ subject_var }}!'
+            template.save()
+        rendered = template.render(context, 'en')
+        assert rendered['subject'] == 'new subject, variable value: bar!'
+        # saving the template drops its compiled templates
+        assert compile.call_count == 8
@@ -0,0 +1,69 @@
+import datetime
+from unittest import mock
+
+import pytest
+from django.core import mail
+from django.core.management import call_command
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from notifications.models import OutboxMessage
+from resources.models.utils import send_respa_mail
+
+
+@pytest.mark.django_db
+@override_settings(RESPA_MAILS_ENABLED=True, RESPA_MAILS_SEND_IMMEDIATELY=False)
+def test_outbox_message_is_sent_by_worker():
+    attachments = [('reservation.ics', b'BEGIN:VCALENDAR\r\nEND:VCALENDAR\r\n', 'text/calendar'),
+                   ('notes.txt', 'some notes', 'text/plain')]
+    send_respa_mail('test@example.com', 'test subject', 'test body', '<b>test body</b>', attachments)
+
+    assert len(mail.outbox) == 0
+    message = OutboxMessage.objects.get()
+    assert message.state == OutboxMessage.PENDING
+
+    call_command('send_outbox_messages')
+
+    assert len(mail.outbox) == 1
+    sent_mail = mail.outbox[0]
+    assert sent_mail.to == ['test@example.com']
+    assert sent_mail.subject == 'test subject'
+    assert sent_mail.alternatives == [('<b>test body</b>', 'text/html')]
+    assert [attachment[0] for attachment in sent_mail.attachments] == ['reservation.ics', 'notes.txt']
+    assert sent_mail.attachments[1][1] == 'some notes'
+
+    message.refresh_from_db()
+    assert message.state == OutboxMessage.SENT
+    assert message.attempts == 1
+
+    # sent messages are not sent again
+    call_command('send_outbox_messages')
+    assert len(mail.outbox) == 1
+
+
+@pytest.mark.django_db
+@override_settings(RESPA_MAILS_SEND_IMMEDIATELY=False, RESPA_MAILS_OUTBOX_MAX_ATTEMPTS=2)
+def test_outbox_message_retries():
+    message = OutboxMessage.objects.enqueue('test@example.com', 'test subject', 'test body')
+
+    with mock.patch('django.core.mail.EmailMultiAlternatives.send', side_effect=ConnectionError('boom')):
+        call_command('send_outbox_messages')
+        message.refresh_from_db()
+        assert message.state == OutboxMessage.PENDING
+        assert message.attempts == 1
+        assert message.last_error == 'boom'
+        assert message.send_after > timezone.now()
+
+        # not due yet
+        call_command('send_outbox_messages')
+        message.refresh_from_db()
+        assert message.attempts == 1
+
+        message.send_after = timezone.now() - datetime.timedelta(seconds=1)
+        message.save()
+        call_command('send_outbox_messages')
+        message.refresh_from_db()
+        assert message.state == OutboxMessage.FAILED
+        assert message.attempts == 2
+
+    assert len(mail.outbox) == 0
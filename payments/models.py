@@ -13,6 +13,7 @@
 from django.utils.translation import ugettext_lazy as _
 from rest_framework import serializers
 
+from resources.middleware import request_cache
 from resources.models import Reservation, Resource
 from resources.models.utils import generate_id
 
@@ -183,6 +184,17 @@ def can_view(self, user):
 
         return self.filter(reservation__in=allowed_reservations)
 
+    def prefetch_for_notifications(self):
+        """
+        Load everything the notifications of the reservations of the orders need
+
+        See ReservationQuerySet.prefetch_for_notifications().
+        """
+        return self.select_related(
+            'reservation__user', 'reservation__resource__unit', 'reservation__cancel_reason__category',
+            'reservation__custom_price'
+        ).prefetch_related('order_lines__product', 'log_entries')
+
     def update_expired(self) -> int:
         earliest_allowed_timestamp = now() - timedelta(minutes=settings.RESPA_PAYMENTS_PAYMENT_WAITING_TIME)
         log_entry_timestamps = OrderLogEntry.objects.filter(order=OuterRef('pk')).order_by('id').values('timestamp')
@@ -196,8 +208,10 @@ def update_expired(self) -> int:
         ).filter(
             created_at__lt=earliest_allowed_timestamp
         )
-        for order in too_old_waiting_orders:
-            order.set_state(Order.EXPIRED)
+        # expiring an order cancels its reservation, which sends a notification
+        with request_cache():
+            for order in too_old_waiting_orders.prefetch_for_notifications():
+                order.set_state(Order.EXPIRED)
 
         earliest_allowed_requested = now() - timedelta(hours=settings.RESPA_PAYMENTS_PAYMENT_REQUESTED_WAITING_TIME)
 
@@ -208,8 +222,9 @@ def update_expired(self) -> int:
             confirmed_by_staff_at__lt=earliest_allowed_requested
         )
 
-        for order in too_old_waiting_requested_orders:
-            order.set_state(Order.EXPIRED)
+        with request_cache():
+            for order in too_old_waiting_requested_orders.prefetch_for_notifications():
+                order.set_state(Order.EXPIRED)
 
         return too_old_waiting_orders.count() + too_old_waiting_requested_orders.count()
 
@@ -1,2 +1,10 @@
-from .daily_reservations import DailyReservationsReport  # noqa
-from .reservation_details import ReservationDetailsReport  # noqa
+from ..models import ReportJob
+from .daily_reservations import DailyReservationsReport, render_daily_reservations_job  # noqa
+from .jobs import ReportJobDownloadView, ReportJobView  # noqa
+from .reservation_details import ReservationDetailsReport, render_reservation_details_job  # noqa
+
+# The functions that render the reports of ReportJobs, taking the job params and user
+REPORT_JOB_RENDERERS = {
+    ReportJob.DAILY_RESERVATIONS: render_daily_reservations_job,
+    ReportJob.RESERVATION_DETAILS: render_reservation_details_job,
+}
@@ -1,9 +1,16 @@
 from django.conf import settings
+from django.http import HttpRequest, QueryDict
+from django.utils.translation import get_language
 from docx import Document
-from rest_framework import renderers, generics
+from rest_framework import renderers, generics, status
+from rest_framework.exceptions import MethodNotAllowed
+from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.settings import api_settings
 
+from ..models import ReportJob
+from .jobs import ReportJobSerializer
+
 
 class BaseReport(generics.GenericAPIView):
     """
@@ -14,13 +21,63 @@ class BaseReport(generics.GenericAPIView):
           data needed to build the report
         - Renderer(s) that generates the actual report based on the data from the serializer
         - optional: provide a filename for the report by overriding get_filename()
+        - optional: allow rendering the report in the background by setting job_report
+          and adding a renderer for the job to REPORT_JOB_RENDERERS
     """
     serializer_class = None
     renderer_classes = None
+    job_report = None
 
     def get_filename(self, request, validated_data):
         return None
 
+    def get_job_params(self):
+        """
+        Validate the query params and return what the job needs to render the report
+
+        The returned dict is stored in the job and passed to the renderer of
+        the job in REPORT_JOB_RENDERERS. By default it holds the query params,
+        with which the renderer re-runs the filters of the view through
+        for_job(). Override this to validate the params before the job is
+        created, or to pin values that would change before the job is run.
+        """
+        return {'query': self.request.query_params.urlencode()}
+
+    @classmethod
+    def for_job(cls, params, user):
+        """
+        Return an instance of the view for rendering a report job in the background
+
+        The request of the view is rebuilt from the query params stored by
+        get_job_params(), so the filters of the view work like they did when
+        the job was created.
+        """
+        http_request = HttpRequest()
+        http_request.method = 'GET'
+        http_request.GET = QueryDict(params.get('query', ''))
+        request = Request(http_request)
+        request.user = user
+        return cls(request=request, args=(), kwargs={}, format_kwarg=None)
+
+    def get_renderers(self):
+        # jobs are returned as JSON instead of the report itself
+        if self.request.method == 'POST':
+            return [renderer() for renderer in api_settings.DEFAULT_RENDERER_CLASSES]
+        return super().get_renderers()
+
+    def post(self, request, format=None):
+        """
+        Queue the report to be rendered by the process_report_jobs worker
+        """
+        if not self.job_report:
+            raise MethodNotAllowed(request.method)
+
+        job = ReportJob.objects.create(
+            report=self.job_report, params=self.get_job_params(), user=request.user, language=get_language()
+        )
+        serializer = ReportJobSerializer(job, context={'request': request})
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
     def get(self, request, format=None):
         queryset = self.filter_queryset(self.get_queryset())
         serializer = self.get_serializer(queryset, many=True)
@@ -34,7 +91,7 @@ def get(self, request, format=None):
     def finalize_response(self, request, response, *args, **kwargs):
         response = super().finalize_response(request, response, *args, **kwargs)
 
-        # use the first renderer from settings to display errors
+        # use the first renderer from settings to display errors and jobs
         if response.status_code != 200:
             first_renderer = api_settings.DEFAULT_RENDERER_CLASSES[0]()
             response.accepted_renderer = first_renderer
@@ -1,5 +1,7 @@
 import datetime
 import io
+from collections import defaultdict, namedtuple
+
 import pytz
 from docx.shared import Pt, Cm
 
@@ -8,17 +10,27 @@
 from django.utils.timezone import localtime
 from django.conf import settings
 from rest_framework import exceptions
+from rest_framework.response import Response
 
-from resources.models import Reservation, Resource, Unit
-from resources.api.resource import ResourceSerializer
+from resources.auth import PermissionResolver
+from resources.models import Reservation, ReservationMetadataSet, Resource, Unit
+from ..models import ReportJob
 from .base import BaseReport, DocxRenderer
-from .utils import iso_to_dt
 
 
 FALLBACK_LANGUAGE = settings.LANGUAGES[0][0]
 
+# The reservation fields shown in the report, when the user may see them
+REPORTED_FIELDS = ('event_subject', 'reserver_name', 'host_name', 'number_of_participants')
+
+DailyReportResource = namedtuple('DailyReportResource', ('name', 'reservations'))
+DailyReportReservation = namedtuple('DailyReportReservation', ('begin', 'end', 'attrs'))
+
 
 class DailyReservationsDocxRenderer(DocxRenderer):
+    """
+    Render the list of DailyReportResource tuples from load_daily_reservations()
+    """
     def render(self, data, media_type=None, renderer_context=None):
         renderer_context = renderer_context or {}
         day = renderer_context.get('day')
@@ -29,18 +41,8 @@ def render(self, data, media_type=None, renderer_context=None):
         first_resource = True
         atleast_one_reservation = False
 
-        current_language = get_language()
-
-        def get_translated_prop(obj, prop_name):
-            prop = obj.get(prop_name, {})
-            val = prop.get(current_language)
-            if not val:
-                return prop.get(FALLBACK_LANGUAGE)
-            return val
-
         for resource in data:
-            reservations = [rv for rv in resource['reservations'] if rv['state'] == Reservation.CONFIRMED]
-            reservation_count = len(reservations)
+            reservation_count = len(resource.reservations)
             if reservation_count == 0 and not include_resources_without_reservations:
                 continue
 
@@ -52,39 +54,30 @@ def get_translated_prop(obj, prop_name):
             else:
                 first_resource = False
 
-            document.add_heading(get_translated_prop(resource, 'name'), 1)
+            document.add_heading(resource.name, 1)
             document.add_heading(formats.date_format(day, format='D j.n.Y'), 2)
 
             if reservation_count == 0:
                 run = document.add_paragraph().add_run(_('No reservations.'))
                 run.font.size = Pt(20)
 
-            for reservation in reservations:
+            for reservation in resource.reservations:
                 # the time
-                begin = iso_to_dt(reservation['begin'])
-                end = iso_to_dt(reservation['end'])
-                range_str = formats.time_format(localtime(begin)) + '–' + formats.time_format(localtime(end))
+                range_str = (formats.time_format(localtime(reservation.begin)) + '–' +
+                             formats.time_format(localtime(reservation.end)))
                 time_paragraph = document.add_heading(range_str, 3)
                 time_paragraph.paragraph_format.space_before = Cm(1)
 
-                # collect attributes from the reservation, skip empty ones
-                attrs = [(field, reservation.get(field)) for field in (
-                    'event_subject',
-                    'reserver_name',
-                    'host_name',
-                    'number_of_participants',
-                ) if reservation.get(field)]
-
-                if not attrs:
+                if not reservation.attrs:
                     document.add_paragraph(_('No information available'))
                     continue
 
                 table = document.add_table(rows=0, cols=2)
                 # build the attribute table
-                for attr in attrs:
+                for field, value in reservation.attrs:
                     row_cells = table.add_row().cells
-                    row_cells[0].text = Reservation._meta.get_field(attr[0]).verbose_name + ':'
-                    row_cells[1].text = str(attr[1])
+                    row_cells[0].text = Reservation._meta.get_field(field).verbose_name + ':'
+                    row_cells[1].text = str(value)
 
         if not atleast_one_reservation:
             document.add_heading(_('No reservations'), 1)
@@ -96,71 +89,158 @@ def get_translated_prop(obj, prop_name):
 
 
 class DailyReservationsReport(BaseReport):
-    serializer_class = ResourceSerializer
     renderer_classes = (DailyReservationsDocxRenderer,)
+    job_report = ReportJob.DAILY_RESERVATIONS
 
     def get_queryset(self):
         return Resource.objects.all().order_by('unit__name', 'name')
 
-    def get_serializer_context(self):
-        context = super().get_serializer_context()
-        context['start'] = self.start
-        context['end'] = self.end
-        return context
+    def get(self, request, format=None):
+        resources = self.filter_queryset(self.get_queryset())
+        response = Response(load_daily_reservations(resources, self.start, self.end, request.user))
+        response['Content-Disposition'] = 'attachment; filename=%s' % get_daily_reservations_filename(self.day)
+        return response
 
     def filter_queryset(self, queryset):
-        params = self.request.query_params
-        unit = params.get('unit', '').strip()
-        if unit:
-            try:
-                unit = Unit.objects.get(id=unit)
-            except Unit.DoesNotExist:
-                raise exceptions.NotFound(
-                    _('Unit "{pk_value}" does not exist.').format(pk_value=unit)
-                )
-            queryset = queryset.filter(unit=unit)
-
-        resources = params.get('resource', '').strip()
-        if resources:
-            resource_ids = [x.strip() for x in resources.split(',')]
-            queryset = queryset.filter(id__in=resource_ids)
-
-        if not unit and not resources:
-            raise exceptions.ParseError(_('Either unit or a valid resource id is required.'))
-
-        if not queryset:
-            raise exceptions.NotFound(_('No resources found'))
-
-        if unit:
-            tz = unit.time_zone
-        else:
-            tz = queryset.first().unit.time_zone
-        tz = pytz.timezone(tz)
-
-        day = params.get('day', '').strip()
-        if day:
-            try:
-                day = datetime.datetime.strptime(day, "%Y-%m-%d").date()
-            except ValueError:
-                raise exceptions.ParseError('day must be of ISO format (YYYY-MM-DD)')
-        else:
-            day = datetime.date.today()
-        self.day = day
-        start = tz.localize(datetime.datetime.combine(day, datetime.time(0, 0)))
-        end = start + datetime.timedelta(days=1)
-        self.start = start
-        self.end = end
-
+        queryset, self.day, self.start, self.end = filter_daily_reservations_resources(
+            queryset, self.request.query_params
+        )
         return queryset
 
     def get_renderer_context(self):
         context = super().get_renderer_context()
         params = self.request.query_params
-        val = params.get('include_resources_without_reservations', '').lower() in ['true', '1', 't', 'y', 'yes']
-        context['include_resources_without_reservations'] = val
+        context['include_resources_without_reservations'] = include_resources_without_reservations(params)
         if hasattr(self, 'day'):
             context['day'] = self.day
         return context
 
     def get_filename(self, request, validated_data):
-        return '%s-%s.docx' % (_('day-report'), self.day.isoformat())
+        return get_daily_reservations_filename(self.day)
+
+    def get_job_params(self):
+        self.filter_queryset(self.get_queryset())
+        # the day defaults to the current one, which may have changed by the time the job is run
+        query = self.request.query_params.copy()
+        query['day'] = self.day.isoformat()
+        return {'query': query.urlencode()}
+
+
+def filter_daily_reservations_resources(queryset, params):
+    """
+    Filter the resources of the report by the query params
+
+    :return: the resources, the day of the report and its start and end
+    """
+    unit = params.get('unit', '').strip()
+    if unit:
+        try:
+            unit = Unit.objects.get(id=unit)
+        except Unit.DoesNotExist:
+            raise exceptions.NotFound(
+                _('Unit "{pk_value}" does not exist.').format(pk_value=unit)
+            )
+        queryset = queryset.filter(unit=unit)
+
+    resources = params.get('resource', '').strip()
+    if resources:
+        resource_ids = [x.strip() for x in resources.split(',')]
+        queryset = queryset.filter(id__in=resource_ids)
+
+    if not unit and not resources:
+        raise exceptions.ParseError(_('Either unit or a valid resource id is required.'))
+
+    if not queryset:
+        raise exceptions.NotFound(_('No resources found'))
+
+    if unit:
+        tz = unit.time_zone
+    else:
+        tz = queryset.first().unit.time_zone
+    tz = pytz.timezone(tz)
+
+    day = get_daily_reservations_day(params)
+    start = tz.localize(datetime.datetime.combine(day, datetime.time(0, 0)))
+    end = start + datetime.timedelta(days=1)
+
+    return queryset, day, start, end
+
+
+def get_daily_reservations_day(params):
+    day = params.get('day', '').strip()
+    if not day:
+        return datetime.date.today()
+    try:
+        return datetime.datetime.strptime(day, "%Y-%m-%d").date()
+    except ValueError:
+        raise exceptions.ParseError('day must be of ISO format (YYYY-MM-DD)')
+
+
+def include_resources_without_reservations(params):
+    return params.get('include_resources_without_reservations', '').lower() in ['true', '1', 't', 'y', 'yes']
+
+
+def get_daily_reservations_filename(day):
+    return '%s-%s.docx' % (_('day-report'), day.isoformat())
+
+
+def load_daily_reservations(resources, start, end, user):
+    """
+    Load the resources of the report and their confirmed reservations between start and end
+
+    The resources and the reservations are fetched with a query each, and the
+    permissions of the user with a constant number of queries. Only the
+    reservation fields the user may see are included.
+
+    :rtype: list[DailyReportResource]
+    """
+    resources = list(resources.select_related('unit').prefetch_related('groups').only(
+        'id', 'unit__id', 'reservation_metadata_set', *('name_%s' % lang for lang, _name in settings.LANGUAGES)
+    ))
+    resolver = PermissionResolver(user, resources)
+    metadata_sets = ReservationMetadataSet.objects.all().prefetch_related('supported_fields')
+    metadata_set_cache = {metadata_set.id: metadata_set for metadata_set in metadata_sets}
+
+    visible_fields = {}
+    for resource in resources:
+        resource._permission_resolver = resolver
+        supported_fields = resource.get_supported_reservation_extra_field_names(cache=metadata_set_cache)
+        visible_fields[resource.id] = (
+            resource.can_view_reservation_extra_fields(user),
+            [field for field in REPORTED_FIELDS if field in supported_fields],
+        )
+
+    user_id = user.pk if user.is_authenticated else None
+    reservations_by_resource = defaultdict(list)
+    reservations = Reservation.objects.filter(
+        resource__in=resources, begin__lte=end, end__gte=start, state=Reservation.CONFIRMED
+    ).order_by('begin', 'id').values_list('resource', 'user', 'begin', 'end', *REPORTED_FIELDS)
+    for resource_id, reservation_user_id, begin, end, *values in reservations:
+        can_view_extra_fields, fields = visible_fields[resource_id]
+        attrs = ()
+        if can_view_extra_fields or (user_id and reservation_user_id == user_id):
+            values = dict(zip(REPORTED_FIELDS, values))
+            # skip the empty ones
+            attrs = tuple((field, values[field]) for field in fields if values[field])
+        reservations_by_resource[resource_id].append(DailyReportReservation(begin, end, attrs))
+
+    return [
+        DailyReportResource(get_resource_name(resource), reservations_by_resource[resource.id])
+        for resource in resources
+    ]
+
+
+def get_resource_name(resource):
+    """
+    Return the name of the resource in the active language, falling back to the default language
+    """
+    language = (get_language() or FALLBACK_LANGUAGE)[:2]
+    return getattr(resource, 'name_%s' % language, None) or getattr(resource, 'name_%s' % FALLBACK_LANGUAGE)
+
+
+def render_daily_reservations_job(params, user):
+    view = DailyReservationsReport.for_job(params, user)
+    resources = view.filter_queryset(view.get_queryset())
+    data = load_daily_reservations(resources, view.start, view.end, user)
+    content = DailyReservationsDocxRenderer().render(data, renderer_context=view.get_renderer_context())
+    return get_daily_reservations_filename(view.day), content
@@ -0,0 +1,48 @@
+from django.http import FileResponse
+from django.utils.translation import ugettext_lazy as _
+from rest_framework import exceptions, generics, permissions, serializers
+from rest_framework.reverse import reverse
+
+from ..models import ReportJob
+
+
+class ReportJobSerializer(serializers.ModelSerializer):
+    url = serializers.SerializerMethodField()
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ReportJob
+        fields = ('id', 'url', 'report', 'state', 'error', 'created_at', 'finished_at', 'download_url')
+
+    def get_url(self, obj):
+        return reverse('report-job', kwargs={'pk': obj.pk}, request=self.context.get('request'))
+
+    def get_download_url(self, obj):
+        if obj.state != ReportJob.DONE:
+            return None
+        return reverse('report-job-download', kwargs={'pk': obj.pk}, request=self.context.get('request'))
+
+
+class ReportJobMixin:
+    serializer_class = ReportJobSerializer
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def get_queryset(self):
+        return ReportJob.objects.filter(user=self.request.user)
+
+
+class ReportJobView(ReportJobMixin, generics.RetrieveAPIView):
+    """
+    Poll the state of a report job
+    """
+
+
+class ReportJobDownloadView(ReportJobMixin, generics.GenericAPIView):
+    """
+    Download the report of a finished job
+    """
+    def get(self, request, pk, format=None):
+        job = self.get_object()
+        if job.state != ReportJob.DONE:
+            raise exceptions.NotFound(_('The report is not ready.'))
+        return FileResponse(job.file.open('rb'), as_attachment=True, filename=job.filename)
@@ -9,7 +9,10 @@
 from caterings.models import CateringOrder
 from resources.models import Reservation, Resource
 from resources.models.utils import format_dt_range
-from resources.api.reservation import ReservationSerializer, ReservationViewSet, ReservationCacheMixin
+from resources.api.reservation import (
+    ReservationSerializer, ReservationViewSet, ReservationCacheMixin, get_reservation_export_rows
+)
+from ..models import ReportJob
 from .base import BaseReport, DocxRenderer
 from .utils import iso_to_dt
 
@@ -96,13 +99,14 @@ class ReservationDetailsReport(BaseReport, ReservationCacheMixin):
     queryset = ReservationViewSet.queryset.current()
     serializer_class = ReservationSerializer
     renderer_classes = (ReservationDetailsDocxRenderer,)
+    job_report = ReportJob.RESERVATION_DETAILS
     filter_backends = ReservationViewSet.filter_backends
     filterset_class = ReservationViewSet.filterset_class
 
     def get_queryset(self):
         queryset = super().get_queryset()
         user = self.request.user
-        queryset = queryset.filter(resource__in=Resource.objects.visible_for(user))
+        queryset = queryset.resource_visible_for(user)
         return queryset
 
     def get_serializer(self, *args, **kwargs):
@@ -124,6 +128,14 @@ def get_serializer_context(self, *args, **kwargs):
         return context
 
     def filter_queryset(self, queryset):
+        queryset = self.filter_selection(queryset)
+
+        if queryset.count() > 1000:
+            raise exceptions.NotAcceptable(_("Too many (> 1000) reservations to return"))
+
+        return queryset
+
+    def filter_selection(self, queryset):
         params = self.request.query_params
         reservation_id = params.get('reservation')
         if reservation_id:
@@ -136,11 +148,40 @@ def filter_queryset(self, queryset):
             queryset = queryset.filter(id=reservation_id)
         else:
             queryset = super().filter_queryset(queryset)
-
-        if queryset.count() > 1000:
-            raise exceptions.NotAcceptable(_("Too many (> 1000) reservations to return"))
-
         return queryset
 
     def get_filename(self, request, data):
-        return '%s.docx' % (_('reservation-details'),)
+        return get_reservation_details_filename()
+
+    def get_job_params(self):
+        # The jobs are rendered in the background, so the number of reservations isn't limited
+        self.filter_selection(self.get_queryset())
+        return super().get_job_params()
+
+
+def get_reservation_details_filename():
+    return '%s.docx' % (_('reservation-details'),)
+
+
+def get_reservation_details_data(reservations, user):
+    """
+    Return the data ReservationDetailsDocxRenderer expects without the reservation serializer
+
+    Only the fields of the reservations the user may see are loaded.
+    """
+    with_catering_order = set(
+        reservations.catering_orders_visible(user).filter(catering_orders__isnull=False).values_list('id', flat=True)
+    )
+    data = []
+    for row in get_reservation_export_rows(reservations, user):
+        row.update(resource=row['resource_id'], begin=row['begin'].isoformat(), end=row['end'].isoformat())
+        row['has_catering_order'] = row['id'] in with_catering_order
+        data.append(row)
+    return data
+
+
+def render_reservation_details_job(params, user):
+    view = ReservationDetailsReport.for_job(params, user)
+    reservations = view.filter_selection(view.get_queryset())
+    data = get_reservation_details_data(reservations, user)
+    return get_reservation_details_filename(), ReservationDetailsDocxRenderer().render(data)
@@ -0,0 +1,57 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from reports.models import ReportJob
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Renders the pending report jobs and deletes the expired ones.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', dest='loop', default=False,
+                            help='Keep polling for jobs instead of exiting when there are none')
+        parser.add_argument('--interval', type=float, default=5, dest='interval',
+                            help='Seconds to wait between polls when looping')
+
+    def handle(self, *args, **options):
+        while True:
+            done = failed = 0
+            while True:
+                result = self.run_next_job()
+                if result is None:
+                    break
+                if result:
+                    done += 1
+                else:
+                    failed += 1
+            if done or failed:
+                logger.info('Rendered %d report job(s), %d failed.' % (done, failed))
+            self.delete_expired_jobs()
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def run_next_job(self):
+        # The job is locked with SKIP LOCKED so that several workers can render jobs concurrently.
+        # If the worker dies while rendering, the transaction is rolled back and the job stays pending.
+        job = None
+        try:
+            with transaction.atomic():
+                job = ReportJob.objects.pending().select_for_update(skip_locked=True).order_by('created_at').first()
+                if job is None:
+                    return None
+                return job.run()
+        except Exception:
+            # the file of a job that was rolled back would be left behind
+            if job is not None and job.file:
+                job.file.delete(save=False)
+            raise
+
+    def delete_expired_jobs(self):
+        for job in ReportJob.objects.expired():
+            job.delete()
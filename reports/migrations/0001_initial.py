@@ -0,0 +1,44 @@
+# Generated by Django 2.2.28 on 2026-10-17 12:10
+
+from django.conf import settings
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('report', models.CharField(choices=[('daily_reservations', 'Daily reservations'), ('reservation_details', 'Reservation details')], max_length=32, verbose_name='Report')),
+                ('params', django.contrib.postgres.fields.jsonb.JSONField(blank=True, default=dict, verbose_name='Parameters')),
+                ('language', models.CharField(default='fi', max_length=10, verbose_name='Language')),
+                ('state', models.CharField(choices=[('pending', 'pending'), ('done', 'done'), ('failed', 'failed')], default='pending', max_length=16, verbose_name='State')),
+                ('file', models.FileField(blank=True, upload_to='reports/%Y/%m/', verbose_name='File')),
+                ('filename', models.CharField(blank=True, max_length=200, verbose_name='File name')),
+                ('error', models.TextField(blank=True, verbose_name='Error')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created at')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Finished at')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='report_jobs', to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'verbose_name': 'Report job',
+                'verbose_name_plural': 'Report jobs',
+                'ordering': ('created_at',),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='reportjob',
+            index=models.Index(fields=['state', 'created_at'], name='reports_rep_state_d6a214_idx'),
+        ),
+    ]
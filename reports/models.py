@@ -0,0 +1,106 @@
+import datetime
+import logging
+import uuid
+
+from django.conf import settings
+from django.contrib.postgres.fields import JSONField
+from django.core.files.base import ContentFile
+from django.db import models
+from django.utils import timezone, translation
+from django.utils.translation import ugettext_lazy as _
+
+logger = logging.getLogger(__name__)
+
+
+class ReportJobQuerySet(models.QuerySet):
+    def pending(self):
+        return self.filter(state=ReportJob.PENDING)
+
+    def expired(self):
+        retention = datetime.timedelta(days=settings.RESPA_REPORT_JOB_RETENTION_DAYS)
+        return self.filter(created_at__lt=timezone.now() - retention)
+
+
+class ReportJob(models.Model):
+    """
+    A report rendered in the background by the process_report_jobs worker
+
+    The parameters are validated when the job is created, and the worker
+    re-runs the selection of the report with them, so rendering needs nothing
+    from the request.
+    """
+    PENDING = 'pending'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATE_CHOICES = (
+        (PENDING, _('pending')),
+        (DONE, _('done')),
+        (FAILED, _('failed')),
+    )
+
+    DAILY_RESERVATIONS = 'daily_reservations'
+    RESERVATION_DETAILS = 'reservation_details'
+    REPORT_CHOICES = (
+        (DAILY_RESERVATIONS, _('Daily reservations')),
+        (RESERVATION_DETAILS, _('Reservation details')),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    report = models.CharField(verbose_name=_('Report'), max_length=32, choices=REPORT_CHOICES)
+    params = JSONField(verbose_name=_('Parameters'), default=dict, blank=True)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, verbose_name=_('User'), related_name='report_jobs', on_delete=models.CASCADE
+    )
+    language = models.CharField(verbose_name=_('Language'), max_length=10, default=settings.LANGUAGES[0][0])
+
+    state = models.CharField(verbose_name=_('State'), max_length=16, choices=STATE_CHOICES, default=PENDING)
+    file = models.FileField(verbose_name=_('File'), upload_to='reports/%Y/%m/', blank=True)
+    filename = models.CharField(verbose_name=_('File name'), max_length=200, blank=True)
+    error = models.TextField(verbose_name=_('Error'), blank=True)
+    created_at = models.DateTimeField(verbose_name=_('Created at'), auto_now_add=True)
+    finished_at = models.DateTimeField(verbose_name=_('Finished at'), null=True, blank=True)
+
+    objects = ReportJobQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = _('Report job')
+        verbose_name_plural = _('Report jobs')
+        ordering = ('created_at',)
+        indexes = [models.Index(fields=['state', 'created_at'])]
+
+    def __str__(self):
+        return '%s %s (%s)' % (self.report, self.id, self.state)
+
+    def run(self):
+        """
+        Render the report and store the result
+
+        Returns True on success. A failure is recorded on the job, which is
+        not retried.
+        """
+        # Imported here as the report views import the models of the other apps
+        from .api import REPORT_JOB_RENDERERS
+
+        render = REPORT_JOB_RENDERERS[self.report]
+        try:
+            with translation.override(self.language):
+                filename, content = render(self.params, self.user)
+        except Exception as e:
+            logger.exception('Rendering report job %s failed' % self.id)
+            self.state = self.FAILED
+            self.error = str(e)
+            self.finished_at = timezone.now()
+            self.save(update_fields=('state', 'error', 'finished_at'))
+            return False
+
+        self.filename = filename
+        self.file.save(filename, ContentFile(content), save=False)
+        self.state = self.DONE
+        self.finished_at = timezone.now()
+        self.save(update_fields=('filename', 'file', 'state', 'finished_at'))
+        return True
+
+    def delete(self, *args, **kwargs):
+        if self.file:
+            self.file.delete(save=False)
+        return super().delete(*args, **kwargs)
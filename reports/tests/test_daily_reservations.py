@@ -1,7 +1,14 @@
+import io
+
 import pytest
+from docx import Document
 from freezegun import freeze_time
-from django.utils import dateparse
-from resources.models import Reservation
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import dateparse, translation
+from reports.api.daily_reservations import get_resource_name
+from resources.enums import UnitAuthorizationLevel
+from resources.models import Reservation, Resource, UnitAuthorization
 from resources.tests.conftest import *
 
 
@@ -74,6 +81,29 @@ def test_daily_reservations_by_resources(api_client, test_unit, reservation, res
     assert len(response.content) > first_content_length
 
 
+@pytest.mark.django_db
+def test_daily_reservations_resource_name_language(api_client, test_unit, reservation, resource_in_unit,
+                                                   resource_in_unit2):
+    resource_in_unit.name_sv = 'resurs i enhet'
+    resource_in_unit.save(update_fields=('name_sv',))
+    resource_in_unit2.unit = test_unit
+    resource_in_unit2.save(update_fields=('unit',))
+    Reservation.objects.create(
+        resource=resource_in_unit2, begin='2015-04-04T15:00:00+02:00', end='2015-04-04T16:00:00+02:00',
+        state=Reservation.CONFIRMED
+    )
+
+    response = api_client.get(list_url + '?unit=%s&day=2015-04-04' % test_unit.id, HTTP_ACCEPT_LANGUAGE='sv')
+    assert response.status_code == 200
+    headings = {paragraph.text for paragraph in Document(io.BytesIO(response.content)).paragraphs}
+    # the resource without a Swedish name falls back to the default language
+    assert {'resurs i enhet', resource_in_unit2.name_fi} <= headings
+    assert resource_in_unit.name_fi not in headings
+
+    with translation.override(None):
+        assert get_resource_name(resource_in_unit) == resource_in_unit.name_fi
+
+
 @pytest.mark.django_db
 def test_daily_reservations_filter_errors(api_client, test_unit, reservation, resource_in_unit):
     response = api_client.get(list_url + '', HTTP_ACCEPT_LANGUAGE='en')
@@ -87,3 +117,34 @@ def test_daily_reservations_filter_errors(api_client, test_unit, reservation, re
     response = api_client.get(list_url + '?unit=bogus-unit')
     assert response.status_code == 404
     assert 'unit' in response.data['detail']
+
+
+@pytest.mark.django_db
+def test_daily_reservations_query_count(staff_api_client, staff_user, test_unit, space_resource_type):
+    UnitAuthorization.objects.create(subject=test_unit, level=UnitAuthorizationLevel.manager, authorized=staff_user)
+    url = list_url + '?unit=%s&day=2015-04-04' % test_unit.id
+
+    def add_resources(count):
+        for i in range(count):
+            resource = Resource.objects.create(type=space_resource_type, unit=test_unit, name='resource %d' % i)
+            Reservation.objects.create(
+                resource=resource,
+                begin='2015-04-04T09:00:00+02:00',
+                end='2015-04-04T10:00:00+02:00',
+                reserver_name='John Smith',
+                state=Reservation.CONFIRMED
+            )
+
+    def count_queries():
+        with CaptureQueriesContext(connection) as context:
+            response = staff_api_client.get(url)
+        assert response.status_code == 200
+        check_valid_response(response)
+        return len(context.captured_queries)
+
+    add_resources(2)
+    # warm up the caches, e.g. the content types
+    count_queries()
+    query_count = count_queries()
+    add_resources(20)
+    assert count_queries() == query_count
@@ -0,0 +1,106 @@
+import datetime
+import io
+import os
+import zipfile
+
+import pytest
+from django.core.management import call_command
+from django.db import DatabaseError
+
+from reports.models import ReportJob
+from resources.models import Reservation, ReservationMetadataSet
+from resources.tests.conftest import *
+
+
+@pytest.fixture(autouse=True)
+def media_root(settings, tmpdir):
+    settings.MEDIA_ROOT = str(tmpdir)
+
+
+@pytest.fixture
+def reservation(resource_in_unit, user):
+    resource_in_unit.reservation_metadata_set = ReservationMetadataSet.objects.get(name='default')
+    resource_in_unit.save()
+    return Reservation.objects.create(
+        resource=resource_in_unit,
+        begin='2015-04-04T09:00:00+02:00',
+        end='2015-04-04T10:00:00+02:00',
+        user=user,
+        reserver_name='John Smith',
+        event_subject="John's welcome party",
+        state=Reservation.CONFIRMED
+    )
+
+
+def get_document_text(response):
+    content = b''.join(response.streaming_content)
+    with zipfile.ZipFile(io.BytesIO(content)) as docx:
+        return docx.read('word/document.xml').decode()
+
+
+@pytest.mark.parametrize('url, params', [
+    ('/reports/daily_reservations/', lambda reservation: '?unit=%s&day=2015-04-04' % reservation.resource.unit_id),
+    ('/reports/reservation_details/', lambda reservation: '?reservation=%s' % reservation.id),
+])
+@pytest.mark.django_db
+def test_report_job(api_client, user_api_client, staff_api_client, reservation, url, params):
+    response = api_client.post(url + params(reservation))
+    assert response.status_code == 401
+
+    response = user_api_client.post(url + params(reservation))
+    assert response.status_code == 202
+    assert response.data['state'] == ReportJob.PENDING
+    assert response.data['download_url'] is None
+    job_url = response.data['url']
+
+    response = user_api_client.get(job_url + 'download/')
+    assert response.status_code == 404
+
+    call_command('process_report_jobs')
+
+    response = user_api_client.get(job_url)
+    assert response.status_code == 200
+    assert response.data['state'] == ReportJob.DONE
+
+    response = user_api_client.get(response.data['download_url'])
+    assert response.status_code == 200
+    assert response['Content-Disposition'].startswith('attachment; filename=')
+    assert 'John Smith' in get_document_text(response)
+
+    # only the user who requested the report can see the job
+    response = staff_api_client.get(job_url)
+    assert response.status_code == 404
+
+
+@pytest.mark.django_db
+def test_report_job_validates_params(user_api_client):
+    response = user_api_client.post('/reports/daily_reservations/', HTTP_ACCEPT_LANGUAGE='en')
+    assert response.status_code == 400
+    assert not ReportJob.objects.exists()
+
+
+@pytest.mark.django_db
+def test_report_job_stores_query(user_api_client, reservation):
+    unit_id = reservation.resource.unit_id
+    response = user_api_client.post('/reports/daily_reservations/?unit=%s' % unit_id)
+    assert response.status_code == 202
+    # the selection is made by the worker, with the day the job was requested on
+    job = ReportJob.objects.get()
+    assert job.params == {'query': 'unit=%s&day=%s' % (unit_id, datetime.date.today().isoformat())}
+
+
+@pytest.mark.django_db
+def test_report_job_file_is_deleted_on_rollback(settings, user_api_client, reservation, monkeypatch):
+    response = user_api_client.post('/reports/reservation_details/?reservation=%s' % reservation.id)
+    assert response.status_code == 202
+
+    def save(self, *args, **kwargs):
+        raise DatabaseError('connection lost')
+
+    with monkeypatch.context() as m:
+        m.setattr(ReportJob, 'save', save)
+        with pytest.raises(DatabaseError):
+            call_command('process_report_jobs')
+
+    assert ReportJob.objects.get().state == ReportJob.PENDING
+    assert not [name for root, dirs, files in os.walk(settings.MEDIA_ROOT) for name in files]
@@ -27,7 +27,7 @@
     Reservation, ReservationMetadataField, ReservationMetadataSet, Resource, ResourceAccessibility,
     ResourceEquipment, ResourceGroup, ResourceImage, ResourceType, TermsOfUse,
     Unit, UnitAuthorization, UnitIdentifier, UnitGroup, UnitGroupAuthorization,
-    ReservationCancelReason, ReservationCancelReasonCategory)
+    ReservationCancelReason, ReservationCancelReasonCategory, ReservationEventJob)
 from munigeo.models import Municipality
 from rest_framework.authtoken.admin import Token
 
@@ -390,6 +390,13 @@ class RespaTokenAdmin(admin.ModelAdmin):
     raw_id_fields = ('user',)
 
 
+class ReservationEventJobAdmin(admin.ModelAdmin):
+    list_display = ('handler', 'event', 'reservation_id', 'state', 'attempts', 'created_at', 'finished_at')
+    list_filter = ('state', 'handler', 'event')
+    readonly_fields = ('attempts', 'last_error', 'created_at', 'finished_at')
+    raw_id_fields = ('user',)
+
+
 admin_site.register(ResourceImage, ResourceImageAdmin)
 admin_site.register(Resource, ResourceAdmin)
 admin_site.register(Reservation, ReservationAdmin)
@@ -417,3 +424,4 @@ class RespaTokenAdmin(admin.ModelAdmin):
 
 admin_site.register(ReservationCancelReason, ReservationCancelReasonAdmin)
 admin_site.register(ReservationCancelReasonCategory, ReservationCancelReasonCategoryAdmin)
+admin_site.register(ReservationEventJob, ReservationEventJobAdmin)
@@ -1,3 +1,8 @@
+import abc
+import csv
+import datetime
+import io
+import json
 import operator
 import uuid
 from functools import reduce
@@ -6,31 +11,37 @@
 import django_filters
 from arrow.parser import ParserError
 from django.conf import settings
-from guardian.core import ObjectPermissionChecker
 from django.contrib.auth import get_user_model
 from django.utils.translation import ugettext_lazy as _
 from django.core.exceptions import (
     PermissionDenied, ValidationError as DjangoValidationError
 )
 from django.db.models import Q
+from django.http import FileResponse, StreamingHttpResponse
 from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import viewsets, serializers, filters, exceptions, permissions
+from rest_framework import viewsets, serializers, filters, exceptions, permissions, status
 from rest_framework.authentication import TokenAuthentication, SessionAuthentication
 from rest_framework.fields import BooleanField, IntegerField
 from rest_framework import renderers
+from rest_framework.decorators import action
 from rest_framework.exceptions import NotAcceptable, ValidationError
+from rest_framework.response import Response
 from rest_framework.settings import api_settings as drf_settings
+from rest_framework.utils.encoders import JSONEncoder
 
 from munigeo import api as munigeo_api
 
 from resources.models import (
     Reservation, Resource, ReservationMetadataSet, ReservationCancelReasonCategory, ReservationCancelReason)
-from resources.models.reservation import RESERVATION_EXTRA_FIELDS
+from resources.models.reservation import (
+    RESERVATION_EXTRA_FIELDS, create_reservation_series, get_reservation_series_errors, reservation_collision_check
+)
+from resources.models.resource import validate_access_code
 from resources.pagination import ReservationPagination
-from resources.models.utils import generate_reservation_xlsx, get_object_or_none
+from resources.models.utils import generate_reservation_xlsx, generate_reservation_xlsx_file, get_object_or_none
 
-from ..auth import is_general_admin
+from ..auth import is_general_admin, PermissionResolver
 from .base import (
     NullableDateTimeField, TranslatedModelSerializer, register_view, DRFFilterBooleanWidget,
     ExtraDataMixin
@@ -239,10 +250,11 @@ def validate(self, data):
             if access_code_enabled and reservation and data['access_code'] != reservation.access_code:
                 raise ValidationError(dict(access_code=_('This field cannot be changed')))
 
-        # Mark begin of a critical section. Subsequent calls with this same resource will block here until the first
-        # request is finished. This is needed so that the validations and possible reservation saving are
-        # executed in one block and concurrent requests cannot be validated incorrectly.
-        Resource.objects.select_for_update().get(pk=resource.pk)
+        # Mark begin of a critical section. Subsequent calls by the same user will block here until the first
+        # request is finished, so that the per user limits below cannot be exceeded by concurrent requests.
+        # Overlapping reservations of the resource are rejected by the database when saving, so requests of
+        # different users do not need to wait for each other.
+        User.objects.select_for_update().get(pk=request_user.pk)
 
         # Check maximum number of active reservations per user per resource.
         # Only new reservations are taken into account ie. a normal user can modify an existing reservation
@@ -255,11 +267,8 @@ def validate(self, data):
                 if key not in self.patchable_fields:
                     raise ValidationError(_('Patching of field %(field)s is not allowed' % {'field': key}))
         else:
-             # Run model clean
-            instance = Reservation(**data)
-
             try:
-                instance.clean(original_reservation=reservation, user=request_user)
+                self.clean_reservation(data, reservation, request_user)
             except DjangoValidationError as exc:
 
                 # Convert Django ValidationError to DRF ValidationError so that in the response
@@ -272,6 +281,18 @@ def validate(self, data):
                 raise ValidationError(error_dict)
         return data
 
+    def clean_reservation(self, data, reservation, user):
+        if self.context.get('reservation_series'):
+            # The reservations of a series are checked together with get_reservation_series_errors(),
+            # only the access code they share is checked here
+            if data.get('access_code'):
+                validate_access_code(data['access_code'], data['resource'].access_code_type)
+            return
+
+        # Run model clean
+        instance = Reservation(**data)
+        instance.clean(original_reservation=reservation, user=user)
+
     def to_internal_value(self, data):
         user_data = data.copy().pop('user', None)  # handle user manually
         deserialized_data = super().to_internal_value(data)
@@ -336,6 +357,13 @@ def to_representation(self, instance):
 
         return data
 
+    def save(self, **kwargs):
+        try:
+            with reservation_collision_check():
+                return super().save(**kwargs)
+        except DjangoValidationError as exc:
+            raise ValidationError({drf_settings.NON_FIELD_ERRORS_KEY: exc.messages})
+
     def update(self, instance, validated_data):
         request = self.context['request']
 
@@ -583,26 +611,214 @@ def render(self, data, media_type=None, renderer_context=None):
             return NotAcceptable()
 
 
-class ReservationCacheMixin:
-    def _preload_permissions(self):
-        units = set()
-        resource_groups = set()
-        resources = set()
-        checker = ObjectPermissionChecker(self.request.user)
+# Reservations read from the database at a time when exporting
+EXPORT_CHUNK_SIZE = 2000
 
-        for rv in self._page:
-            resources.add(rv.resource)
-            rv.resource._permission_checker = checker
+# Columns of the exported reservations, the extra fields follow them
+EXPORT_COLUMNS = (
+    'id', 'state', 'unit_id', 'unit', 'resource_id', 'resource', 'begin', 'end', 'created_at', 'staff_event',
+    'user', 'comments'
+)
+
+
+def iterate_reservation_values(queryset, fields, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield values() dicts of the reservations ordered by (begin, id)
+
+    The reservations are fetched chunk_size at a time with keyset pagination,
+    so each chunk is an index range scan regardless of how deep into the
+    queryset it is.
+    """
+    queryset = queryset.prefetch_related(None).order_by('begin', 'id').values('id', 'begin', *fields)
+    last = None
+    while True:
+        chunk = queryset
+        if last is not None:
+            chunk = chunk.filter(Q(begin__gt=last['begin']) | Q(begin=last['begin'], id__gt=last['id']))
+        chunk = list(chunk[:chunk_size])
+        yield from chunk
+        if len(chunk) < chunk_size:
+            return
+        last = chunk[-1]
+
+
+def get_reservation_export_rows(queryset, user):
+    """
+    Yield the reservations of the queryset as export rows
+
+    The rows are dicts with the keys of EXPORT_COLUMNS and the supported
+    extra fields, as understood by generate_reservation_xlsx_file() and the
+    streaming renderers. Only the exported columns are fetched, in chunks.
+    The fields the user may see are resolved once per resource, following
+    the rules of ReservationSerializer, and the hidden ones are left out.
+    """
+    resources = Resource.objects.filter(id__in=queryset.order_by().values('resource'))\
+        .select_related('unit').prefetch_related('groups')
+    resources = {resource.id: resource for resource in resources}
+    resolver = PermissionResolver(user, resources.values())
+    metadata_sets = ReservationMetadataSet.objects.all().prefetch_related('supported_fields')
+    metadata_set_cache = {metadata_set.id: metadata_set for metadata_set in metadata_sets}
+
+    visible_fields = {}
+    for resource in resources.values():
+        resource._permission_resolver = resolver
+        visible_fields[resource.id] = (
+            resource.can_view_reservation_user(user),
+            resource.can_access_reservation_comments(user),
+            resource.can_view_reservation_extra_fields(user),
+            resource.get_supported_reservation_extra_field_names(cache=metadata_set_cache),
+        )
+
+    user_id = user.pk if user.is_authenticated else None
+    fields = ('state', 'resource', 'user', 'user__email', 'end', 'created_at', 'staff_event', 'comments')
+    for reservation in iterate_reservation_values(queryset, fields + tuple(RESERVATION_EXTRA_FIELDS)):
+        resource = resources[reservation['resource']]
+        can_view_user, can_access_comments, can_view_extra_fields, extra_fields = visible_fields[resource.id]
+        row = {
+            'id': reservation['id'],
+            'state': reservation['state'],
+            'unit_id': resource.unit_id,
+            'unit': resource.unit.name,
+            'resource_id': resource.id,
+            'resource': resource.name,
+            'begin': reservation['begin'],
+            'end': reservation['end'],
+            'created_at': reservation['created_at'],
+            'staff_event': reservation['staff_event'],
+        }
+        if can_view_user:
+            row['user'] = reservation['user__email'] or ''
+        if can_access_comments:
+            row['comments'] = reservation['comments']
+        if can_view_extra_fields or (user_id and reservation['user'] == user_id):
+            for field in extra_fields:
+                row[field] = reservation[field]
+        yield row
+
+
+def _format_export_value(value):
+    if isinstance(value, datetime.datetime):
+        return timezone.localtime(value).isoformat()
+    return value
+
+
+class ReservationStreamingRenderer(renderers.BaseRenderer, metaclass=abc.ABCMeta):
+    """
+    Base class for the renderers of the reservation exports
+
+    Reservation lists are streamed by ReservationViewSet.list() with
+    render_rows(), so render() only handles single reservations and errors.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, media_type=None, renderer_context=None):
+        if data is None:
+            return bytes()
+        if not isinstance(data, dict):
+            data = {'detail': data}
+        return ''.join(self.render_rows([data], list(data))).encode(self.charset)
+
+    @abc.abstractmethod
+    def render_rows(self, rows, columns):
+        """
+        Yield the given row dicts as chunks of text
+
+        :type rows: iterable[dict]
+        :type columns: list[str]
+        :rtype: iterable[str]
+        """
+
+
+class ReservationCSVRenderer(ReservationStreamingRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    # Approximate number of characters written before a chunk is yielded
+    chunk_size = 64 * 1024
+
+    def render_rows(self, rows, columns):
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=columns, restval='', extrasaction='ignore')
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({key: _format_export_value(value) for key, value in row.items()})
+            if buffer.tell() >= self.chunk_size:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+
+class ReservationNDJSONRenderer(ReservationStreamingRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
 
-        for res in resources:
-            units.add(res.unit)
-            for g in res.groups.all():
-                resource_groups.add(g)
+    def render_rows(self, rows, columns):
+        for row in rows:
+            yield json.dumps(
+                {key: _format_export_value(value) for key, value in row.items()}, cls=JSONEncoder
+            ) + '\n'
 
-        if units:
-            checker.prefetch_perms(units)
-        if resource_groups:
-            checker.prefetch_perms(resource_groups)
+
+class ReservationRecurrenceSerializer(serializers.Serializer):
+    DAILY = 'daily'
+    WEEKLY = 'weekly'
+
+    frequency = serializers.ChoiceField(choices=(DAILY, WEEKLY))
+    interval = serializers.IntegerField(min_value=1, default=1)
+    count = serializers.IntegerField(min_value=1, required=False)
+    until = serializers.DateField(required=False)
+
+    def validate(self, data):
+        if ('count' in data) == ('until' in data):
+            raise ValidationError(_('Either count or until must be given'))
+        return data
+
+
+class ReservationSeriesSerializer(serializers.Serializer):
+    recurrence = ReservationRecurrenceSerializer()
+    skip_conflicts = serializers.BooleanField(default=False)
+
+
+def get_recurrence_times(recurrence, begin, end, tz):
+    """
+    Return the begin and end times of the reservations of a series
+
+    The times are repeated on the wall clock of the given time zone, so that
+    the reservations keep their local times over daylight saving time changes.
+
+    :type recurrence: dict
+    :type begin: datetime.datetime
+    :type end: datetime.datetime
+    :type tz: datetime.tzinfo
+    :rtype: list[tuple[datetime.datetime, datetime.datetime]]
+    """
+    days = 7 if recurrence['frequency'] == ReservationRecurrenceSerializer.WEEKLY else 1
+    step = datetime.timedelta(days=days * recurrence['interval'])
+    if end - begin > step:
+        raise ValidationError(_('The reservations of the series would overlap each other'))
+
+    local_begin = begin.astimezone(tz).replace(tzinfo=None)
+    local_end = end.astimezone(tz).replace(tzinfo=None)
+    times = []
+    while 'count' not in recurrence or len(times) < recurrence['count']:
+        occurrence_begin = local_begin + step * len(times)
+        if 'until' in recurrence and occurrence_begin.date() > recurrence['until']:
+            break
+        if len(times) >= settings.RESPA_MAX_RESERVATION_SERIES_LENGTH:
+            raise ValidationError(_('A series can have at most %(count)d reservations') % {
+                'count': settings.RESPA_MAX_RESERVATION_SERIES_LENGTH
+            })
+        times.append((tz.localize(occurrence_begin), tz.localize(local_end + step * len(times))))
+    return times
+
+
+class ReservationCacheMixin:
+    def _preload_permissions(self):
+        resources = {rv.resource for rv in self._page}
+        resolver = PermissionResolver(self.request.user, resources)
+        for rv in self._page:
+            rv.resource._permission_resolver = resolver
 
     def _get_cache_context(self):
         context = {}
@@ -622,7 +838,8 @@ class ReservationViewSet(munigeo_api.GeoModelAPIView, viewsets.ModelViewSet, Res
                        NeedManualConfirmationFilterBackend, StateFilterBackend, CanApproveFilterBackend)
     filterset_class = ReservationFilterSet
     permission_classes = (permissions.IsAuthenticatedOrReadOnly, ReservationPermission)
-    renderer_classes = (renderers.JSONRenderer, ResourcesBrowsableAPIRenderer, ReservationExcelRenderer)
+    renderer_classes = (renderers.JSONRenderer, ResourcesBrowsableAPIRenderer, ReservationExcelRenderer,
+                        ReservationCSVRenderer, ReservationNDJSONRenderer)
     pagination_class = ReservationPagination
     authentication_classes = (
         list(drf_settings.DEFAULT_AUTHENTICATION_CLASSES) +
@@ -677,7 +894,7 @@ def get_queryset(self):
             filters |= Q(user=user)
         queryset = queryset.filter(filters)
 
-        queryset = queryset.filter(resource__in=Resource.objects.visible_for(user))
+        queryset = queryset.resource_visible_for(user)
 
         return queryset
 
@@ -704,6 +921,10 @@ def perform_destroy(self, instance):
         instance.set_state(Reservation.CANCELLED, self.request.user)
 
     def list(self, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+        if isinstance(renderer, ReservationStreamingRenderer):
+            return self._stream_list(request, renderer)
+
         response = super().list(request, *args, **kwargs)
         if request.accepted_renderer.format == 'xlsx':
             response['Content-Disposition'] = 'attachment; filename={}.xlsx'.format(_('reservations'))
@@ -715,6 +936,103 @@ def retrieve(self, request, *args, **kwargs):
             response['Content-Disposition'] = 'attachment; filename={}-{}.xlsx'.format(_('reservation'), kwargs['pk'])
         return response
 
+    def _stream_list(self, request, renderer):
+        """
+        Stream all the filtered reservations without pagination or serializers
+
+        The reservations are read in chunks with keyset pagination on
+        (begin, id), see get_reservation_export_rows().
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        columns = list(EXPORT_COLUMNS) + list(RESERVATION_EXTRA_FIELDS)
+        rows = get_reservation_export_rows(queryset, request.user)
+        response = StreamingHttpResponse(
+            renderer.render_rows(rows, columns),
+            content_type='{}; charset={}'.format(renderer.media_type, renderer.charset)
+        )
+        response['Content-Disposition'] = 'attachment; filename={}.{}'.format(_('reservations'), renderer.format)
+        return response
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Create a recurring series of reservations
+
+        The request has the fields of the first reservation of the series and
+        a `recurrence` rule, e.g. `{"frequency": "weekly", "until": "2020-12-15"}`.
+        The reservations are validated together and no reservation is made if
+        any of them can't be, unless `skip_conflicts` is set. The reservations
+        that can't be made are listed with their errors.
+        """
+        series_serializer = ReservationSeriesSerializer(data=request.data)
+        series_serializer.is_valid(raise_exception=True)
+        context = self.get_serializer_context()
+        context['reservation_series'] = True
+        serializer = self.get_serializer_class()(data=request.data, context=context)
+        serializer.is_valid(raise_exception=True)
+
+        data = dict(serializer.validated_data)
+        resource = data['resource']
+        if not resource.is_admin(request.user):
+            raise PermissionDenied(_('Only staff members can make reservation series'))
+        # orders are only made by the payments serializer, one per reservation
+        data.pop('order', None)
+        data.pop('custom_price', None)
+        if settings.RESPA_PAYMENTS_ENABLED and resource.has_rent():
+            raise ValidationError(_('Reservation series cannot be made for resources that require payment'))
+
+        data.update(created_by=request.user, modified_by=request.user)
+        if 'user' not in data:
+            data['user'] = request.user
+        if resource.need_manual_confirmation and not resource.can_bypass_manual_confirmation(request.user):
+            data['state'] = Reservation.REQUESTED
+        else:
+            data['state'] = Reservation.CONFIRMED
+
+        times = get_recurrence_times(
+            series_serializer.validated_data['recurrence'], data['begin'], data['end'], resource.unit.get_tz()
+        )
+        series = [Reservation(**dict(data, begin=begin, end=end)) for begin, end in times]
+        errors = get_reservation_series_errors(series, request.user)
+        datetime_field = serializers.DateTimeField()
+        skipped = [
+            {
+                'begin': datetime_field.to_representation(reservation.begin),
+                'end': datetime_field.to_representation(reservation.end),
+                'errors': reservation_errors,
+            }
+            for reservation, reservation_errors in zip(series, errors) if reservation_errors
+        ]
+        series = [reservation for reservation, reservation_errors in zip(series, errors) if not reservation_errors]
+        if not series or (skipped and not series_serializer.validated_data['skip_conflicts']):
+            raise ValidationError({'occurrences': skipped})
+
+        try:
+            create_reservation_series(series, request.user)
+        except DjangoValidationError as exc:
+            raise ValidationError({drf_settings.NON_FIELD_ERRORS_KEY: exc.messages})
+
+        return Response({
+            'reservations': self.get_serializer(series, many=True).data,
+            'skipped': skipped,
+        }, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Return all the filtered reservations as an xlsx file
+
+        Unlike the xlsx format of the list, the export isn't paginated. The
+        rows are written to a temporary file while the reservations are read,
+        so the memory use stays the same regardless of their number.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        output = generate_reservation_xlsx_file(get_reservation_export_rows(queryset, request.user))
+        return FileResponse(
+            output, as_attachment=True, filename='{}.xlsx'.format(_('reservations')),
+            content_type=ReservationExcelRenderer.media_type
+        )
+
 
 class ReservationCancelReasonCategoryViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = ReservationCancelReasonCategory.objects.all()
@@ -4,34 +4,32 @@
 
 import arrow
 import django_filters
-import pytz
 from arrow.parser import ParserError
 
 from django import forms
 from django.conf import settings
-from django.db.models import OuterRef, Prefetch, Q, Subquery, Value, Sum
+from django.db.models import OuterRef, Q, Subquery, Value, Sum
 from django.db.models.functions import Coalesce, Least
 from django.urls import reverse
 from django.contrib.gis.db.models.functions import Distance
 from django.contrib.gis.geos import Point
 from django.contrib.auth import get_user_model
 
-from resources.pagination import PurposePagination
+from resources.pagination import PurposePagination, ResourcePagination
 from rest_framework import exceptions, filters, mixins, serializers, viewsets, response, status
 from rest_framework.authentication import SessionAuthentication, TokenAuthentication
 from rest_framework.decorators import action
-from guardian.core import ObjectPermissionChecker
 
 from munigeo import api as munigeo_api
 from resources.models import (
     AccessibilityValue, AccessibilityViewpoint, Purpose, Reservation, Resource, ResourceAccessibility,
     ResourceImage, ResourceType, ResourceEquipment, TermsOfUse, Equipment, ReservationMetadataSet,
-    ResourceDailyOpeningHours, UnitAccessibility
+    ResourceDailyOpeningHours, ResourceFreeInterval, UnitAccessibility
 )
 from resources.models.accessibility import get_resource_accessibility_url
-from resources.models.resource import determine_hours_time_range
+from resources.models.resource import get_opening_hours_cache
 
-from ..auth import is_general_admin, is_staff
+from ..auth import is_general_admin, is_staff, PermissionResolver
 from .accessibility import ResourceAccessibilitySerializer
 from .base import ExtraDataMixin, TranslatedModelSerializer, register_view, DRFFilterBooleanWidget
 from .reservation import ReservationSerializer
@@ -161,8 +159,7 @@ class ResourceSerializer(ExtraDataMixin, TranslatedModelSerializer, munigeo_api.
     type = ResourceTypeSerializer()
     # FIXME: location field gets removed by munigeo
     location = serializers.SerializerMethodField()
-    # FIXME: Enable available_hours when it's more performant
-    # available_hours = serializers.SerializerMethodField()
+    available_hours = serializers.SerializerMethodField()
     opening_hours = serializers.SerializerMethodField()
     reservations = serializers.SerializerMethodField()
     user_permissions = serializers.SerializerMethodField()
@@ -346,6 +343,25 @@ def get_opening_hours(self, obj):
             ret.append(d)
         return ret
 
+    def get_available_hours(self, obj):
+        if 'start' not in self.context:
+            return None
+
+        start = self.context['start']
+        end = self.context['end']
+        duration = self.context.get('duration')
+        if duration is not None:
+            duration = datetime.timedelta(minutes=duration)
+
+        if self.context.get('during_closing'):
+            return obj.get_available_hours(start, end, duration, during_closing=True)
+
+        if 'free_intervals_cache' in self.context:
+            free_intervals_cache = self.context['free_intervals_cache'].get(obj.id, [])
+        else:
+            free_intervals_cache = None
+        return obj.get_free_hours(start, end, duration, free_intervals_cache=free_intervals_cache)
+
     def get_reservations(self, obj):
         if 'start' not in self.context:
             return None
@@ -529,13 +545,13 @@ def filter_available_between(self, queryset, name, value):
         available_start = self._deserialize_datetime(value[0])
         available_end = self._deserialize_datetime(value[1])
 
-        if available_start.date() != available_end.date():
-            raise exceptions.ParseError('available_between timestamps must be on the same day.')
-        overlapping_reservations = Reservation.objects.filter(
-            resource__in=queryset, end__gt=available_start, begin__lt=available_end
-        ).current()
+        if available_start > available_end:
+            raise exceptions.ParseError('available_between end must not be before start.')
 
         if len(value) == 2:
+            overlapping_reservations = Reservation.objects.filter(
+                resource__in=queryset, end__gt=available_start, begin__lt=available_end
+            ).current()
             return self._filter_available_between_whole_range(
                 queryset, overlapping_reservations, available_start, available_end
             )
@@ -544,105 +560,39 @@ def filter_available_between(self, queryset, name, value):
                 period = datetime.timedelta(minutes=int(value[2]))
             except ValueError:
                 raise exceptions.ParseError('available_between period must be an integer.')
-            return self._filter_available_between_with_period(
-                queryset, overlapping_reservations, available_start, available_end, period
-            )
+            return queryset.with_free_slot(available_start, available_end, period)
 
     def _filter_available_between_whole_range(self, queryset, reservations, available_start, available_end):
         # exclude resources that have reservation(s) overlapping with the available_between range
         queryset = queryset.exclude(reservations__in=reservations)
-        closed_resource_ids = {
-            resource.id
-            for resource in queryset
-            if not self._is_resource_open(resource, available_start, available_end)
-        }
-
-        return queryset.exclude(id__in=closed_resource_ids)
-
-    @staticmethod
-    def _is_resource_open(resource, start, end):
-        opening_hours = resource.get_opening_hours(start, end)
-        if len(opening_hours) > 1:
-            # range spans over multiple days, assume resources aren't open all night and skip the resource
-            return False
-
-        hours = next(iter(opening_hours.values()))[0]  # assume there is only one hours obj per day
-        if not hours['opens'] and not hours['closes']:
-            return False
-
-        start_too_early = hours['opens'] and start < hours['opens']
-        end_too_late = hours['closes'] and end > hours['closes']
-        if start_too_early or end_too_late:
-            return False
-
-        return True
-
-    def _filter_available_between_with_period(self, queryset, reservations, available_start, available_end, period):
-        reservations = reservations.order_by('begin').select_related('resource')
-
-        reservations_by_resource = collections.defaultdict(list)
-        for reservation in reservations:
-            reservations_by_resource[reservation.resource_id].append(reservation)
 
-        available_resources = set()
-
-        hours_qs = ResourceDailyOpeningHours.objects.filter(
-            open_between__overlap=(available_start, available_end, '[)'))
-
-        # check the resources one by one to determine which ones have open slots
-        for resource in queryset.prefetch_related(None).prefetch_related(
-                Prefetch('opening_hours', queryset=hours_qs, to_attr='prefetched_opening_hours')):
-            reservations = reservations_by_resource[resource.id]
-
-            if self._is_resource_available(resource, available_start, available_end, reservations, period):
-                available_resources.add(resource.id)
+        hours = ResourceDailyOpeningHours.objects.filter(
+            resource__in=queryset, open_between__overlap=(available_start, available_end, '[)')
+        ).values_list('resource_id', 'open_between')
+        hours_by_resource = collections.defaultdict(list)
+        for resource_id, open_between in hours:
+            hours_by_resource[resource_id].append(open_between)
+
+        open_resource_ids = {
+            resource_id
+            for resource_id, open_ranges in hours_by_resource.items()
+            if self._is_resource_open(open_ranges, available_start, available_end)
+        }
 
-        return queryset.filter(id__in=available_resources)
+        return queryset.filter(id__in=open_resource_ids)
 
     @staticmethod
-    def _is_resource_available(resource, available_start, available_end, reservations, period):
-        opening_hours = resource.get_opening_hours(available_start, available_end, resource.prefetched_opening_hours)
-        hours = next(iter(opening_hours.values()))[0]  # assume there is only one hours obj per day
-
-        if not (hours['opens'] or hours['closes']):
-            return False
-
-        current = max(available_start, hours['opens']) if hours['opens'] is not None else available_start
-        end = min(available_end, hours['closes']) if hours['closes'] is not None else available_end
-
-        if current >= end:
-            # the resource is already closed
-            return False
-
-        if not reservations:
-            # the resource has no reservations, just check if the period fits in the resource's opening times
-            if end - current >= period:
-                return True
-            return False
-
-        # try to find an open slot between reservations and opening / closing times.
-        # start from period start time or opening time depending on which one is earlier.
-        for reservation in reservations:
-            if reservation.end <= current:
-                # this reservation is in the past
-                continue
-            if reservation.begin - current >= period:
-                # found an open slot before the reservation currently being examined
-                return True
-            if reservation.end > end:
-                # the reservation currently being examined ends after the period or closing time,
-                # so no free slots
-                return False
-            # did not find an open slot before the reservation currently being examined,
-            # proceed to next reservation
-            current = reservation.end
-        else:
-            # all reservations checked and no free slot found, check if there is a free slot after the last
-            # reservation
-            if end - reservation.end >= period:
-                return True
+    def _is_resource_open(open_ranges, start, end):
+        """
+        Check if a resource is open for the range, given its opening hours overlapping the range.
 
-        return False
+        A range within a single day must fit inside one of the resource's opening hours. Resources
+        are not expected to be open all night, so for a range spanning several days it is enough
+        that the resource is open at some point during the range.
+        """
+        if start.date() != end.date():
+            return bool(open_ranges)
+        return any(open_range.lower <= start and end <= open_range.upper for open_range in open_ranges)
 
     class Meta:
         model = Resource
@@ -698,28 +648,9 @@ def filter_queryset(self, request, queryset, view):
 
 class ResourceCacheMixin:
     def _preload_opening_hours(self, times):
-        # We have to evaluate the query here to make sure all the
-        # resources are on the same timezone. In case of different
-        # time zones, we skip this optimization.
-        time_zone = None
-        hours_by_resource = {}
-        for resource in self._page:
-            if time_zone:
-                if resource.unit.time_zone != time_zone:
-                    return None
-            else:
-                time_zone = resource.unit.time_zone
-            hours_by_resource[resource.id] = []
-        if not time_zone:
-            return None
-
-        begin, end = determine_hours_time_range(times.get('start'), times.get('end'), pytz.timezone(time_zone))
-        hours = ResourceDailyOpeningHours.objects.filter(
-            resource__in=self._page, open_between__overlap=(begin, end, '[)')
-        )
-        for obj in hours:
-            hours_by_resource[obj.resource_id].append(obj)
-        return hours_by_resource
+        # Resources on the page may belong to units in different time zones,
+        # so the date range is determined separately for each zone.
+        return get_opening_hours_cache(self._page, times.get('start'), times.get('end'))
 
     def _preload_reservations(self, times):
         qs = get_resource_reservations_queryset(times['start'], times['end'])
@@ -730,20 +661,19 @@ def _preload_reservations(self, times):
             rv_list.append(rv)
         return reservations_by_resource
 
+    def _preload_free_intervals(self, times):
+        free_intervals = ResourceFreeInterval.objects.filter(
+            resource__in=self._page, free_between__overlap=(times['start'], times['end'], '[)')
+        )
+        free_intervals_by_resource = {}
+        for obj in free_intervals:
+            free_intervals_by_resource.setdefault(obj.resource_id, []).append(obj)
+        return free_intervals_by_resource
+
     def _preload_permissions(self):
-        units = set()
-        resource_groups = set()
-        checker = ObjectPermissionChecker(self.request.user)
+        resolver = PermissionResolver(self.request.user, self._page)
         for res in self._page:
-            units.add(res.unit)
-            for g in res.groups.all():
-                resource_groups.add(g)
-            res._permission_checker = checker
-
-        if units:
-            checker.prefetch_perms(units)
-        if resource_groups:
-            checker.prefetch_perms(resource_groups)
+            res._permission_resolver = resolver
 
     def _get_cache_context(self):
         context = {}
@@ -759,6 +689,7 @@ def _get_cache_context(self):
         times = parse_query_time_range(self.request.query_params)
         if times:
             context['reservations_cache'] = self._preload_reservations(times)
+            context['free_intervals_cache'] = self._preload_free_intervals(times)
         context['opening_hours_cache'] = self._preload_opening_hours(times)
 
         context['accessibility_viewpoint_cache'] = AccessibilityViewpoint.objects.all()
@@ -780,6 +711,7 @@ class ResourceListViewSet(munigeo_api.GeoModelAPIView, mixins.ListModelMixin,
                      'name_sv', 'description_sv', 'unit__name_sv',
                      'name_en', 'description_en', 'unit__name_en')
     serializer_class = ResourceSerializer
+    pagination_class = ResourcePagination
     authentication_classes = (
         list(drf_settings.DEFAULT_AUTHENTICATION_CLASSES) +
         [SessionAuthentication])
@@ -5,3 +5,7 @@
 class ResourceConfig(AppConfig):
     name = 'resources'
     verbose_name = ugettext_lazy('Resource app')
+
+    def ready(self):
+        import resources.checks  # noqa
+        import resources.signal_handlers  # noqa
@@ -1,4 +1,7 @@
+from guardian.core import ObjectPermissionChecker
+
 from .enums import UnitGroupAuthorizationLevel, UnitAuthorizationLevel
+from .middleware import get_request_cache
 
 def is_authenticated_user(user):
     return bool(user and user.is_authenticated)
@@ -30,22 +33,148 @@ def is_any_admin(user):
     return is_general_admin(user) or is_unit_group_admin or is_unit_admin
 
 
-def is_unit_admin(unit_authorizations, unit_group_authorizations, unit):
-    is_admin = False
-
-    for group_auth in filter(lambda group_auth: group_auth.level == UnitGroupAuthorizationLevel.admin, unit_group_authorizations):
-        if any(member_unit == unit for member_unit in group_auth.subject.members.all()):
-            is_admin = True
-
-    if any(auth.subject == unit and auth.level == UnitAuthorizationLevel.admin for auth in unit_authorizations):
-        is_admin = True
-
-    return is_admin
+def get_unit_role_levels(user):
+    """
+    Return the authorization levels of the user as a dict of unit ids to sets of levels
 
+    Unit group admin authorizations are included for every member unit of the
+    group. The result is memoized for the duration of the current request, and
+    forgotten by the signal handlers in resources.signal_handlers when the
+    request changes the authorizations of the user or the members of their
+    unit groups. Prefetched authorizations of the user are used when present.
 
-def is_unit_manager(unit_authorizations, unit):
-    return any(auth.subject == unit and auth.level == UnitAuthorizationLevel.manager for auth in unit_authorizations)
-
-
-def is_unit_viewer(unit_authorizations, unit):
-    return any(auth.subject == unit and auth.level == UnitAuthorizationLevel.viewer for auth in unit_authorizations)
+    :type user: users.models.User
+    :rtype: dict[int, set]
+    """
+    if not is_authenticated_user(user):
+        return {}
+    request_cache = get_request_cache()
+    cache_key = ('unit_role_levels', user.pk)
+    if request_cache is not None and cache_key in request_cache:
+        return request_cache[cache_key]
+
+    prefetched = getattr(user, '_prefetched_objects_cache', {})
+    levels = {}
+
+    if 'unit_authorizations' in prefetched:
+        unit_levels = [(auth.subject_id, auth.level) for auth in user.unit_authorizations.all()]
+    else:
+        unit_levels = user.unit_authorizations.values_list('subject', 'level')
+    for unit_id, level in unit_levels:
+        levels.setdefault(unit_id, set()).add(level)
+
+    if 'unit_group_authorizations' in prefetched:
+        admin_unit_ids = [
+            unit.pk
+            for group_auth in user.unit_group_authorizations.all()
+            if group_auth.level == UnitGroupAuthorizationLevel.admin
+            for unit in group_auth.subject.members.all()
+        ]
+    else:
+        admin_unit_ids = user.unit_group_authorizations.filter(level=UnitGroupAuthorizationLevel.admin)\
+            .values_list('subject__members', flat=True)
+    for unit_id in admin_unit_ids:
+        if unit_id is not None:
+            levels.setdefault(unit_id, set()).add(UnitGroupAuthorizationLevel.admin)
+
+    if request_cache is not None:
+        request_cache[cache_key] = levels
+    return levels
+
+
+def invalidate_unit_role_levels(user_ids):
+    request_cache = get_request_cache()
+    if request_cache is None:
+        return
+    for user_id in set(user_ids):
+        request_cache.pop(('unit_role_levels', user_id), None)
+
+
+def is_unit_admin(user, unit):
+    levels = get_unit_role_levels(user).get(unit.pk, ())
+    return UnitAuthorizationLevel.admin in levels or UnitGroupAuthorizationLevel.admin in levels
+
+
+def is_unit_manager(user, unit):
+    return UnitAuthorizationLevel.manager in get_unit_role_levels(user).get(unit.pk, ())
+
+
+def is_unit_viewer(user, unit):
+    return UnitAuthorizationLevel.viewer in get_unit_role_levels(user).get(unit.pk, ())
+
+
+class PermissionResolver:
+    """
+    Resolve the resource permissions of a single user for many resources at once
+
+    Unit roles, unit group roles and the guardian permissions of the user are
+    fetched for all the given resources with a constant number of queries.
+    They are combined into a matrix of granted permissions per unit and per
+    resource group, so that each later permission check is a lookup.
+    """
+    def __init__(self, user, resources):
+        # Imported here as the models depend on this module
+        from .models.permissions import UNIT_ROLE_PERMISSIONS
+
+        self.user = user
+        self.user_id = user.pk if is_authenticated_user(user) else None
+        self._general_admin = is_general_admin(user)
+        self._unit_roles = get_unit_role_levels(user)
+        self._unit_perms = {}
+        self._group_perms = {}
+        if self.user_id is None:
+            return
+
+        units = {res.unit for res in resources if res.unit_id}
+        resource_groups = {group for res in resources for group in res.groups.all()}
+
+        checker = ObjectPermissionChecker(user)
+        if units:
+            checker.prefetch_perms(units)
+        if resource_groups:
+            checker.prefetch_perms(resource_groups)
+
+        for unit in units:
+            roles = self._get_roles(unit.pk)
+            if self._general_admin:
+                roles = roles | {UnitGroupAuthorizationLevel.admin}
+            perms = {perm for perm, allowed_roles in UNIT_ROLE_PERMISSIONS.items() if roles.intersection(allowed_roles)}
+            perms.update(self._strip_prefix(checker.get_perms(unit), 'unit:'))
+            self._unit_perms[unit.pk] = perms
+        for group in resource_groups:
+            self._group_perms[group.pk] = self._strip_prefix(checker.get_perms(group), 'group:')
+
+    @staticmethod
+    def _strip_prefix(codenames, prefix):
+        return {codename[len(prefix):] for codename in codenames if codename.startswith(prefix)}
+
+    def _get_roles(self, unit_id):
+        return self._unit_roles.get(unit_id, set())
+
+    def is_for_user(self, user):
+        return self.user_id == (user.pk if is_authenticated_user(user) else None)
+
+    def is_admin(self, resource):
+        if self.user_id is None:
+            return False
+        if self._general_admin:
+            return True
+        if not resource.unit_id:
+            return False
+        roles = self._get_roles(resource.unit_id)
+        return UnitAuthorizationLevel.admin in roles or UnitGroupAuthorizationLevel.admin in roles
+
+    def is_manager(self, resource):
+        return self.user_id is not None and UnitAuthorizationLevel.manager in self._get_roles(resource.unit_id)
+
+    def is_viewer(self, resource):
+        return self.user_id is not None and UnitAuthorizationLevel.viewer in self._get_roles(resource.unit_id)
+
+    def has_perm(self, resource, perm, allow_admin=True):
+        if self.user_id is None:
+            return False
+        if (allow_admin and self.is_admin(resource)) or self.user.is_superuser:
+            return True
+        if perm in self._unit_perms.get(resource.unit_id, ()):
+            return True
+        return any(perm in self._group_perms.get(group.pk, ()) for group in resource.groups.all())
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core import checks
+
+# Cache backends whose contents are private to each process
+PROCESS_LOCAL_CACHE_BACKENDS = ('django.core.cache.backends.locmem.LocMemCache',)
+
+
+@checks.register()
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Warn when the managed unit ids would be cached separately in each process
+
+    The invalidation of the cached ids only reaches the process that changed
+    the authorizations, so the other processes would keep using stale ids.
+    """
+    backend = settings.CACHES['default']['BACKEND']
+    if settings.DEBUG or backend not in PROCESS_LOCAL_CACHE_BACKENDS:
+        return []
+    return [checks.Warning(
+        'The default cache backend %s is not shared between processes.' % backend,
+        hint='Configure a shared cache, e.g. memcached or Redis, so that changes to the unit authorizations '
+             'reach every process within RESPA_MANAGED_UNITS_CACHE_TIMEOUT.',
+        id='resources.W001',
+    )]
@@ -0,0 +1,83 @@
+import logging
+import select
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from resources.models import ReservationEventJob
+from resources.models.event import RESERVATION_EVENTS_CHANNEL, lock_reservation_event_handler_slot
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Runs the pending jobs of the reservation event handlers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, dest='workers',
+                            help='Number of jobs run at the same time by this process')
+        parser.add_argument('--loop', action='store_true', dest='loop', default=False,
+                            help='Keep waiting for jobs instead of exiting when there are none')
+        parser.add_argument('--interval', type=float, default=10, dest='interval',
+                            help='Seconds to wait for a notification of new jobs before polling again when looping')
+
+    def handle(self, *args, **options):
+        if options['workers'] <= 1:
+            self.work(options)
+            return
+
+        threads = [threading.Thread(target=self.work_in_thread, args=(options,)) for i in range(options['workers'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def work_in_thread(self, options):
+        try:
+            self.work(options)
+        finally:
+            # every thread has a connection of its own
+            connection.close()
+
+    def work(self, options):
+        while True:
+            done = failed = 0
+            while True:
+                result = self.run_next_job()
+                if result is None:
+                    break
+                if result:
+                    done += 1
+                else:
+                    failed += 1
+            if done or failed:
+                logger.info('Ran %d reservation event job(s), %d failed.' % (done, failed))
+            if not options['loop']:
+                break
+            self.wait_for_jobs(options['interval'])
+
+    def run_next_job(self):
+        # The job is locked with SKIP LOCKED so that several workers can run jobs concurrently.
+        # If the worker dies while running the job, the transaction is rolled back and the job stays pending.
+        with transaction.atomic():
+            busy_handlers = set()
+            while True:
+                job = ReservationEventJob.objects.due().exclude(handler__in=busy_handlers)\
+                    .select_for_update(skip_locked=True).order_by('id').first()
+                if job is None:
+                    return None
+                if lock_reservation_event_handler_slot(job.handler):
+                    return job.run()
+                busy_handlers.add(job.handler)
+
+    def wait_for_jobs(self, timeout):
+        """
+        Wait until new jobs are committed or the timeout passes
+        """
+        with connection.cursor() as cursor:
+            cursor.execute('LISTEN %s' % RESERVATION_EVENTS_CHANNEL)
+        pg_connection = connection.connection
+        if select.select([pg_connection], [], [], timeout) != ([], [], []):
+            pg_connection.poll()
+            del pg_connection.notifies[:]
@@ -0,0 +1,51 @@
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from resources.models import Resource, ResourceFreeInterval
+from resources.models.resource import calculate_free_intervals
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds or verifies the precalculated free intervals of resources.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true', dest='verify', default=False,
+                            help='Only check that the free intervals are up to date, do not modify them')
+        parser.add_argument('--resource', action='append', dest='resources',
+                            help='Process only specified resource(s)')
+
+    def handle(self, *args, **options):
+        resources = Resource.objects.all()
+        if options['resources']:
+            resources = resources.filter(id__in=options['resources'])
+
+        if options['verify']:
+            outdated = [resource for resource in resources if not self.verify(resource)]
+            if outdated:
+                raise CommandError('Free intervals are out of date for %d resource(s): %s' % (
+                    len(outdated), ', '.join(resource.id for resource in outdated)
+                ))
+            logger.info('Free intervals are up to date.')
+            return
+
+        for resource in resources:
+            with transaction.atomic():
+                count = ResourceFreeInterval.objects.rebuild(resource)
+            logger.info('%s: %d free interval(s).' % (resource.id, count))
+
+    def verify(self, resource):
+        open_ranges = [
+            (r.lower, r.upper) for r in resource.opening_hours.values_list('open_between', flat=True)
+        ]
+        expected = calculate_free_intervals(resource, open_ranges)
+        stored = sorted(
+            (r.lower, r.upper) for r in resource.free_intervals.values_list('free_between', flat=True)
+        )
+        if stored != expected:
+            logger.warning('%s: expected %d free interval(s), found %d.' % (resource.id, len(expected), len(stored)))
+            return False
+        return True
@@ -0,0 +1,77 @@
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from resources.models import Reservation
+
+logger = logging.getLogger(__name__)
+
+# The durations of old reservations may be missing before migration 0099, so
+# the ranges are built from the begin and end times.
+OVERLAPPING_RESERVATIONS_SQL = """
+    SELECT r.id, r.resource_id, r.begin, r.end FROM resources_reservation r
+    WHERE r.state NOT IN ('cancelled', 'denied') AND r.begin < r.end AND EXISTS (
+        SELECT 1 FROM resources_reservation o
+        WHERE o.resource_id = r.resource_id AND o.id <> r.id
+            AND o.state NOT IN ('cancelled', 'denied')
+            AND tstzrange(o.begin, o.end, '[)') && tstzrange(r.begin, r.end, '[)')
+    )
+    ORDER BY r.resource_id, r.id
+"""
+
+
+def get_overlapping_reservation_ids():
+    """
+    Return the ids of the active reservations that overlap an earlier active reservation of the same resource
+
+    The reservation created first is the one that is kept, the later
+    reservations overlapping it or each other are returned.
+
+    :rtype: list[int]
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(OVERLAPPING_RESERVATIONS_SQL)
+        rows = cursor.fetchall()
+
+    kept_by_resource = {}
+    overlapping_ids = []
+    for reservation_id, resource_id, begin, end in rows:
+        kept = kept_by_resource.setdefault(resource_id, [])
+        if any(begin < other_end and other_begin < end for other_begin, other_end in kept):
+            overlapping_ids.append(reservation_id)
+        else:
+            kept.append((begin, end))
+    return overlapping_ids
+
+
+class Command(BaseCommand):
+    help = ('Lists the active reservations that overlap an earlier reservation of the same resource, '
+            'which keep the reservation overlap constraint from being added.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cancel', action='store_true', dest='cancel', default=False,
+                            help='Cancel the overlapping reservations, notifying their reservers as usual')
+
+    def handle(self, *args, **options):
+        overlapping_ids = get_overlapping_reservation_ids()
+        if not overlapping_ids:
+            logger.info('No overlapping reservations.')
+            return
+
+        reservations = Reservation.objects.filter(id__in=overlapping_ids).select_related('resource').order_by('id')
+        if not options['cancel']:
+            for reservation in reservations:
+                self.stdout.write('%s: %s %s - %s' % (
+                    reservation.id, reservation.resource_id, reservation.begin, reservation.end
+                ))
+            raise CommandError('%d reservation(s) overlap an earlier reservation, use --cancel to cancel them.' % (
+                len(overlapping_ids)
+            ))
+
+        for reservation in reservations:
+            with transaction.atomic():
+                reservation.set_state(Reservation.CANCELLED, None)
+            logger.info('Cancelled reservation %s of resource %s overlapping an earlier one.' % (
+                reservation.id, reservation.resource_id
+            ))
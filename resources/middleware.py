@@ -0,0 +1,39 @@
+import threading
+from contextlib import contextmanager
+
+_request_local = threading.local()
+
+
+def get_request_cache():
+    """
+    Return a dict for memoizing values during the current request
+
+    Returns None when called outside of a request, in which case nothing
+    should be memoized.
+    """
+    return getattr(_request_local, 'cache', None)
+
+
+@contextmanager
+def request_cache():
+    """
+    Memoize values with get_request_cache() for the block, like during a request
+
+    Useful for batch jobs run outside of requests. Nested blocks share the
+    outermost cache.
+    """
+    previous_cache = get_request_cache()
+    _request_local.cache = {} if previous_cache is None else previous_cache
+    try:
+        yield _request_local.cache
+    finally:
+        _request_local.cache = previous_cache
+
+
+class RequestCacheMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with request_cache():
+            return self.get_response(request)
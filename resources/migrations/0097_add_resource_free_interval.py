@@ -0,0 +1,28 @@
+# Generated by Django 2.2.28 on 2026-10-17 09:12
+
+import django.contrib.postgres.fields.ranges
+from django.db import migrations, models
+import django.db.models.deletion
+import resources.models.gistindex
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('resources', '0096_add_custom_price_permission'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResourceFreeInterval',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('free_between', django.contrib.postgres.fields.ranges.DateTimeRangeField()),
+                ('resource', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='free_intervals', to='resources.Resource')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='resourcefreeinterval',
+            index=resources.models.gistindex.GistIndex(fields=['free_between'], name='resources_r_free_be_e85788_gist'),
+        ),
+    ]
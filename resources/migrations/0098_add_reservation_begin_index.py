@@ -0,0 +1,17 @@
+# Generated by Django 2.2.28 on 2026-10-17 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('resources', '0097_add_resource_free_interval'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['begin', 'id'], name='resources_r_begin_9a6889_idx'),
+        ),
+    ]
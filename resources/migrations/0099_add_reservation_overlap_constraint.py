@@ -0,0 +1,71 @@
+# Generated by Django 2.2.28 on 2026-10-17 14:05
+
+import django.contrib.postgres.fields.ranges
+from django.contrib.postgres.operations import BtreeGistExtension
+from django.core.management.base import CommandError
+from django.db import migrations
+
+ACTIVE_OVERLAPPING_RESERVATIONS_SQL = """
+    SELECT r.id FROM resources_reservation r
+    WHERE r.state NOT IN ('cancelled', 'denied') AND EXISTS (
+        SELECT 1 FROM resources_reservation o
+        WHERE o.resource_id = r.resource_id AND o.id <> r.id
+            AND o.state NOT IN ('cancelled', 'denied') AND o.duration && r.duration
+    )
+    ORDER BY r.id
+"""
+
+
+def check_overlapping_reservations(apps, schema_editor):
+    """
+    Refuse to add the constraint while active reservations overlap each other
+
+    Double bookings, e.g. imported from Exchange, are real reservations, so
+    they are not resolved here but with the resolve_overlapping_reservations
+    management command.
+    """
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(ACTIVE_OVERLAPPING_RESERVATIONS_SQL)
+        overlapping_ids = [row[0] for row in cursor.fetchall()]
+    if overlapping_ids:
+        raise CommandError(
+            'Cannot add the reservation overlap constraint, the active reservations %s overlap each other. '
+            'Resolve them first, e.g. with "manage.py resolve_overlapping_reservations".'
+            % ', '.join(str(reservation_id) for reservation_id in overlapping_ids)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('resources', '0098_add_reservation_begin_index'),
+    ]
+
+    operations = [
+        # The constraint is on the duration, which is missing from some old reservations
+        migrations.RunSQL(
+            sql="""
+                UPDATE resources_reservation
+                SET duration = CASE WHEN "end" < "begin" THEN 'empty'::tstzrange
+                                    ELSE tstzrange("begin", "end", '[)') END
+                WHERE duration IS NULL
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AlterField(
+            model_name='reservation',
+            name='duration',
+            field=django.contrib.postgres.fields.ranges.DateTimeRangeField(blank=True, db_index=True, verbose_name='Length of reservation'),
+        ),
+        migrations.RunPython(check_overlapping_reservations, migrations.RunPython.noop),
+        BtreeGistExtension(),
+        migrations.RunSQL(
+            sql="""
+                ALTER TABLE resources_reservation
+                ADD CONSTRAINT resources_reservation_no_overlap
+                EXCLUDE USING gist (resource_id WITH =, duration WITH &&)
+                WHERE (state NOT IN ('cancelled', 'denied'))
+            """,
+            reverse_sql='ALTER TABLE resources_reservation DROP CONSTRAINT resources_reservation_no_overlap',
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 2.2.28 on 2026-10-17 15:10
+
+from django.db import migrations, models
+import resources.models.gistindex
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('resources', '0099_add_reservation_overlap_constraint'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(condition=models.Q(('state__in', ('cancelled', 'denied')), _negated=True), fields=['resource', 'end'], name='resources_r_resourc_e8d78d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['user', 'end'], name='resources_r_user_id_1f803b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=resources.models.gistindex.GistIndex(fields=['duration'], name='resources_r_duratio_855f1f_gist'),
+        ),
+    ]
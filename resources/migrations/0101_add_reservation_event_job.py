@@ -0,0 +1,45 @@
+# Generated by Django 2.2.28 on 2026-10-17 16:20
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('resources', '0100_add_reservation_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReservationEventJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event', models.CharField(choices=[('confirmed', 'confirmed'), ('modified', 'modified'), ('cancelled', 'cancelled')], max_length=16, verbose_name='Event')),
+                ('handler', models.CharField(max_length=100, verbose_name='Handler')),
+                ('reservation_id', models.IntegerField(verbose_name='Reservation')),
+                ('state', models.CharField(choices=[('pending', 'pending'), ('done', 'done'), ('failed', 'failed')], default='pending', max_length=16, verbose_name='State')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Attempts')),
+                ('last_error', models.TextField(blank=True, verbose_name='Last error')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created at')),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Run after')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Finished at')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'verbose_name': 'Reservation event job',
+                'verbose_name_plural': 'Reservation event jobs',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='reservationeventjob',
+            index=models.Index(fields=['state', 'run_after'], name='resources_r_state_0a00ec_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservationeventjob',
+            index=models.Index(fields=['reservation_id', 'handler'], name='resources_r_reserva_866b83_idx'),
+        ),
+    ]
@@ -5,8 +5,9 @@
     ReservationCancelReasonCategory, ReservationCancelReason)
 from .resource import (
     Purpose, Resource, ResourceType, ResourceImage, ResourceEquipment, ResourceGroup,
-    ResourceDailyOpeningHours, TermsOfUse, Attachment
+    ResourceDailyOpeningHours, ResourceFreeInterval, TermsOfUse, Attachment
 )
+from .event import ReservationEventJob
 from .equipment import Equipment, EquipmentAlias, EquipmentCategory
 from .unit import Unit, UnitAuthorization, UnitIdentifier
 from .unit_group import UnitGroup, UnitGroupAuthorization
@@ -26,10 +27,12 @@
     'ReservationMetadataSet',
     'ReservationCancelReasonCategory',
     'ReservationCancelReason',
+    'ReservationEventJob',
     'Resource',
     'ResourceAccessibility',
     'ResourceDailyOpeningHours',
     'ResourceEquipment',
+    'ResourceFreeInterval',
     'ResourceGroup',
     'ResourceImage',
     'ResourceType',
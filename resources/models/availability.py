@@ -29,7 +29,56 @@ def datetime_to_date(dt, tz):
     return dt.date()
 
 
-def get_opening_hours(time_zone, periods, begin, end=None):
+def merge_intervals(intervals):
+    """
+    Merge overlapping and adjacent intervals
+
+    :rtype: list[tuple[datetime.datetime, datetime.datetime]]
+    :type intervals: iterable[tuple[datetime.datetime, datetime.datetime]]
+    """
+    merged = []
+    for begin, end in sorted(intervals):
+        if merged and begin <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((begin, end))
+    return merged
+
+
+def subtract_intervals(intervals, removed):
+    """
+    Returns the parts of the given intervals that are not covered by any of the removed intervals
+
+    Both the intervals and the removed intervals are (begin, end) tuples and
+    they are treated as half-open. The intervals are expected not to overlap
+    each other. Returns a sorted list of (begin, end) tuples.
+
+    :rtype: list[tuple[datetime.datetime, datetime.datetime]]
+    :type intervals: iterable[tuple[datetime.datetime, datetime.datetime]]
+    :type removed: iterable[tuple[datetime.datetime, datetime.datetime]]
+    """
+    removed = merge_intervals(removed)
+    result = []
+    idx = 0
+    for begin, end in sorted(intervals):
+        # removed intervals are sorted and disjoint, so the ones ending before
+        # this interval cannot affect any of the following intervals either
+        while idx < len(removed) and removed[idx][1] <= begin:
+            idx += 1
+        current = begin
+        i = idx
+        while i < len(removed) and removed[i][0] < end:
+            if removed[i][0] > current:
+                result.append((current, removed[i][0]))
+            current = max(current, removed[i][1])
+            i += 1
+        if current < end:
+            result.append((current, end))
+    return result
+
+
+def get_opening_hours(time_zone, periods, begin, end=None, days=None):
     """
     Returns opening and closing times for a given date range
 
@@ -41,6 +90,8 @@ def get_opening_hours(time_zone, periods, begin, end=None):
     :type periods: list[Period]
     :type begin: datetime.date | datetime.datetime
     :type end: datetime.date | None
+    :type days: list[Day] | None
+    :param days: Day objects of the periods, fetched from the database if not given
     """
 
     tz = pytz.timezone(time_zone)
@@ -69,7 +120,8 @@ def get_opening_hours(time_zone, periods, begin, end=None):
             p.priority = 0
     periods.sort(key=lambda x: (-x.priority, x.end - x.start))
 
-    days = list(Day.objects.filter(period__in=periods))
+    if days is None:
+        days = list(Day.objects.filter(period__in=periods))
     for period in periods:
         period.range_days = {day.weekday: day for day in days if day.period_id == period.id}
 
@@ -0,0 +1,201 @@
+import datetime
+import logging
+import zlib
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from django.utils.translation import ugettext_lazy as _
+
+from .reservation import Reservation
+
+logger = logging.getLogger(__name__)
+
+# Workers listening on this channel are notified when new jobs have been committed
+RESERVATION_EVENTS_CHANNEL = 'respa_reservation_events'
+
+ReservationEventHandler = namedtuple('ReservationEventHandler', ('name', 'func', 'concurrency'))
+
+_handlers = {}
+_handler_names_by_event = {}
+_concurrency_by_name = {}
+
+
+def register_reservation_event_handler(event, name, func, concurrency=None):
+    """
+    Call func(reservation, user) on every reservation event of the given type
+
+    The call is recorded as a ReservationEventJob in the transaction of the
+    event and made by the process_reservation_events worker once the
+    transaction has committed. At most `concurrency` jobs of a handler run at
+    the same time, RESPA_RESERVATION_EVENTS_HANDLER_CONCURRENCY by default.
+
+    A name can be registered for several events, with a different func for
+    each. The jobs of a name are run in order for each reservation, so calls
+    that must not pass each other, like granting and revoking access, should
+    share a name.
+
+    :type event: str
+    :type name: str
+    :type concurrency: int|None
+    """
+    _handlers[(event, name)] = ReservationEventHandler(name, func, concurrency)
+    if concurrency is not None:
+        _concurrency_by_name[name] = concurrency
+    names = _handler_names_by_event.setdefault(event, [])
+    if name not in names:
+        names.append(name)
+
+
+def get_reservation_event_handler(event, name):
+    return _handlers.get((event, name))
+
+
+def get_reservation_event_handlers(event):
+    return [_handlers[(event, name)] for name in _handler_names_by_event.get(event, [])]
+
+
+def notify_reservation_event_workers():
+    with connection.cursor() as cursor:
+        cursor.execute('NOTIFY %s' % RESERVATION_EVENTS_CHANNEL)
+
+
+def lock_reservation_event_handler_slot(name):
+    """
+    Take a free concurrency slot of a handler for the current transaction
+
+    The slots are PostgreSQL advisory locks, so the limit holds across all
+    the worker processes. Returns False if all the slots are taken.
+    """
+    concurrency = _concurrency_by_name.get(name) or settings.RESPA_RESERVATION_EVENTS_HANDLER_CONCURRENCY
+    key = zlib.crc32(name.encode('utf8')) & 0x7fffffff
+    with connection.cursor() as cursor:
+        for slot in range(concurrency):
+            cursor.execute('SELECT pg_try_advisory_xact_lock(%s, %s)', [key, slot])
+            if cursor.fetchone()[0]:
+                return True
+    return False
+
+
+class ReservationEventJobQuerySet(models.QuerySet):
+    def due(self):
+        # The events of a reservation are handled in order, so a job waits for the earlier jobs of its handler
+        earlier_jobs = ReservationEventJob.objects.filter(
+            handler=OuterRef('handler'), reservation_id=OuterRef('reservation_id'),
+            state=ReservationEventJob.PENDING, id__lt=OuterRef('id'),
+        )
+        return self.filter(state=ReservationEventJob.PENDING, run_after__lte=timezone.now()).annotate(
+            has_earlier_jobs=Exists(earlier_jobs)
+        ).filter(has_earlier_jobs=False)
+
+    def dispatch(self, event, reservation, user=None):
+        """
+        Record the jobs of the handlers of a reservation event
+
+        The jobs are written in the current transaction, and the workers are
+        notified once it commits. When RESPA_RESERVATION_EVENTS_RUN_IMMEDIATELY
+        is set, the handlers are called right away instead.
+        """
+        handlers = get_reservation_event_handlers(event)
+        if not handlers:
+            return []
+        # an unsaved reservation can't be referred to by a job
+        if getattr(settings, 'RESPA_RESERVATION_EVENTS_RUN_IMMEDIATELY', False) or reservation.pk is None:
+            for handler in handlers:
+                handler.func(reservation, user)
+            return []
+
+        user_id = user.pk if user is not None and user.is_authenticated else None
+        jobs = self.bulk_create([
+            ReservationEventJob(event=event, handler=handler.name, reservation_id=reservation.pk, user_id=user_id)
+            for handler in handlers
+        ])
+        transaction.on_commit(notify_reservation_event_workers)
+        return jobs
+
+
+class ReservationEventJob(models.Model):
+    """
+    A call of a reservation event handler, made by the process_reservation_events worker
+    """
+    CONFIRMED = 'confirmed'
+    MODIFIED = 'modified'
+    CANCELLED = 'cancelled'
+    EVENT_CHOICES = (
+        (CONFIRMED, _('confirmed')),
+        (MODIFIED, _('modified')),
+        (CANCELLED, _('cancelled')),
+    )
+
+    PENDING = 'pending'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATE_CHOICES = (
+        (PENDING, _('pending')),
+        (DONE, _('done')),
+        (FAILED, _('failed')),
+    )
+
+    event = models.CharField(verbose_name=_('Event'), max_length=16, choices=EVENT_CHOICES)
+    handler = models.CharField(verbose_name=_('Handler'), max_length=100)
+    # not a foreign key, as the job outlives the reservation if it is deleted
+    reservation_id = models.IntegerField(verbose_name=_('Reservation'))
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, verbose_name=_('User'), null=True, blank=True, related_name='+',
+        on_delete=models.SET_NULL
+    )
+
+    state = models.CharField(verbose_name=_('State'), max_length=16, choices=STATE_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(verbose_name=_('Attempts'), default=0)
+    last_error = models.TextField(verbose_name=_('Last error'), blank=True)
+    created_at = models.DateTimeField(verbose_name=_('Created at'), auto_now_add=True)
+    run_after = models.DateTimeField(verbose_name=_('Run after'), default=timezone.now)
+    finished_at = models.DateTimeField(verbose_name=_('Finished at'), null=True, blank=True)
+
+    objects = ReservationEventJobQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = _('Reservation event job')
+        verbose_name_plural = _('Reservation event jobs')
+        indexes = [
+            models.Index(fields=['state', 'run_after']),
+            models.Index(fields=['reservation_id', 'handler']),
+        ]
+
+    def __str__(self):
+        return '%s %s of reservation %s (%s)' % (self.handler, self.event, self.reservation_id, self.state)
+
+    def run(self):
+        """
+        Call the handler and record the outcome
+
+        Failed jobs are retried with an exponential backoff until
+        RESPA_RESERVATION_EVENTS_MAX_ATTEMPTS is reached. Returns True on success.
+        """
+        self.attempts += 1
+        try:
+            handler = get_reservation_event_handler(self.event, self.handler)
+            if handler is None:
+                raise Exception('Unknown %s reservation event handler %s' % (self.event, self.handler))
+            reservation = Reservation.objects.select_related('resource', 'user').filter(pk=self.reservation_id).first()
+            if reservation is not None:
+                # a savepoint, so that the changes of a failing handler are rolled back
+                with transaction.atomic():
+                    handler.func(reservation, self.user)
+        except Exception as e:
+            logger.warning('Reservation event job %s failed: %s' % (self.pk, e))
+            self.last_error = str(e)
+            if self.attempts >= settings.RESPA_RESERVATION_EVENTS_MAX_ATTEMPTS:
+                self.state = self.FAILED
+                self.finished_at = timezone.now()
+            else:
+                self.run_after = timezone.now() + datetime.timedelta(minutes=2 ** self.attempts)
+            self.save(update_fields=('attempts', 'last_error', 'state', 'run_after', 'finished_at'))
+            return False
+
+        self.state = self.DONE
+        self.finished_at = timezone.now()
+        self.save(update_fields=('attempts', 'state', 'finished_at'))
+        return True
@@ -4,6 +4,7 @@
 import datetime
 import pytz
 import mimetypes
+from contextlib import contextmanager
 
 from django.utils import timezone
 import django.contrib.postgres.fields as pgfields
@@ -13,18 +14,25 @@
 from django.utils.timezone import now
 from django.utils.translation import ugettext_lazy as _
 from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
 from django.db.models import Q
+from django.db.models.signals import post_save
 from psycopg2.extras import DateTimeTZRange
 
-from notifications.models import NotificationTemplate, NotificationTemplateException, NotificationType
+from notifications.models import (
+    NotificationTemplate, NotificationTemplateException, NotificationType, render_bulk_notification
+)
 from resources.signals import (
     reservation_modified, reservation_confirmed, reservation_cancelled
 )
+from ..auth import is_general_admin
 from .base import ModifiableModel
+from .gistindex import GistIndex
 from .resource import generate_access_code, validate_access_code
-from .resource import Resource
+from .resource import Resource, ResourceFreeInterval
+from .unit import get_managed_unit_ids
 from .utils import (
-    get_dt, save_dt, is_valid_time_slot, humanize_duration, send_respa_mail,
+    get_dt, save_dt, is_valid_time_slot, humanize_duration, send_respa_mail, send_respa_bulk_mail,
     DEFAULT_LANG, localize_datetime, format_dt_range, build_reservations_ical_file
 )
 
@@ -39,6 +47,9 @@
                             'number_of_participants', 'participants', 'reserver_email_address', 'host_name',
                             'reservation_extra_questions')
 
+# Exclusion constraint preventing overlapping active reservations of a resource
+RESERVATION_OVERLAP_CONSTRAINT = 'resources_reservation_no_overlap'
+
 
 class ReservationQuerySet(models.QuerySet):
     def current(self):
@@ -61,6 +72,24 @@ def for_date(self, date):
         end_dt = start_dt + datetime.timedelta(days=1)
         return self.overlaps(start_dt, end_dt)
 
+    def prefetch_for_notifications(self):
+        """
+        Load everything get_notification_context() needs along with the reservations
+
+        The order lines and log entries of orders are the only relations that
+        need queries of their own, and those are run once for the whole
+        queryset.
+        """
+        return self.select_related(
+            'user', 'resource__unit', 'cancel_reason__category', 'custom_price', 'order'
+        ).prefetch_related('order__order_lines__product', 'order__log_entries')
+
+    def resource_visible_for(self, user):
+        # the same rules as in ResourceQuerySet.visible_for, but without a subquery on resources
+        if is_general_admin(user):
+            return self
+        return self.filter(Q(resource__public=True) | Q(resource__unit__in=get_managed_unit_ids(user)))
+
     def extra_fields_visible(self, user):
         # the following logic is also implemented in Reservation.are_extra_fields_visible()
         # so if this is changed that probably needs to be changed as well
@@ -110,8 +139,8 @@ class Reservation(ModifiableModel):
                                  on_delete=models.PROTECT)
     begin = models.DateTimeField(verbose_name=_('Begin time'))
     end = models.DateTimeField(verbose_name=_('End time'))
-    duration = pgfields.DateTimeRangeField(verbose_name=_('Length of reservation'), null=True,
-                                           blank=True, db_index=True)
+    # set from begin and end on save; the overlap constraint of the resource is on it
+    duration = pgfields.DateTimeRangeField(verbose_name=_('Length of reservation'), blank=True, db_index=True)
     comments = models.TextField(null=True, blank=True, verbose_name=_('Comments'))
     user = models.ForeignKey(settings.AUTH_USER_MODEL, verbose_name=_('User'), null=True,
                              blank=True, db_index=True, on_delete=models.PROTECT)
@@ -161,6 +190,20 @@ class Meta:
         verbose_name = _("reservation")
         verbose_name_plural = _("reservations")
         ordering = ('id',)
+        indexes = [
+            # cursor pagination and exports of the reservation list
+            models.Index(fields=['begin', 'id']),
+            # reservations of resources in a time range, see ReservationQuerySet.current()
+            models.Index(fields=['resource', 'end'], name='resources_r_resourc_e8d78d_idx',
+                         condition=~Q(state__in=('cancelled', 'denied'))),
+            # active reservations of a user
+            models.Index(fields=['user', 'end']),
+            # availability queries of timetools
+            GistIndex(fields=['duration']),
+        ]
+        # The active reservations of a resource may not overlap. This is enforced
+        # with the RESERVATION_OVERLAP_CONSTRAINT exclusion constraint, which is
+        # managed in the migrations as Django 2.2 cannot declare it here.
 
     def _save_dt(self, attr, dt):
         """
@@ -369,18 +412,17 @@ def clean(self, **kwargs):
 
         # Check that begin and end times are on valid time slots.
         opening_hours = self.resource.get_opening_hours(self.begin.date(), self.end.date())
-        for dt in (self.begin, self.end):
-            days = opening_hours.get(dt.date(), [])
-            day = next((day for day in days if day['opens'] is not None and day['opens'] <= dt <= day['closes']), None)
-            if day and not is_valid_time_slot(dt, self.resource.slot_size, day['opens']):
-                raise ValidationError(_("Begin and end time must match time slots"), code='invalid_time_slot')
+        self._validate_time_slots(opening_hours)
 
         # Check if Unit has disallow_overlapping_reservations value of True
         if (
             self.resource.unit.disallow_overlapping_reservations and not
             self.resource.can_create_overlapping_reservations(user)
         ):
-            reservations_for_same_unit = Reservation.objects.filter(user=user, resource__unit=self.resource.unit)
+            # all the overlapping reservations end after this one begins, which limits the index scan
+            reservations_for_same_unit = Reservation.objects.filter(
+                user=user, resource__unit=self.resource.unit, end__gt=self.begin
+            )
             valid_reservations_for_same_unit = reservations_for_same_unit.exclude(state=Reservation.CANCELLED)
             user_has_conflicting_reservations = valid_reservations_for_same_unit.filter(
                 Q(begin__gt=self.begin, begin__lt=self.end)
@@ -396,8 +438,22 @@ def clean(self, **kwargs):
 
         original_reservation = self if self.pk else kwargs.get('original_reservation', None)
         if self.resource.check_reservation_collision(self.begin, self.end, original_reservation):
-            raise ValidationError(_("The resource is already reserved for some of the period"))
+            raise ValidationError(_("The resource is already reserved for some of the period"),
+                                  code='reservation_collision')
+
+        self._validate_length(user_is_admin)
+
+        if self.access_code:
+            validate_access_code(self.access_code, self.resource.access_code_type)
+
+    def _validate_time_slots(self, opening_hours):
+        for dt in (self.begin, self.end):
+            days = opening_hours.get(dt.date(), [])
+            day = next((day for day in days if day['opens'] is not None and day['opens'] <= dt <= day['closes']), None)
+            if day and not is_valid_time_slot(dt, self.resource.slot_size, day['opens']):
+                raise ValidationError(_("Begin and end time must match time slots"), code='invalid_time_slot')
 
+    def _validate_length(self, user_is_admin):
         if not user_is_admin:
             if (self.end - self.begin) < self.resource.min_period:
                 raise ValidationError(_("The minimum reservation length is %(min_period)s") %
@@ -407,10 +463,7 @@ def clean(self, **kwargs):
                 raise ValidationError(_("The minimum reservation length is %(slot_size)s") %
                                       {'slot_size': humanize_duration(self.resource.slot_size)})
 
-        if self.access_code:
-            validate_access_code(self.access_code, self.resource.access_code_type)
-
-    def get_notification_context(self, language_code, user=None, notification_type=None):
+    def get_notification_context(self, language_code, user=None, notification_type=None, series=None):
         if not user:
             user = self.user
         with translation.override(language_code):
@@ -430,6 +483,12 @@ def get_notification_context(self, language_code, user=None, notification_type=N
                 'reserver_name': reserver_name,
                 'reserver_email_address': reserver_email_address,
             }
+            if series is not None:
+                context['reservations'] = [{
+                    'begin': localize_datetime(reservation.begin),
+                    'end': localize_datetime(reservation.end),
+                    'time_range': reservation.format_time(),
+                } for reservation in series]
             directly_included_fields = (
                 'number_of_participants',
                 'host_name',
@@ -468,20 +527,11 @@ def get_notification_context(self, language_code, user=None, notification_type=N
             elif notification_type in [NotificationType.RESERVATION_WAITING_FOR_PAYMENT]:
                 context['payment_url'] = self.order.payment_url
 
-            # Get last main and ground plan images. Normally there shouldn't be more than one of each
-            # of those images.
-            images = self.resource.images.filter(type__in=('main', 'ground_plan')).order_by('-sort_order')
-            main_image = next((i for i in images if i.type == 'main'), None)
-            ground_plan_image = next((i for i in images if i.type == 'ground_plan'), None)
-
-            if main_image:
-                main_image_url = main_image.get_full_url()
-                if main_image_url:
-                    context['resource_main_image_url'] = main_image_url
-            if ground_plan_image:
-                ground_plan_image_url = ground_plan_image.get_full_url()
-                if ground_plan_image_url:
-                    context['resource_ground_plan_image_url'] = ground_plan_image_url
+            image_urls = self.resource.get_notification_image_urls()
+            if 'main' in image_urls:
+                context['resource_main_image_url'] = image_urls['main']
+            if 'ground_plan' in image_urls:
+                context['resource_ground_plan_image_url'] = image_urls['ground_plan']
 
             order = getattr(self, 'order', None)
             if order:
@@ -489,29 +539,24 @@ def get_notification_context(self, language_code, user=None, notification_type=N
 
         return context
 
-    def send_reservation_mail(self, notification_type, user=None, attachments=None):
+    def send_reservation_mail(self, notification_type, user=None, attachments=None, series=None):
         """
         Stuff common to all reservation related mails.
 
-        If user isn't given use self.user.
+        If user isn't given use self.user. If the reservation is the first one
+        of a series, the whole series may be given to list it in the mail.
         """
         try:
             notification_template = NotificationTemplate.objects.get(type=notification_type)
         except NotificationTemplate.DoesNotExist:
             return
 
-        if getattr(self, 'order', None) and self.billing_email_address:
-            email_address = self.billing_email_address
-        elif user:
-            email_address = user.email
-        else:
-            if not (self.reserver_email_address or self.user):
-                return
-            email_address = self.reserver_email_address or self.user.email
-            user = self.user
+        email_address, user = self._get_notification_recipient(user)
+        if not email_address:
+            return
 
         language = user.get_preferred_language() if user else DEFAULT_LANG
-        context = self.get_notification_context(language, notification_type=notification_type)
+        context = self.get_notification_context(language, notification_type=notification_type, series=series)
 
         try:
             rendered_notification = notification_template.render(context, language)
@@ -527,15 +572,51 @@ def send_reservation_mail(self, notification_type, user=None, attachments=None):
             attachments
         )
 
-    def send_reservation_requested_mail(self):
-        self.send_reservation_mail(NotificationType.RESERVATION_REQUESTED)
+    def _get_notification_recipient(self, user=None):
+        if getattr(self, 'order', None) and self.billing_email_address:
+            return self.billing_email_address, user
+        if user:
+            return user.email, user
+        if not (self.reserver_email_address or self.user):
+            return None, None
+        return self.reserver_email_address or self.user.email, self.user
+
+    def send_reservation_bulk_mail(self, notification_type, users, series=None):
+        """
+        Send the same reservation mail to many users
+
+        The notification context is built and the template rendered once per
+        language instead of once per user.
+        """
+        try:
+            notification_template = NotificationTemplate.objects.get(type=notification_type)
+        except NotificationTemplate.DoesNotExist:
+            return
+
+        recipients = []
+        for user in users:
+            email_address, user = self._get_notification_recipient(user)
+            recipients.append((email_address, user.get_preferred_language()))
 
-    def send_reservation_requested_mail_to_officials(self):
-        notify_users = self.resource.get_users_with_perm('can_approve_reservation')
+        def get_context(language):
+            return self.get_notification_context(language, notification_type=notification_type, series=series)
+
+        try:
+            rendered_notifications = render_bulk_notification(notification_template, recipients, get_context)
+        except NotificationTemplateException as e:
+            logger.error(e, exc_info=True, extra={'notification_type': notification_type})
+            return
+
+        send_respa_bulk_mail(rendered_notifications)
+
+    def send_reservation_requested_mail(self, series=None):
+        self.send_reservation_mail(NotificationType.RESERVATION_REQUESTED, series=series)
+
+    def send_reservation_requested_mail_to_officials(self, series=None):
+        notify_users = list(self.resource.get_users_with_perm('can_approve_reservation'))
         if len(notify_users) > 100:
             raise Exception("Refusing to notify more than 100 users (%s)" % self)
-        for user in notify_users:
-            self.send_reservation_mail(NotificationType.RESERVATION_REQUESTED_OFFICIAL, user=user)
+        self.send_reservation_bulk_mail(NotificationType.RESERVATION_REQUESTED_OFFICIAL, notify_users, series=series)
 
     def send_reservation_denied_mail(self):
         self.send_reservation_mail(NotificationType.RESERVATION_DENIED)
@@ -587,6 +668,51 @@ def get_resource_email_attachments(self):
     def send_access_code_created_mail(self):
         self.send_reservation_mail(NotificationType.RESERVATION_ACCESS_CODE_CREATED)
 
+    def send_reservation_series_created_mails(self, series):
+        """
+        Send the mails of a newly created series of reservations once for the whole series
+
+        The mails are those set_state() sends for a single reservation, rendered
+        for the first reservation of the series with all the reservations listed
+        in the `reservations` context variable and in the calendar attachment.
+
+        :type series: list[Reservation]
+        """
+        if self.state == Reservation.REQUESTED:
+            self.send_reservation_requested_mail(series=series)
+            self.send_reservation_requested_mail_to_officials(series=series)
+            return
+        if self.state != Reservation.CONFIRMED:
+            return
+
+        if self.need_manual_confirmation():
+            notification_type = NotificationType.RESERVATION_CONFIRMED
+        elif self.access_code:
+            notification_type = NotificationType.RESERVATION_CREATED_WITH_ACCESS_CODE
+        elif not (self.user is not None and self.user.is_staff):
+            notification_type = NotificationType.RESERVATION_CREATED
+        else:
+            return
+        ical_file = build_reservations_ical_file(series)
+        attachments = [('reservation.ics', ical_file, 'text/calendar')] + self.get_resource_email_attachments()
+        self.send_reservation_mail(notification_type, attachments=attachments, series=series)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored time range, so that the free intervals it
+        # covered can be updated if the reservation is moved.
+        instance._stored_time_range = (instance.__dict__.get('begin'), instance.__dict__.get('end'))
+        return instance
+
+    def _update_free_intervals(self):
+        to_python = self._meta.get_field('begin').to_python
+        times = [to_python(self.begin), to_python(self.end)]
+        times += [dt for dt in getattr(self, '_stored_time_range', ()) if dt is not None]
+        times = [dt if timezone.is_aware(dt) else timezone.make_aware(dt) for dt in times]
+        ResourceFreeInterval.objects.rebuild(self.resource, min(times), max(times))
+        self._stored_time_range = (times[0], times[1])
+
     def save(self, *args, **kwargs):
         self.duration = DateTimeTZRange(self.begin, self.end, '[)')
 
@@ -595,7 +721,140 @@ def save(self, *args, **kwargs):
             if self.resource.is_access_code_enabled() and self.resource.generate_access_codes:
                 self.access_code = generate_access_code(access_code_type)
 
-        return super().save(*args, **kwargs)
+        ret = super().save(*args, **kwargs)
+        self._update_free_intervals()
+        return ret
+
+    def delete(self, *args, **kwargs):
+        ret = super().delete(*args, **kwargs)
+        self._update_free_intervals()
+        return ret
+
+
+def is_reservation_collision(error):
+    """
+    Check if the IntegrityError was raised by the reservation overlap constraint
+
+    :type error: django.db.IntegrityError
+    :rtype: bool
+    """
+    diag = getattr(error.__cause__, 'diag', None)
+    return getattr(diag, 'constraint_name', None) == RESERVATION_OVERLAP_CONSTRAINT
+
+
+@contextmanager
+def reservation_collision_check():
+    """
+    Turn overlapping reservations saved in the block into a ValidationError
+
+    The block is run in a savepoint, so that the transaction can be used
+    after a collision. Reservations can then be saved without locking the
+    resource first, as the database rejects concurrent overlapping ones.
+    """
+    try:
+        with transaction.atomic():
+            yield
+    except IntegrityError as e:
+        if not is_reservation_collision(e):
+            raise
+        raise ValidationError(_("The resource is already reserved for some of the period"),
+                              code='reservation_collision')
+
+
+def get_reservation_series_errors(series, user):
+    """
+    Check the restrictions of Reservation.clean for a series of new reservations
+
+    The reservations must be of the same resource and must not overlap each
+    other. Each must end after it begins, which is checked before any query.
+    The opening hours and the existing reservations are fetched once
+    for the whole series. Returns the list of error messages of each
+    reservation.
+
+    :type series: list[Reservation]
+    :type user: users.models.User
+    :rtype: list[list[str]]
+    """
+    time_error = _("You must end the reservation after it has begun")
+    valid_series = [reservation for reservation in series if reservation.end > reservation.begin]
+    if not valid_series:
+        return [[time_error] for reservation in series]
+
+    resource = series[0].resource
+    begin = min(reservation.begin for reservation in valid_series)
+    end = max(reservation.end for reservation in valid_series)
+    user_is_admin = user and resource.is_admin(user)
+
+    opening_hours = resource.get_opening_hours(begin.date(), end.date())
+    reserved = list(
+        resource.reservations.filter(duration__overlap=(begin, end, '[)')).active().values_list('begin', 'end')
+    )
+    reserved_by_user = []
+    if resource.unit.disallow_overlapping_reservations and not resource.can_create_overlapping_reservations(user):
+        reserved_by_user = list(
+            Reservation.objects.filter(user=user, resource__unit=resource.unit, end__gt=begin, begin__lt=end)
+            .exclude(state=Reservation.CANCELLED).values_list('begin', 'end')
+        )
+
+    return [
+        _get_series_reservation_errors(reservation, opening_hours, reserved, reserved_by_user, user_is_admin)
+        if reservation.end > reservation.begin else [time_error]
+        for reservation in series
+    ]
+
+
+def _get_series_reservation_errors(reservation, opening_hours, reserved, reserved_by_user, user_is_admin):
+    errors = []
+    try:
+        reservation._validate_time_slots(opening_hours)
+    except ValidationError as e:
+        errors += e.messages
+    if any(reservation.begin < other_end and other_begin < reservation.end
+           for other_begin, other_end in reserved_by_user):
+        errors.append(_('This unit does not allow overlapping reservations for its resources'))
+    if any(reservation.begin < other_end and other_begin < reservation.end for other_begin, other_end in reserved):
+        errors.append(_("The resource is already reserved for some of the period"))
+    try:
+        reservation._validate_length(user_is_admin)
+    except ValidationError as e:
+        errors += e.messages
+    return errors
+
+
+def create_reservation_series(series, user):
+    """
+    Save a validated series of new reservations of a resource
+
+    The reservations are saved with a single query, so the work Reservation.save
+    and set_state would do for each of them is done here for the whole series.
+    A collision with a concurrently saved reservation raises a ValidationError.
+
+    :type series: list[Reservation]
+    :type user: users.models.User
+    """
+    resource = series[0].resource
+    for reservation in series:
+        reservation.duration = DateTimeTZRange(reservation.begin, reservation.end, '[)')
+        if not reservation.access_code:
+            if resource.is_access_code_enabled() and resource.generate_access_codes:
+                reservation.access_code = generate_access_code(resource.access_code_type)
+        if reservation.state == Reservation.CONFIRMED:
+            reservation.approver = user
+
+    with reservation_collision_check():
+        Reservation.objects.bulk_create(series)
+    ResourceFreeInterval.objects.rebuild(
+        resource, min(reservation.begin for reservation in series), max(reservation.end for reservation in series)
+    )
+
+    for reservation in series:
+        reservation._stored_time_range = (reservation.begin, reservation.end)
+        # bulk_create doesn't send post_save, which e.g. the Exchange sync relies on
+        post_save.send(sender=Reservation, instance=reservation, created=True, update_fields=None, raw=False,
+                       using=Reservation.objects.db)
+        if reservation.state == Reservation.CONFIRMED:
+            reservation_confirmed.send(sender=Reservation, instance=reservation, user=user)
+    series[0].send_reservation_series_created_mails(series)
 
 
 class ReservationMetadataField(models.Model):
@@ -1,4 +1,5 @@
 import datetime
+import itertools
 import os
 import re
 import pytz
@@ -8,8 +9,12 @@
 import arrow
 import django.db.models as dbm
 from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast
 from django.apps import apps
 from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
 from django.contrib.gis.db import models
 from django.core.exceptions import ValidationError
 from django.core.files.base import ContentFile
@@ -26,18 +31,20 @@
 from psycopg2.extras import DateTimeTZRange
 from image_cropping import ImageRatioField
 from PIL import Image
-from guardian.shortcuts import get_objects_for_user, get_users_with_perms
+from guardian.models import GroupObjectPermission, UserObjectPermission
+from guardian.shortcuts import get_objects_for_user
 from guardian.core import ObjectPermissionChecker
 
 from ..auth import is_authenticated_user, is_general_admin, is_superuser
 from ..errors import InvalidImage
 from ..fields import EquipmentField
+from ..middleware import get_request_cache
 from .accessibility import AccessibilityValue, AccessibilityViewpoint, ResourceAccessibility
 from .base import AutoIdentifiedModel, NameIdentifiedModel, ModifiableModel
 from .utils import create_datetime_days_from_now, get_translated, get_translated_name, humanize_duration
 from .equipment import Equipment
-from .unit import Unit
-from .availability import get_opening_hours
+from .unit import Unit, get_managed_unit_ids
+from .availability import Day, Period, combine_datetime, get_opening_hours, subtract_intervals
 from .permissions import RESOURCE_GROUP_PERMISSIONS, UNIT_ROLE_PERMISSIONS
 from ..enums import UnitAuthorizationLevel, UnitGroupAuthorizationLevel
 
@@ -82,6 +89,185 @@ def determine_hours_time_range(begin, end, tz):
     return begin, end
 
 
+def get_available_hours_range(start, end):
+    today = arrow.get(timezone.now())
+    if start is None:
+        start = today.floor('day').naive
+    if end is None:
+        end = today.replace(days=+1).floor('day').naive
+    if not start.tzinfo and not end.tzinfo:
+        # Only try to localize naive dates
+        tz = timezone.get_current_timezone()
+        start = tz.localize(start)
+        end = tz.localize(end)
+    return start, end
+
+
+def get_open_windows(opening_hours, start, end):
+    """
+    Returns the opening hours clipped to the given range as a sorted list of (opens, closes) tuples
+
+    :type opening_hours: dict[datetime.date, list[dict[str, datetime.datetime]]]
+    :type start: datetime.datetime
+    :type end: datetime.datetime
+    :rtype: list[tuple[datetime.datetime, datetime.datetime]]
+    """
+    windows = []
+    for open_during_date in opening_hours.values():
+        for period in open_during_date:
+            if not period['opens']:
+                continue
+            # if the start or end straddle opening hours
+            opens = max(period['opens'], start)
+            closes = min(period['closes'], end)
+            if opens < closes:
+                windows.append((opens, closes))
+    return sorted(windows)
+
+
+def calculate_available_hours(windows, reservations, duration=None, reservation=None):
+    """
+    Returns the unreserved hours within the given windows
+
+    Both the windows and the reservations need to be sorted by their beginning.
+    They are swept through in a single pass, so that every window is only
+    compared with the reservations that overlap it.
+
+    :type windows: list[tuple[datetime.datetime, datetime.datetime]]
+    :type reservations: iterable[Reservation]
+    :type duration: datetime.timedelta
+    :type reservation: Reservation
+    :rtype: list[dict[str, datetime.datetime]]
+    """
+    # skip the reservation that is being edited
+    reservations = [res for res in reservations if res != reservation]
+    # reservations may overlap each other, so track the latest end seen so far
+    # to know when all the reservations up to an index are in the past
+    max_ends = list(itertools.accumulate((res.end for res in reservations), max))
+
+    hours_list = []
+    first = 0
+    for opens, closes in windows:
+        while first < len(reservations) and max_ends[first] < opens:
+            first += 1
+        window_reservations = []
+        i = first
+        while i < len(reservations) and reservations[i].begin <= closes:
+            if reservations[i].end >= opens:
+                window_reservations.append(reservations[i])
+            i += 1
+        hours_list.extend(_calculate_window_available_hours(opens, closes, window_reservations, duration))
+    return hours_list
+
+
+def _calculate_window_available_hours(start, end, reservations, duration):
+    hours_list = [({'starts': start})]
+    first_checked = False
+    for res in reservations:
+        # check if the reservation spans the beginning
+        if not first_checked:
+            first_checked = True
+            if res.begin < start:
+                if res.end > end:
+                    return []
+                hours_list[0]['starts'] = res.end
+                # proceed to the next reservation
+                continue
+        if duration:
+            if res.begin - hours_list[-1]['starts'] < duration:
+                # the free period is too short, discard this period
+                hours_list[-1]['starts'] = res.end
+                continue
+        hours_list[-1]['ends'] = timezone.localtime(res.begin)
+        # check if the reservation spans the end
+        if res.end > end:
+            return hours_list
+        hours_list.append({'starts': timezone.localtime(res.end)})
+    # after the last reservation, we must check if the remaining free period is too short
+    if duration:
+        if end - hours_list[-1]['starts'] < duration:
+            hours_list.pop()
+            return hours_list
+    # otherwise add the remaining free period
+    hours_list[-1]['ends'] = end
+    return hours_list
+
+
+def get_available_hours_for_resources(resources, start=None, end=None, duration=None, during_closing=False):
+    """
+    Returns the available hours of several resources at once
+
+    Works like Resource.get_available_hours, but the number of queries made
+    does not depend on the number of resources. Returns a dict of resource
+    ids to available hours.
+
+    :type resources: iterable[Resource]
+    :type start: datetime.datetime
+    :type end: datetime.datetime
+    :type duration: datetime.timedelta
+    :type during_closing: bool
+    :rtype: dict[str, list[dict[str, datetime.datetime]]]
+    """
+    from .reservation import Reservation
+
+    if isinstance(resources, models.QuerySet):
+        resources = resources.select_related('unit')
+    resources = list(resources)
+    start, end = get_available_hours_range(start, end)
+
+    reservations = Reservation.objects.filter(
+        resource__in=resources, end__gte=start, begin__lte=end
+    ).order_by('begin')
+    reservations_by_resource = {}
+    for res in reservations:
+        reservations_by_resource.setdefault(res.resource_id, []).append(res)
+
+    if not during_closing:
+        opening_hours_cache = get_opening_hours_cache(resources, start, end)
+
+    hours_by_resource = {}
+    for resource in resources:
+        if during_closing:
+            windows = [(start, end)]
+        else:
+            opening_hours = resource.get_opening_hours(start, end, opening_hours_cache[resource.id])
+            windows = get_open_windows(opening_hours, start, end)
+        resource_reservations = reservations_by_resource.get(resource.id, [])
+        hours_by_resource[resource.id] = calculate_available_hours(windows, resource_reservations, duration)
+    return hours_by_resource
+
+
+def get_opening_hours_cache(resources, begin=None, end=None):
+    """
+    Fetch the daily opening hours of several resources in a single query
+
+    The resources may belong to units in different time zones. Returns a dict
+    of resource ids to lists of ResourceDailyOpeningHours objects, suitable
+    for passing as opening_hours_cache to Resource.get_opening_hours.
+
+    :type resources: list[Resource]
+    :type begin: datetime.date | datetime.datetime
+    :type end: datetime.date | datetime.datetime
+    :rtype: dict[str, list[ResourceDailyOpeningHours]]
+    """
+    ids_by_time_zone = {}
+    hours_by_resource = {}
+    for resource in resources:
+        ids_by_time_zone.setdefault(resource.unit.time_zone, []).append(resource.id)
+        hours_by_resource[resource.id] = []
+    if not hours_by_resource:
+        return hours_by_resource
+
+    query = Q()
+    for time_zone, resource_ids in ids_by_time_zone.items():
+        tz_begin, tz_end = determine_hours_time_range(begin, end, pytz.timezone(time_zone))
+        query |= Q(resource__in=resource_ids, open_between__overlap=(tz_begin, tz_end, '[)'))
+
+    for obj in ResourceDailyOpeningHours.objects.filter(query):
+        hours_by_resource[obj.resource_id].append(obj)
+    return hours_by_resource
+
+
 class ResourceType(ModifiableModel, AutoIdentifiedModel):
     MAIN_TYPES = (
         ('space', _('Space')),
@@ -139,11 +325,46 @@ def __str__(self):
         return get_translated_name(self)
 
 
+def get_perm_object_ids(user, perm):
+    """
+    Return the ids of the units and resource groups where the user has the given permission
+
+    The unit ids are None when the permission applies to all units. The result
+    is memoized for the duration of the current request.
+
+    :type user: users.models.User
+    :type perm: str
+    :rtype: (set[str] | None, set[int])
+    """
+    request_cache = get_request_cache()
+    cache_key = ('perm_object_ids', user.pk, perm)
+    if request_cache is not None and cache_key in request_cache:
+        return request_cache[cache_key]
+
+    units_where_role = Unit.objects.by_roles(user, UNIT_ROLE_PERMISSIONS.get(perm))
+    if not units_where_role.query.has_filters():
+        unit_ids = None
+    else:
+        unit_ids = set(units_where_role.values_list('id', flat=True))
+        unit_ids.update(
+            get_objects_for_user(user, 'unit:%s' % perm, klass=Unit, with_superuser=False).values_list('id', flat=True)
+        )
+    resource_group_ids = set(
+        get_objects_for_user(user, 'group:%s' % perm, klass=ResourceGroup, with_superuser=False)
+        .values_list('id', flat=True)
+    )
+
+    result = (unit_ids, resource_group_ids)
+    if request_cache is not None:
+        request_cache[cache_key] = result
+    return result
+
+
 class ResourceQuerySet(models.QuerySet):
     def visible_for(self, user):
         if is_general_admin(user):
             return self
-        is_in_managed_units = Q(unit__in=Unit.objects.managed_by(user))
+        is_in_managed_units = Q(unit__in=get_managed_unit_ids(user))
         is_public = Q(public=True)
         return self.filter(is_in_managed_units | is_public)
 
@@ -154,19 +375,79 @@ def modifiable_by(self, user):
         if is_general_admin(user):
             return self
 
-        units = Unit.objects.managed_by(user)
-        return self.filter(unit__in=units)
+        return self.filter(unit__in=get_managed_unit_ids(user))
 
     def with_perm(self, perm, user):
-        units = get_objects_for_user(user, 'unit:%s' % perm, klass=Unit,
-                                     with_superuser=False)
-        resource_groups = get_objects_for_user(user, 'group:%s' % perm, klass=ResourceGroup,
-                                               with_superuser=False)
+        unit_ids, resource_group_ids = get_perm_object_ids(user, perm)
 
-        allowed_roles = UNIT_ROLE_PERMISSIONS.get(perm)
-        units_where_role = Unit.objects.by_roles(user, allowed_roles)
+        if unit_ids is None:
+            query = Q(unit__isnull=False)
+        else:
+            query = Q(unit__in=unit_ids)
+        if resource_group_ids:
+            group_resources = ResourceGroup.resources.through.objects.filter(resourcegroup__in=resource_group_ids)
+            query |= Q(id__in=group_resources.values('resource'))
 
-        return self.filter(Q(unit__in=list(units) + list(units_where_role)) | Q(groups__in=resource_groups)).distinct()
+        return self.filter(query)
+
+    def with_free_slot(self, begin, end, period):
+        """
+        Filter resources that have at least `period` of free time between `begin` and `end`.
+
+        Free time means time during opening hours that is not covered by any current
+        reservation. Everything is computed inside PostgreSQL with range operators, so
+        the number of queries does not depend on the number of resources.
+
+        :type begin: datetime.datetime
+        :type end: datetime.datetime
+        :type period: datetime.timedelta
+        """
+        from .reservation import Reservation
+
+        sql = FREE_SLOT_SQL.format(
+            hours_table=ResourceDailyOpeningHours._meta.db_table,
+            reservation_table=Reservation._meta.db_table,
+        )
+        inactive_states = (Reservation.CANCELLED, Reservation.DENIED)
+        params = [begin, end, begin, end] + 3 * list(inactive_states) + [period]
+        return self.filter(id__in=RawSQL(sql, params))
+
+
+# Candidate gaps start either at the beginning of an opening hours window (clipped
+# to the requested range) or at the end of a reservation inside that window. A gap
+# is free when no reservation covers its start, and it lasts until the next
+# reservation begins or the window closes, whichever comes first.
+FREE_SLOT_SQL = """
+SELECT w.resource_id
+FROM (
+    SELECT h.resource_id, h.open_between * tstzrange(%s, %s, '[)') AS slot
+    FROM {hours_table} h
+    WHERE h.open_between && tstzrange(%s, %s, '[)')
+) w
+CROSS JOIN LATERAL (
+    SELECT lower(w.slot) AS gap_start
+    UNION
+    SELECT upper(r.duration)
+    FROM {reservation_table} r
+    WHERE r.resource_id = w.resource_id AND r.state NOT IN (%s, %s) AND r.duration && w.slot
+) s
+WHERE NOT isempty(w.slot)
+    AND s.gap_start >= lower(w.slot) AND s.gap_start < upper(w.slot)
+    AND NOT EXISTS (
+        SELECT 1
+        FROM {reservation_table} r
+        WHERE r.resource_id = w.resource_id AND r.state NOT IN (%s, %s) AND r.duration @> s.gap_start
+    )
+    AND LEAST(
+        (
+            SELECT min(lower(r.duration))
+            FROM {reservation_table} r
+            WHERE r.resource_id = w.resource_id AND r.state NOT IN (%s, %s)
+                AND r.duration && w.slot AND lower(r.duration) > s.gap_start
+        ),
+        upper(w.slot)
+    ) - s.gap_start >= %s
+"""
 
 
 class Attachment(ModifiableModel, AutoIdentifiedModel):
@@ -293,6 +574,37 @@ def main_image(self):
 
         return resource_image.image if resource_image else None
 
+    def get_notification_image_urls(self):
+        """
+        Return the full urls of the main and ground plan images of the resource
+
+        The ids of the images are memoized for the duration of the current
+        request, so building many notifications for the same resource doesn't
+        query the images each time. The signal handlers in
+        resources.signal_handlers forget them when the images of the resource
+        change.
+
+        :rtype: dict[str, str]
+        """
+        request_cache = get_request_cache()
+        cache_key = ('notification_image_ids', self.pk)
+        if request_cache is not None and cache_key in request_cache:
+            image_ids = request_cache[cache_key]
+        else:
+            # Get last main and ground plan images. Normally there shouldn't be more than one of each
+            # of those images.
+            images = self.images.filter(type__in=('main', 'ground_plan')).order_by('sort_order')
+            image_ids = dict(images.values_list('type', 'id'))
+            if request_cache is not None:
+                request_cache[cache_key] = image_ids
+
+        image_urls = {}
+        for image_type, image_id in image_ids.items():
+            image_url = get_resource_image_full_url(image_id)
+            if image_url:
+                image_urls[image_type] = image_url
+        return image_urls
+
     def validate_reservation_period(self, reservation, user, data=None):
         """
         Check that given reservation if valid for given user.
@@ -368,7 +680,8 @@ def validate_max_reservations_per_user(self, user):
                 raise ValidationError(_("Maximum number of active reservations for this resource exceeded."))
 
     def check_reservation_collision(self, begin, end, reservation):
-        overlapping = self.reservations.filter(end__gt=begin, begin__lt=end).active()
+        # the overlap is checked with the duration, so that the index of the reservation overlap constraint is used
+        overlapping = self.reservations.filter(duration__overlap=(begin, end, '[)')).active()
         if reservation:
             overlapping = overlapping.exclude(pk=reservation.pk)
         return overlapping.exists()
@@ -391,73 +704,42 @@ def get_available_hours(self, start=None, end=None, duration=None, reservation=N
         :type reservation: Reservation
         :type during_closing: bool
         """
-        today = arrow.get(timezone.now())
-        if start is None:
-            start = today.floor('day').naive
-        if end is None:
-            end = today.replace(days=+1).floor('day').naive
-        if not start.tzinfo and not end.tzinfo:
-            """
-            Only try to localize naive dates
-            """
-            tz = timezone.get_current_timezone()
-            start = tz.localize(start)
-            end = tz.localize(end)
+        start, end = get_available_hours_range(start, end)
 
-        if not during_closing:
-            """
-            Check open hours only
-            """
-            open_hours = self.get_opening_hours(start, end)
-            hours_list = []
-            for date, open_during_date in open_hours.items():
-                for period in open_during_date:
-                    if period['opens']:
-                        # if the start or end straddle opening hours
-                        opens = period['opens'] if period['opens'] > start else start
-                        closes = period['closes'] if period['closes'] < end else end
-                        # include_closed to prevent recursion, opening hours need not be rechecked
-                        hours_list.extend(self.get_available_hours(start=opens,
-                                                                   end=closes,
-                                                                   duration=duration,
-                                                                   reservation=reservation,
-                                                                   during_closing=True))
-            return hours_list
+        if during_closing:
+            windows = [(start, end)]
+        else:
+            windows = get_open_windows(self.get_opening_hours(start, end), start, end)
+
+        reservations = self.reservations.filter(end__gte=start, begin__lte=end).order_by('begin')
+        return calculate_available_hours(windows, reservations, duration, reservation)
+
+    def get_free_hours(self, start, end, duration=None, free_intervals_cache=None):
+        """
+        Returns the hours the resource is open but not reserved between start and end
+
+        Unlike get_available_hours, this is based on the precalculated free
+        intervals of the resource. Returns the hours in the same format as
+        get_available_hours.
+
+        :rtype: list[dict[str, datetime.datetime]]
+        :type start: datetime.datetime
+        :type end: datetime.datetime
+        :type duration: datetime.timedelta
+        :type free_intervals_cache: list[ResourceFreeInterval]
+        """
+        if free_intervals_cache is None:
+            free_intervals = self.free_intervals.filter(free_between__overlap=(start, end, '[)'))
+        else:
+            free_intervals = free_intervals_cache
 
-        reservations = self.reservations.filter(
-            end__gte=start, begin__lte=end).order_by('begin')
-        hours_list = [({'starts': start})]
-        first_checked = False
-        for res in reservations:
-            # skip the reservation that is being edited
-            if res == reservation:
+        hours_list = []
+        for free_interval in sorted(free_intervals, key=lambda x: x.free_between.lower):
+            starts = max(free_interval.free_between.lower, start)
+            ends = min(free_interval.free_between.upper, end)
+            if starts >= ends or (duration and ends - starts < duration):
                 continue
-            # check if the reservation spans the beginning
-            if not first_checked:
-                first_checked = True
-                if res.begin < start:
-                    if res.end > end:
-                        return []
-                    hours_list[0]['starts'] = res.end
-                    # proceed to the next reservation
-                    continue
-            if duration:
-                if res.begin - hours_list[-1]['starts'] < duration:
-                    # the free period is too short, discard this period
-                    hours_list[-1]['starts'] = res.end
-                    continue
-            hours_list[-1]['ends'] = timezone.localtime(res.begin)
-            # check if the reservation spans the end
-            if res.end > end:
-                return hours_list
-            hours_list.append({'starts': timezone.localtime(res.end)})
-        # after the last reservation, we must check if the remaining free period is too short
-        if duration:
-            if end - hours_list[-1]['starts'] < duration:
-                hours_list.pop()
-                return hours_list
-        # otherwise add the remaining free period
-        hours_list[-1]['ends'] = end
+            hours_list.append({'starts': timezone.localtime(starts), 'ends': timezone.localtime(ends)})
         return hours_list
 
     def get_opening_hours(self, begin=None, end=None, opening_hours_cache=None):
@@ -493,62 +775,17 @@ def get_opening_hours(self, begin=None, end=None, opening_hours_cache=None):
 
         return opening_hours
 
-    def update_opening_hours(self):
-        hours = self.opening_hours.order_by('open_between')
-        existing_hours = {}
-        for h in hours:
-            assert h.open_between.lower not in existing_hours
-            existing_hours[h.open_between.lower] = h.open_between.upper
-
-        unit_periods = list(self.unit.periods.all())
-        resource_periods = list(self.periods.all())
-
-        # Periods set for the resource always carry a higher priority. If
-        # nothing is defined for the resource for a given day, use the
-        # periods configured for the unit.
-        for period in unit_periods:
-            period.priority = 0
-        for period in resource_periods:
-            period.priority = 1
-
-        earliest_date = None
-        latest_date = None
-        all_periods = unit_periods + resource_periods
-        for period in all_periods:
-            if earliest_date is None or period.start < earliest_date:
-                earliest_date = period.start
-            if latest_date is None or period.end > latest_date:
-                latest_date = period.end
-
-        # Assume we delete everything, but remove items from the delete
-        # list if the hours are identical.
-        to_delete = existing_hours
-        to_add = {}
-        if all_periods:
-            hours = get_opening_hours(self.unit.time_zone, all_periods,
-                                      earliest_date, latest_date)
-            for hours_items in hours.values():
-                for h in hours_items:
-                    if not h['opens'] or not h['closes']:
-                        continue
-                    if h['opens'] in to_delete and h['closes'] == to_delete[h['opens']]:
-                            del to_delete[h['opens']]
-                            continue
-                    to_add[h['opens']] = h['closes']
-
-        if to_delete:
-            ret = ResourceDailyOpeningHours.objects.filter(
-                open_between__in=[(opens, closes, '[)') for opens, closes in to_delete.items()],
-                resource=self
-            ).delete()
-            assert ret[0] == len(to_delete)
-
-        add_objs = [
-            ResourceDailyOpeningHours(resource=self, open_between=(opens, closes, '[)'))
-            for opens, closes in to_add.items()
-        ]
-        if add_objs:
-            ResourceDailyOpeningHours.objects.bulk_create(add_objs)
+    def update_opening_hours(self, start=None, end=None):
+        """
+        Recalculate the daily opening hours of the resource from the periods
+
+        If start and end dates are given, only the opening hours of the days
+        between them are recalculated.
+
+        :type start: datetime.date | None
+        :type end: datetime.date | None
+        """
+        update_resources_opening_hours(self.unit, [self], start, end)
 
     def is_admin(self, user):
         """
@@ -559,6 +796,9 @@ def is_admin(self, user):
         """
         # UserFilterBackend and ReservationFilterSet in resources.api.reservation assume the same behaviour,
         # so if this is changed those need to be changed as well.
+        resolver = self._get_permission_resolver(user)
+        if resolver:
+            return resolver.is_admin(self)
         if not self.unit:
             return is_general_admin(user)
         return self.unit.is_admin(user)
@@ -570,6 +810,9 @@ def is_manager(self, user):
         :type user: users.models.User
         :rtype: bool
         """
+        resolver = self._get_permission_resolver(user)
+        if resolver:
+            return resolver.is_manager(self)
         if not self.unit:
             return False
         return self.unit.is_manager(user)
@@ -581,14 +824,29 @@ def is_viewer(self, user):
         :type user: users.models.User
         :rtype: bool
         """
+        resolver = self._get_permission_resolver(user)
+        if resolver:
+            return resolver.is_viewer(self)
         if not self.unit:
             return False
         return self.unit.is_viewer(user)
 
+    def _get_permission_resolver(self, user):
+        # A PermissionResolver may be attached to the resource when
+        # permissions are preloaded for a whole page of resources.
+        resolver = getattr(self, '_permission_resolver', None)
+        if resolver and resolver.is_for_user(user):
+            return resolver
+        return None
+
     def _has_perm(self, user, perm, allow_admin=True):
         if not is_authenticated_user(user):
             return False
 
+        resolver = self._get_permission_resolver(user)
+        if resolver:
+            return resolver.has_perm(self, perm, allow_admin)
+
         if (self.is_admin(user) and allow_admin) or user.is_superuser:
             return True
 
@@ -624,10 +882,28 @@ def _has_role_perm(self, user, perm):
         return is_allowed
 
     def get_users_with_perm(self, perm):
-        users = {u for u in get_users_with_perms(self.unit) if u.has_perm('unit:%s' % perm, self.unit)}
-        for rg in self.groups.all():
-            users |= {u for u in get_users_with_perms(rg) if u.has_perm('group:%s' % perm, rg)}
-        return users
+        """
+        Return the active users who have the given permission to the unit or a resource group of this resource
+
+        The permission may be granted to the user directly or through one of
+        their groups. The users are fetched with a single query.
+        """
+        resource_group_pks = ResourceGroup.resources.through.objects.filter(resource=self).annotate(
+            group_pk=Cast('resourcegroup_id', models.CharField())
+        ).values('group_pk')
+        granted = Q(
+            content_type=ContentType.objects.get_for_model(Unit),
+            permission__codename='unit:%s' % perm,
+            object_pk=str(self.unit_id),
+        ) | Q(
+            content_type=ContentType.objects.get_for_model(ResourceGroup),
+            permission__codename='group:%s' % perm,
+            object_pk__in=resource_group_pks,
+        )
+        return get_user_model().objects.filter(is_active=True).filter(
+            Q(id__in=UserObjectPermission.objects.filter(granted).values('user')) |
+            Q(groups__in=GroupObjectPermission.objects.filter(granted).values('group'))
+        ).distinct()
 
     def can_make_reservations(self, user):
         return self.reservable or self._has_perm(user, 'can_make_reservations')
@@ -740,6 +1016,19 @@ def clean(self):
             raise ValidationError({'min_period': _('This value must be a multiple of slot_size')})
 
 
+def get_resource_image_full_url(image_id):
+    base_url = getattr(settings, 'RESPA_IMAGE_BASE_URL', None)
+    if not base_url:
+        return None
+    return base_url.rstrip('/') + reverse('resource-image-view', args=[str(image_id)])
+
+
+def invalidate_notification_image_ids(resource_id):
+    request_cache = get_request_cache()
+    if request_cache is not None:
+        request_cache.pop(('notification_image_ids', resource_id), None)
+
+
 class ResourceImage(ModifiableModel):
     TYPES = (
         ('main', _('Main photo')),
@@ -818,10 +1107,7 @@ def _process_image(self):
             self.image_format = img.format
 
     def get_full_url(self):
-        base_url = getattr(settings, 'RESPA_IMAGE_BASE_URL', None)
-        if not base_url:
-            return None
-        return base_url.rstrip('/') + reverse('resource-image-view', args=[str(self.id)])
+        return get_resource_image_full_url(self.id)
 
     def __str__(self):
         return "%s image for %s" % (self.get_type_display(), str(self.resource))
@@ -896,3 +1182,270 @@ def __str__(self):
             lower = self.open_between.lower
             upper = self.open_between.upper
         return "%s: %s -> %s" % (self.resource, lower, upper)
+
+
+class ResourceFreeIntervalQuerySet(models.QuerySet):
+    def rebuild(self, resource, begin=None, end=None):
+        """
+        Recalculate the free intervals of a resource
+
+        If begin and end are given, only the opening hours overlapping that
+        range are recalculated. Returns the number of free intervals created.
+
+        :type resource: Resource
+        :type begin: datetime.datetime | None
+        :type end: datetime.datetime | None
+        """
+        if begin is not None:
+            return self.rebuild_many({resource: (begin, end)})
+
+        hours = ResourceDailyOpeningHours.objects.filter(resource=resource)
+        open_ranges = [(r.lower, r.upper) for r in hours.values_list('open_between', flat=True)]
+        self.filter(resource=resource).delete()
+
+        free_intervals = calculate_free_intervals(resource, open_ranges)
+        self.bulk_create([
+            ResourceFreeInterval(resource=resource, free_between=(lower, upper, '[)'))
+            for lower, upper in free_intervals
+        ])
+        return len(free_intervals)
+
+    def rebuild_many(self, ranges):
+        """
+        Recalculate the free intervals of several resources at once
+
+        Only the opening hours of each resource overlapping the range given
+        for it are recalculated. The number of queries does not depend on the
+        number of resources. Returns the number of free intervals created.
+
+        :type ranges: dict[Resource, tuple[datetime.datetime, datetime.datetime]]
+        """
+        ranges = {resource.id: times for resource, times in ranges.items()}
+        if not ranges:
+            return 0
+
+        open_ranges = {resource_id: [] for resource_id in ranges}
+        hours = ResourceDailyOpeningHours.objects.filter(
+            resource__in=list(ranges),
+            open_between__overlap=(min(b for b, e in ranges.values()), max(e for b, e in ranges.values()), '[)'),
+        )
+        for resource_id, open_between in hours.values_list('resource_id', 'open_between'):
+            begin, end = ranges[resource_id]
+            if open_between.lower < end and begin < open_between.upper:
+                open_ranges[resource_id].append((open_between.lower, open_between.upper))
+
+        # free intervals are always calculated for whole opening hours
+        for resource_id, (begin, end) in ranges.items():
+            ranges[resource_id] = (
+                min([begin] + [lower for lower, upper in open_ranges[resource_id]]),
+                max([end] + [upper for lower, upper in open_ranges[resource_id]]),
+            )
+        existing = Q()
+        for resource_id, (begin, end) in ranges.items():
+            existing |= Q(resource=resource_id, free_between__overlap=(begin, end, '[)'))
+        self.filter(existing).delete()
+
+        reserved = {resource_id: [] for resource_id in ranges}
+        reservations = apps.get_model('resources', 'Reservation').objects.current().filter(
+            resource__in=list(ranges),
+            end__gt=min(b for b, e in ranges.values()),
+            begin__lt=max(e for b, e in ranges.values()),
+        )
+        for resource_id, begin, end in reservations.values_list('resource_id', 'begin', 'end'):
+            reserved[resource_id].append((begin, end))
+
+        free_intervals = [
+            ResourceFreeInterval(resource_id=resource_id, free_between=(lower, upper, '[)'))
+            for resource_id, resource_open_ranges in open_ranges.items()
+            for lower, upper in subtract_intervals(resource_open_ranges, reserved[resource_id])
+        ]
+        self.bulk_create(free_intervals)
+        return len(free_intervals)
+
+
+def _get_resource_opening_hours(unit, unit_hours, periods, begin_date, end_date, days):
+    """
+    Apply the periods of a resource on top of the opening hours of its unit
+
+    :type unit: Unit
+    :type unit_hours: dict[datetime.date, list[dict]]
+    :type periods: list[Period]
+    :type begin_date: datetime.date
+    :type end_date: datetime.date
+    :type days: list[Day]
+    :rtype: dict[datetime.date, list[dict]]
+    """
+    resource_hours = dict(unit_hours)
+    if not periods:
+        return resource_hours
+    for period in periods:
+        period.priority = 1
+    period_begin = max(begin_date, min(period.start for period in periods))
+    period_end = min(end_date, max(period.end for period in periods))
+    if period_begin <= period_end:
+        overrides = get_opening_hours(unit.time_zone, periods, period_begin, period_end, days=days)
+        for date, day_hours in overrides.items():
+            if any(period.start <= date <= period.end for period in periods):
+                resource_hours[date] = day_hours
+    return resource_hours
+
+
+def _diff_opening_hours(existing_hours, resource_hours):
+    """
+    Compare calculated opening hours against the stored ones
+
+    Returns the stored hours that are no longer valid, as a dict of opening
+    time to (hours id, closing time), and the hours that need to be created,
+    as a dict of opening time to closing time.
+
+    :type existing_hours: dict[datetime.datetime, tuple[int, datetime.datetime]]
+    :type resource_hours: dict[datetime.date, list[dict]]
+    """
+    # Assume we delete everything, but remove items from the delete
+    # list if the hours are identical.
+    to_delete = dict(existing_hours)
+    to_add = {}
+    for hours_items in resource_hours.values():
+        for h in hours_items:
+            if not h['opens'] or not h['closes']:
+                continue
+            if h['opens'] in to_delete and h['closes'] == to_delete[h['opens']][1]:
+                del to_delete[h['opens']]
+                continue
+            to_add[h['opens']] = h['closes']
+    return to_delete, to_add
+
+
+def _get_existing_opening_hours(resources, tz, start, end):
+    """
+    Fetch the stored opening hours of resources between the given dates
+
+    Returns a dict of resource id to a dict of opening time to
+    (hours id, closing time).
+
+    :type resources: list[Resource]
+    :type tz: datetime.tzinfo
+    :type start: datetime.date | None
+    :type end: datetime.date | None
+    :rtype: dict[str, dict[datetime.datetime, tuple[int, datetime.datetime]]]
+    """
+    hours = ResourceDailyOpeningHours.objects.filter(resource__in=resources)
+    if start is not None:
+        hours = hours.filter(open_between__startswith__gte=combine_datetime(start, datetime.time.min, tz))
+    if end is not None:
+        end_datetime = combine_datetime(end + datetime.timedelta(days=1), datetime.time.min, tz)
+        hours = hours.filter(open_between__startswith__lt=end_datetime)
+    existing_hours = {resource.id: {} for resource in resources}
+    for hours_id, resource_id, open_between in hours.values_list('id', 'resource_id', 'open_between'):
+        assert open_between.lower not in existing_hours[resource_id]
+        existing_hours[resource_id][open_between.lower] = (hours_id, open_between.upper)
+    return existing_hours
+
+
+def update_resources_opening_hours(unit, resources, start=None, end=None):
+    """
+    Recalculate the daily opening hours of resources of a unit
+
+    The schedule of the unit is calculated once and the periods of each
+    resource are applied on top of it. The result is compared against the
+    stored opening hours of all the resources at once, so that only the hours
+    that changed are deleted and created.
+
+    If start and end dates are given, only the opening hours of the days
+    between them are recalculated.
+
+    :type unit: Unit
+    :type resources: list[Resource]
+    :type start: datetime.date | None
+    :type end: datetime.date | None
+    """
+    resources = list(resources)
+    if not resources:
+        return
+
+    unit_periods = list(unit.periods.all())
+    resource_periods = {}
+    for period in Period.objects.filter(resource__in=resources):
+        resource_periods.setdefault(period.resource_id, []).append(period)
+    all_periods = unit_periods + list(itertools.chain.from_iterable(resource_periods.values()))
+    days = list(Day.objects.filter(period__in=all_periods))
+
+    # Periods set for the resource always carry a higher priority. If
+    # nothing is defined for the resource for a given day, use the
+    # periods configured for the unit.
+    for period in unit_periods:
+        period.priority = 0
+
+    begin_date, end_date = start, end
+    if all_periods:
+        begin_date = start or min(period.start for period in all_periods)
+        end_date = end or max(period.end for period in all_periods)
+
+    unit_hours = {}
+    if unit_periods and begin_date <= end_date:
+        unit_hours = get_opening_hours(unit.time_zone, unit_periods, begin_date, end_date, days=days)
+
+    existing_hours = _get_existing_opening_hours(resources, unit.get_tz(), start, end)
+
+    delete_ids = []
+    add_objs = []
+    changed_ranges = {}
+    for resource in resources:
+        resource_hours = _get_resource_opening_hours(
+            unit, unit_hours, resource_periods.get(resource.id, []), begin_date, end_date, days
+        )
+        to_delete, to_add = _diff_opening_hours(existing_hours[resource.id], resource_hours)
+
+        delete_ids += [hours_id for hours_id, closes in to_delete.values()]
+        add_objs += [
+            ResourceDailyOpeningHours(resource=resource, open_between=(opens, closes, '[)'))
+            for opens, closes in to_add.items()
+        ]
+        changed = [(opens, closes) for opens, (hours_id, closes) in to_delete.items()] + list(to_add.items())
+        if changed:
+            changed_ranges[resource] = (
+                min(opens for opens, closes in changed), max(closes for opens, closes in changed)
+            )
+
+    if delete_ids:
+        ResourceDailyOpeningHours.objects.filter(id__in=delete_ids).delete()
+    if add_objs:
+        ResourceDailyOpeningHours.objects.bulk_create(add_objs)
+
+    ResourceFreeInterval.objects.rebuild_many(changed_ranges)
+
+
+def calculate_free_intervals(resource, open_ranges):
+    """
+    Calculate the times during the given opening hours the resource is not reserved
+
+    :type resource: Resource
+    :type open_ranges: list[tuple[datetime.datetime, datetime.datetime]]
+    :rtype: list[tuple[datetime.datetime, datetime.datetime]]
+    """
+    if not open_ranges:
+        return []
+    begin = min(lower for lower, upper in open_ranges)
+    end = max(upper for lower, upper in open_ranges)
+    reservations = resource.reservations.current().filter(end__gt=begin, begin__lt=end)
+    return subtract_intervals(open_ranges, reservations.values_list('begin', 'end'))
+
+
+class ResourceFreeInterval(models.Model):
+    """
+    Calculated automatically for each time period the resource is open but not reserved
+    """
+    resource = models.ForeignKey(
+        Resource, related_name='free_intervals', on_delete=models.CASCADE, db_index=True
+    )
+    free_between = DateTimeRangeField()
+
+    objects = ResourceFreeIntervalQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            GistIndex(fields=['free_between'])
+        ]
+
+    def __str__(self):
+        return "%s: %s -> %s" % (self.resource, self.free_between.lower, self.free_between.upper)
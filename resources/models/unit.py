@@ -1,6 +1,8 @@
 import pytz
 from django.conf import settings
+from django.core.cache import cache
 from django.contrib.gis.db import models
+from django.db import transaction
 from django.db.models import Q
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
@@ -8,6 +10,7 @@
 
 from ..auth import is_authenticated_user, is_general_admin, is_unit_admin, is_unit_manager, is_unit_viewer, is_superuser
 from ..enums import UnitAuthorizationLevel, UnitGroupAuthorizationLevel
+from ..middleware import get_request_cache
 from .base import AutoIdentifiedModel, ModifiableModel
 from .utils import create_datetime_days_from_now, get_translated, get_translated_name
 from .availability import get_opening_hours
@@ -16,22 +19,77 @@
 from munigeo.models import Municipality
 
 
-class UnitQuerySet(models.QuerySet):
-    def managed_by(self, user):
-        if not is_authenticated_user(user):
-            return self.none()
+MANAGED_UNIT_IDS_CACHE_KEY = 'resources:managed_unit_ids:%s'
 
-        if is_general_admin(user):
-            return self
 
+def get_managed_unit_ids(user):
+    """
+    Return the ids of the units the user can manage
+
+    Those are the units where the user is at least a manager, and the member
+    units of unit groups the user administers. The result is kept in the
+    Django cache, which must be shared by all the processes, and memoized for
+    the duration of the current request. It is invalidated by the signal
+    handlers in resources.signal_handlers whenever the authorizations of the
+    user or the members of their unit groups change.
+
+    :type user: users.models.User
+    :rtype: set[str]
+    """
+    if not is_authenticated_user(user):
+        return set()
+
+    request_cache = get_request_cache()
+    request_cache_key = ('managed_unit_ids', user.pk)
+    if request_cache is not None and request_cache_key in request_cache:
+        return request_cache[request_cache_key]
+
+    cache_key = MANAGED_UNIT_IDS_CACHE_KEY % user.pk
+    unit_ids = cache.get(cache_key)
+    if unit_ids is None:
         via_unit_group = Q(
             unit_groups__authorizations__in=(
                 user.unit_group_authorizations.admin_level()))
         via_unit = Q(
             authorizations__in=(
                 user.unit_authorizations.at_least_manager_level()))
+        unit_ids = set(Unit.objects.filter(via_unit_group | via_unit).values_list('id', flat=True))
+        cache.set(cache_key, unit_ids, settings.RESPA_MANAGED_UNITS_CACHE_TIMEOUT)
+    if request_cache is not None:
+        request_cache[request_cache_key] = unit_ids
+    return unit_ids
 
-        return self.filter(via_unit_group | via_unit).distinct()
+
+def invalidate_managed_unit_ids(user_ids):
+    """
+    Forget the managed unit ids of the given users
+
+    The ids are dropped right away for the rest of the transaction, and again
+    once it commits, because other processes may have cached the old ids in
+    between.
+
+    :type user_ids: iterable[int]
+    """
+    user_ids = set(user_ids)
+    request_cache = get_request_cache()
+    if request_cache is not None:
+        for user_id in user_ids:
+            request_cache.pop(('managed_unit_ids', user_id), None)
+
+    cache_keys = [MANAGED_UNIT_IDS_CACHE_KEY % user_id for user_id in user_ids]
+    cache.delete_many(cache_keys)
+    transaction.on_commit(lambda: cache.delete_many(cache_keys))
+
+
+class UnitQuerySet(models.QuerySet):
+    def managed_by(self, user):
+        if not is_authenticated_user(user):
+            return self.none()
+
+        if is_general_admin(user):
+            return self
+
+        return self.filter(id__in=get_managed_unit_ids(user))
 
     def by_roles(self, user, roles):
         if not is_authenticated_user(user) or not roles:
@@ -130,9 +188,15 @@ def get_opening_hours(self, begin=None, end=None):
         """
         return get_opening_hours(self.time_zone, list(self.periods.all()), begin, end)
 
-    def update_opening_hours(self):
-        for res in self.resources.all():
-            res.update_opening_hours()
+    def update_opening_hours(self, start=None, end=None):
+        """
+        Recalculate the daily opening hours of all the resources of the unit
+
+        :type start: datetime.date | None
+        :type end: datetime.date | None
+        """
+        from .resource import update_resources_opening_hours
+        update_resources_opening_hours(self, self.resources.all(), start, end)
 
     def get_tz(self):
         return pytz.timezone(self.time_zone)
@@ -144,15 +208,13 @@ def get_reservable_after(self):
         return create_datetime_days_from_now(self.reservable_min_days_in_advance)
 
     def is_admin(self, user):
-        return is_authenticated_user(user) and (
-            is_general_admin(user) or
-            is_unit_admin(user.unit_authorizations.all(), user.unit_group_authorizations.all(), self))
+        return is_authenticated_user(user) and (is_general_admin(user) or is_unit_admin(user, self))
 
     def is_manager(self, user):
-        return is_authenticated_user(user) and is_unit_manager(user.unit_authorizations.all(), self)
+        return is_authenticated_user(user) and is_unit_manager(user, self)
 
     def is_viewer(self, user):
-        return is_authenticated_user(user) and is_unit_viewer(user.unit_authorizations.all(), self)
+        return is_authenticated_user(user) and is_unit_viewer(user, self)
 
     def has_imported_data(self):
         return self.data_source != ''
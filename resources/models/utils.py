@@ -1,6 +1,7 @@
 import base64
 import datetime
 import struct
+import tempfile
 import time
 import io
 import logging
@@ -9,7 +10,6 @@
 from django.conf import settings
 from django.utils import formats
 from django.utils.translation import ungettext
-from django.core.mail import EmailMultiAlternatives
 from django.contrib.sites.models import Site
 from django.utils.translation import ugettext_lazy as _
 from django.utils import timezone
@@ -18,6 +18,8 @@
 from icalendar import Calendar, Event, vDatetime, vText, vGeo
 import xlsxwriter
 
+from notifications.models import OutboxMessage
+
 
 DEFAULT_LANG = settings.LANGUAGES[0][0]
 
@@ -108,14 +110,33 @@ def send_respa_mail(email_address, subject, body, html_body=None, attachments=No
     from_address = (getattr(settings, 'RESPA_MAILS_FROM_ADDRESS', None) or
                     'noreply@%s' % Site.objects.get_current().domain)
 
-    notification_logger.info('Sending notification email to %s: "%s"' % (email_address, subject))
+    notification_logger.info('Queuing notification email to %s: "%s"' % (email_address, subject))
+
+    OutboxMessage.objects.enqueue(email_address, subject, body, html_body, attachments, from_address)
+
+
+def send_respa_bulk_mail(rendered_notifications, attachments=None):
+    """
+    Send a notification rendered for many recipients
+
+    :param rendered_notifications: (email address, rendered notification) tuples
+    :type rendered_notifications: list[(str, dict)]
+    """
+    if not getattr(settings, 'RESPA_MAILS_ENABLED', False) or not rendered_notifications:
+        return
+
+    from_address = (getattr(settings, 'RESPA_MAILS_FROM_ADDRESS', None) or
+                    'noreply@%s' % Site.objects.get_current().domain)
 
-    text_content = body
-    msg = EmailMultiAlternatives(subject, text_content, from_address, [email_address], attachments=attachments)
-    if html_body:
-        msg.attach_alternative(html_body, 'text/html')
+    notification_logger.info('Queuing %d notification emails: "%s"' % (
+        len(rendered_notifications), rendered_notifications[0][1]['subject']
+    ))
 
-    msg.send()
+    OutboxMessage.objects.enqueue_many([
+        dict(email_address=email_address, subject=rendered['subject'], body=rendered['body'],
+             html_body=rendered['html_body'], attachments=attachments, from_address=from_address)
+        for email_address, rendered in rendered_notifications
+    ])
 
 
 def generate_reservation_xlsx(reservations):
@@ -134,10 +155,35 @@ def generate_reservation_xlsx(reservations):
 
     :rtype: bytes
     """
-    from resources.models import Reservation, RESERVATION_EXTRA_FIELDS
-
     output = io.BytesIO()
     workbook = xlsxwriter.Workbook(output)
+    _write_reservation_worksheet(workbook, reservations)
+    workbook.close()
+    return output.getvalue()
+
+
+def generate_reservation_xlsx_file(reservations):
+    """
+    Write reservations in Excel xlsx format to a temporary file
+
+    Takes the same dicts as generate_reservation_xlsx, but the rows are
+    written in XlsxWriter's constant memory mode, so the reservations can
+    be an iterator of any length without the memory use growing with it.
+
+    :return: the file, positioned at its start
+    :rtype: file
+    """
+    output = tempfile.TemporaryFile()
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+    _write_reservation_worksheet(workbook, reservations)
+    workbook.close()
+    output.seek(0)
+    return output
+
+
+def _write_reservation_worksheet(workbook, reservations):
+    from resources.models import Reservation, RESERVATION_EXTRA_FIELDS
+
     worksheet = workbook.add_worksheet()
 
     headers = [
@@ -174,8 +220,6 @@ def generate_reservation_xlsx(reservations):
         for i, field in enumerate(RESERVATION_EXTRA_FIELDS, 8):
             if field in reservation:
                 worksheet.write(row, i, reservation[field])
-    workbook.close()
-    return output.getvalue()
 
 
 def get_object_or_none(cls, **kwargs):
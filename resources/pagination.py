@@ -1,17 +1,116 @@
-from rest_framework.pagination import PageNumberPagination, _positive_int
+from collections import OrderedDict
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class StableCursorPagination(CursorPagination):
+    """
+    Cursor pagination over a fixed, indexed ordering
+
+    The ordering requested by the client is ignored, as a cursor needs an
+    ordering that doesn't change between the pages.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def get_ordering(self, request, queryset, view):
+        return self.ordering
+
+
+class ReservationCursorPagination(StableCursorPagination):
+    ordering = ('begin', 'id')
+
+
+class ResourceCursorPagination(StableCursorPagination):
+    ordering = ('id',)
 
 
 class DefaultPagination(PageNumberPagination):
     page_size = 20
     page_size_query_param = 'page_size'  # Allow client to override, using `?page_size=xxx
     max_page_size = 500
+    count_query_param = 'count'  # Allow client to skip counting the results, using `?count=false`
+    # Switched to when the client passes the cursor parameter, starting with an empty `?cursor=`
+    cursor_pagination_class = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if self.cursor_pagination_class:
+            cursor_paginator = self.cursor_pagination_class()
+            if cursor_paginator.cursor_query_param in request.query_params:
+                self.cursor_paginator = cursor_paginator
+                return cursor_paginator.paginate_queryset(queryset, request, view)
+
+        if request.query_params.get(self.count_query_param, '').lower() in ('false', '0'):
+            return self.paginate_queryset_without_count(queryset, request, view)
+
+        self.has_next = None
+        return super().paginate_queryset(queryset, request, view)
+
+    def paginate_queryset_without_count(self, queryset, request, view=None):
+        """
+        Paginate without running COUNT(*) over the queryset
+
+        One extra object is fetched to find out whether there is a next page.
+        """
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        try:
+            self.page_number = _positive_int(request.query_params.get(self.page_query_param, 1), strict=True)
+        except ValueError:
+            raise NotFound(self.invalid_page_message.format(page_number='', message='Invalid page.'))
+
+        self.request = request
+        offset = (self.page_number - 1) * page_size
+        objects = list(queryset[offset:offset + page_size + 1])
+        self.has_next = len(objects) > page_size
+        self.display_page_controls = False
+        return objects[:page_size]
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator:
+            return self.cursor_paginator.get_paginated_response(data)
+        if self.has_next is None:
+            return super().get_paginated_response(data)
+
+        url = self.request.build_absolute_uri()
+        next_url = replace_query_param(url, self.page_query_param, self.page_number + 1) if self.has_next else None
+        if self.page_number == 1:
+            previous_url = None
+        elif self.page_number == 2:
+            previous_url = remove_query_param(url, self.page_query_param)
+        else:
+            previous_url = replace_query_param(url, self.page_query_param, self.page_number - 1)
+        return Response(OrderedDict([
+            ('count', None),
+            ('next', next_url),
+            ('previous', previous_url),
+            ('results', data)
+        ]))
+
+    def to_html(self):
+        if self.cursor_paginator:
+            return self.cursor_paginator.to_html()
+        return super().to_html()
 
 
 class PurposePagination(DefaultPagination):
     page_size = 40
 
 
+class ResourcePagination(DefaultPagination):
+    cursor_pagination_class = ResourceCursorPagination
+
+
 class ReservationPagination(DefaultPagination):
+    cursor_pagination_class = ReservationCursorPagination
+
     def get_page_size(self, request):
         if self.page_size_query_param:
             cutoff = self.max_page_size
@@ -0,0 +1,60 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from resources.auth import invalidate_unit_role_levels
+from resources.models import (
+    ReservationEventJob, ResourceImage, UnitAuthorization, UnitGroup, UnitGroupAuthorization
+)
+from resources.models.resource import invalidate_notification_image_ids
+from resources.models.unit import invalidate_managed_unit_ids
+from resources.signals import reservation_cancelled, reservation_confirmed, reservation_modified
+
+
+@receiver(post_save, sender=UnitAuthorization)
+@receiver(post_delete, sender=UnitAuthorization)
+@receiver(post_save, sender=UnitGroupAuthorization)
+@receiver(post_delete, sender=UnitGroupAuthorization)
+def handle_authorization_change(sender, instance, **kwargs):
+    invalidate_managed_unit_ids([instance.authorized_id])
+    invalidate_unit_role_levels([instance.authorized_id])
+
+
+@receiver(m2m_changed, sender=UnitGroup.members.through)
+def handle_unit_group_members_change(sender, instance, action, reverse, pk_set, **kwargs):
+    # The members are still there before a clear, so the affected groups can be found
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+
+    if not reverse:
+        unit_group_ids = [instance.pk]
+    elif pk_set is not None:
+        unit_group_ids = pk_set
+    else:
+        unit_group_ids = instance.unit_groups.values_list('id', flat=True)
+
+    user_ids = list(
+        UnitGroupAuthorization.objects.filter(subject__in=unit_group_ids).values_list('authorized', flat=True)
+    )
+    invalidate_managed_unit_ids(user_ids)
+    invalidate_unit_role_levels(user_ids)
+
+
+@receiver(post_save, sender=ResourceImage)
+@receiver(post_delete, sender=ResourceImage)
+def handle_resource_image_change(sender, instance, **kwargs):
+    invalidate_notification_image_ids(instance.resource_id)
+
+
+@receiver(reservation_confirmed)
+def handle_reservation_confirmed(sender, instance, user, **kwargs):
+    ReservationEventJob.objects.dispatch(ReservationEventJob.CONFIRMED, instance, user)
+
+
+@receiver(reservation_modified)
+def handle_reservation_modified(sender, instance, user, **kwargs):
+    ReservationEventJob.objects.dispatch(ReservationEventJob.MODIFIED, instance, user)
+
+
+@receiver(reservation_cancelled)
+def handle_reservation_cancelled(sender, instance, user, **kwargs):
+    ReservationEventJob.objects.dispatch(ReservationEventJob.CANCELLED, instance, user)
@@ -87,3 +87,36 @@ def test_avail_resource_scalability(client):
         response = client.get('/test/availability?start_date=2015-06-01&end_date=2015-06-30')
         end = datetime.now()
         perf_res_list.write(str(n) + ', ' + str(end - start) + '\n')
+
+
+@pytest.mark.skipif(not TEST_PERFORMANCE, reason="TEST_PERFORMANCE not enabled")
+@pytest.mark.django_db
+def test_available_between_with_period_scalability(api_client):
+    u1 = Unit.objects.create(name='Unit 1', id='unit_1', time_zone='Europe/Helsinki')
+    rt = ResourceType.objects.create(name='Type 1', id='type_1', main_type='space')
+    p1 = Period.objects.create(start='2015-06-01', end='2015-09-01', unit=u1, name='')
+    Day.objects.create(period=p1, weekday=0, opens='08:00', closes='22:00')
+    # leave a one hour gap in the middle of the day
+    reservation_times = (
+        ('2015-06-01T08:00:00+03:00', '2015-06-01T12:00:00+03:00'),
+        ('2015-06-01T13:00:00+03:00', '2015-06-01T22:00:00+03:00'),
+    )
+
+    perf_available_between = open('perf_available_between.csv', 'w')
+    perf_available_between.write('Free slot search\n')
+    perf_available_between.write('resources, time (s)\n')
+    for n in [1, 10, 100, 1000, 5000]:
+        Resource.objects.all().delete()
+        for i in range(n):
+            resource = Resource.objects.create(name=('Resource ' + str(i)), id=('r' + str(i)), unit=u1, type=rt)
+            for begin, end in reservation_times:
+                Reservation.objects.create(resource=resource, begin=begin, end=end)
+        u1.update_opening_hours()
+
+        start = datetime.now()
+        response = api_client.get('/v1/resource/', {
+            'available_between': '2015-06-01T08:00:00+03:00,2015-06-01T22:00:00+03:00,60'
+        })
+        end = datetime.now()
+        assert response.data['count'] == n
+        perf_available_between.write(str(n) + ', ' + str(end - start) + '\n')
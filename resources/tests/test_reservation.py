@@ -1,12 +1,22 @@
 import datetime
+from unittest import mock
+
 import pytest
 
 import arrow
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.contrib.contenttypes.models import ContentType
+from django.core import mail
 from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
 from django.utils.translation import activate
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.utils import timezone
 from freezegun import freeze_time
+from guardian.shortcuts import assign_perm
 
 from resources.enums import UnitAuthorizationLevel
 from resources.models import (
@@ -15,10 +25,14 @@
     Reservation,
     ReservationMetadataSet,
     Resource,
+    ResourceGroup,
     ResourceType,
     Unit,
     UnitAuthorization,
 )
+from resources.middleware import request_cache
+from resources.models.reservation import reservation_collision_check
+from resources.tests.utils import create_resource_image
 
 
 class ReservationTestCase(TestCase):
@@ -185,3 +199,132 @@ def test_admin_may_bypass_min_period(resource_with_opening_hours, user):
     with pytest.raises(ValidationError) as error:
         reservation.clean()
     assert error.value.code == 'invalid_time_slot'
+
+
+@pytest.mark.django_db
+@override_settings(RESPA_MAILS_ENABLED=True)
+def test_requested_mail_to_officials(resource_in_unit, user, django_assert_num_queries):
+    User = get_user_model()
+    official_group = Group.objects.create(name='officials')
+    assign_perm('unit:can_approve_reservation', official_group, resource_in_unit.unit)
+    resource_group = resource_in_unit.groups.create(identifier='rg1', name='rg1')
+
+    direct_official = User.objects.create(username='direct', email='direct@example.com', preferred_language='en')
+    assign_perm('unit:can_approve_reservation', direct_official, resource_in_unit.unit)
+    group_official = User.objects.create(username='group', email='group@example.com', preferred_language='fi')
+    group_official.groups.add(official_group)
+    resource_group_official = User.objects.create(
+        username='resource_group', email='resource_group@example.com', preferred_language='en'
+    )
+    assign_perm('group:can_approve_reservation', resource_group_official, resource_group)
+    inactive_official = User.objects.create(username='inactive', email='inactive@example.com', is_active=False)
+    assign_perm('unit:can_approve_reservation', inactive_official, resource_in_unit.unit)
+    assign_perm('unit:can_modify_reservations', user, resource_in_unit.unit)
+
+    # make sure the content types are cached
+    ContentType.objects.get_for_models(Unit, ResourceGroup)
+    with django_assert_num_queries(1):
+        officials = set(resource_in_unit.get_users_with_perm('can_approve_reservation'))
+    assert officials == {direct_official, group_official, resource_group_official}
+
+    reservation = Reservation.objects.create(
+        resource=resource_in_unit,
+        begin=arrow.get('2115-04-04T09:00:00+02:00').datetime,
+        end=arrow.get('2115-04-04T10:00:00+02:00').datetime,
+        user=user,
+        state=Reservation.REQUESTED,
+    )
+    mail.outbox = []
+    with mock.patch.object(Reservation, 'get_notification_context', autospec=True,
+                           side_effect=Reservation.get_notification_context) as get_context:
+        reservation.send_reservation_requested_mail_to_officials()
+
+    # the context is built once per language
+    assert sorted(call[0][1] for call in get_context.call_args_list) == ['en', 'fi']
+    assert sorted(message.to[0] for message in mail.outbox) == [
+        'direct@example.com', 'group@example.com', 'resource_group@example.com'
+    ]
+
+
+@pytest.mark.django_db
+@override_settings(RESPA_IMAGE_BASE_URL='https://example.com')
+def test_notification_context_queries(resource_in_unit, user, django_assert_num_queries):
+    main_image = create_resource_image(resource_in_unit, type='main')
+    ground_plan_image = create_resource_image(resource_in_unit, type='ground_plan')
+    for day in range(1, 4):
+        Reservation.objects.create(
+            resource=resource_in_unit,
+            begin=arrow.get('2115-04-0%sT09:00:00+02:00' % day).datetime,
+            end=arrow.get('2115-04-0%sT10:00:00+02:00' % day).datetime,
+            user=user,
+        )
+
+    with django_assert_num_queries(1):
+        reservations = list(Reservation.objects.filter(resource=resource_in_unit).prefetch_for_notifications())
+    with request_cache():
+        # the image urls are fetched only for the first reservation of the resource
+        with django_assert_num_queries(1):
+            contexts = [reservation.get_notification_context('fi') for reservation in reservations]
+
+        for context in contexts:
+            assert context['unit'] == resource_in_unit.unit.name
+            assert context['resource_main_image_url'] == main_image.get_full_url()
+            assert context['resource_ground_plan_image_url'] == ground_plan_image.get_full_url()
+
+        ground_plan_image.delete()
+        context = reservations[0].get_notification_context('fi')
+        assert context['resource_main_image_url'] == main_image.get_full_url()
+        assert 'resource_ground_plan_image_url' not in context
+
+
+@pytest.mark.django_db
+def test_overlapping_reservations_are_rejected(resource_in_unit, resource_in_unit2, user):
+    begin = arrow.get('2115-04-04T09:00:00+02:00').datetime
+    end = arrow.get('2115-04-04T10:00:00+02:00').datetime
+    reservation = Reservation.objects.create(resource=resource_in_unit, begin=begin, end=end, user=user)
+
+    with pytest.raises(ValidationError):
+        with reservation_collision_check():
+            Reservation.objects.create(
+                resource=resource_in_unit, begin=begin + datetime.timedelta(minutes=30), end=end, user=user
+            )
+
+    # other resources, adjacent times and cancelled reservations do not collide
+    with reservation_collision_check():
+        Reservation.objects.create(resource=resource_in_unit2, begin=begin, end=end, user=user)
+        Reservation.objects.create(resource=resource_in_unit, begin=end, end=end + datetime.timedelta(hours=1))
+        Reservation.objects.create(resource=resource_in_unit, begin=begin, end=end, state=Reservation.CANCELLED)
+
+    reservation.state = Reservation.DENIED
+    reservation.save()
+    with reservation_collision_check():
+        Reservation.objects.create(resource=resource_in_unit, begin=begin, end=end, user=user)
+    assert Reservation.objects.filter(resource=resource_in_unit).current().count() == 2
+
+
+@pytest.mark.django_db
+def test_resolve_overlapping_reservations_command(resource_in_unit, user):
+    # double bookings made before the constraint existed
+    with connection.cursor() as cursor:
+        cursor.execute('ALTER TABLE resources_reservation DROP CONSTRAINT resources_reservation_no_overlap')
+    begin = arrow.get('2115-04-04T09:00:00+02:00').datetime
+    end = arrow.get('2115-04-04T10:00:00+02:00').datetime
+    kept = Reservation.objects.create(resource=resource_in_unit, begin=begin, end=end, user=user)
+    overlapping = Reservation.objects.create(
+        resource=resource_in_unit, begin=begin + datetime.timedelta(minutes=30), end=end, user=user,
+        state=Reservation.CONFIRMED
+    )
+    adjacent = Reservation.objects.create(resource=resource_in_unit, begin=end, end=end + datetime.timedelta(hours=1))
+
+    with pytest.raises(CommandError) as exc_info:
+        call_command('resolve_overlapping_reservations')
+    assert '1 reservation(s)' in str(exc_info.value)
+    assert Reservation.objects.current().count() == 3
+
+    mail.outbox = []
+    call_command('resolve_overlapping_reservations', '--cancel')
+    assert Reservation.objects.get(id=overlapping.id).state == Reservation.CANCELLED
+    assert set(Reservation.objects.current().values_list('id', flat=True)) == {kept.id, adjacent.id}
+    # the reserver is told about the cancellation
+    assert len(mail.outbox) == 1
+    call_command('resolve_overlapping_reservations')
@@ -1,8 +1,14 @@
+import csv
+import io
+import json
 import os
 import pytest
 import datetime
 import re
+import threading
+import zipfile
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.urls import reverse
 from django.core import mail
 from django.core.files.uploadedfile import SimpleUploadedFile
@@ -13,6 +19,7 @@
 from icalendar import Calendar
 from parler.utils.context import switch_language
 from rest_framework.exceptions import ErrorDetail
+from rest_framework.test import APIClient
 
 from caterings.models import CateringOrder, CateringProvider
 
@@ -21,6 +28,7 @@
                               ReservationMetadataSet, UnitAuthorization, ReservationCancelReasonCategory,
                               ReservationCancelReason, Attachment)
 from notifications.models import NotificationTemplate, NotificationType
+from resources.api.reservation import iterate_reservation_values
 from notifications.tests.utils import check_received_mail_exists
 from .utils import check_disallowed_methods, assert_non_field_errors_contain, assert_response_objects, MAX_QUERIES
 
@@ -123,11 +131,11 @@ def reservation2(resource_in_unit2, user):
 
 @pytest.fixture
 def reservation3(resource_in_unit2, user2):
-    # the same as reservation2 but different user
+    # the same as reservation2 but different user and the following hour
     return Reservation.objects.create(
         resource=resource_in_unit2,
-        begin='2115-04-05T09:00:00+02:00',
-        end='2115-04-05T10:00:00+02:00',
+        begin='2115-04-05T10:00:00+02:00',
+        end='2115-04-05T11:00:00+02:00',
         user=user2,
         event_subject='not so fancy event',
         host_name='markku',
@@ -475,6 +483,52 @@ def test_reservation_can_be_modified_by_overlapping_reservation(api_client, rese
     assert reservation.end == dateparse.parse_datetime('2115-04-04T11:00:00+02:00')
 
 
+@pytest.mark.django_db
+def test_reservation_collision_on_save(api_client, reservation, reservation_data, list_url, user2, monkeypatch):
+    """
+    Tests that an overlapping reservation is rejected by the database even if it passes validation.
+    """
+    monkeypatch.setattr(Resource, 'check_reservation_collision', lambda *args: False)
+    api_client.force_authenticate(user=user2)
+    reservation_data['begin'] = '2115-04-04T09:30:00+02:00'
+    reservation_data['end'] = '2115-04-04T10:30:00+02:00'
+    response = api_client.post(list_url, data=reservation_data)
+    assert response.status_code == 400
+    assert_non_field_errors_contain(response, 'The resource is already reserved for some of the period')
+    assert Reservation.objects.count() == 1
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_reservations_of_same_slot(resource_in_unit, reservation_data, list_url):
+    """
+    Tests that only one of many simultaneous requests for the same time slot gets the reservation.
+    """
+    users = [User.objects.create(username='concurrent_user_%d' % i) for i in range(8)]
+    barrier = threading.Barrier(len(users))
+    responses = []
+
+    def make_reservation(user):
+        api_client = APIClient()
+        api_client.force_authenticate(user=user)
+        try:
+            barrier.wait()
+            responses.append(api_client.post(list_url, data=reservation_data))
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=make_reservation, args=(user,)) for user in users]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(response.status_code for response in responses) == [201] + [400] * (len(users) - 1)
+    for response in responses:
+        if response.status_code == 400:
+            assert_non_field_errors_contain(response, 'The resource is already reserved for some of the period')
+    assert Reservation.objects.filter(resource=resource_in_unit).count() == 1
+
+
 @pytest.mark.parametrize('perm_type', ['unit', 'resource_group'])
 @pytest.mark.django_db
 def test_non_reservable_resource_restrictions(
@@ -746,6 +800,103 @@ def test_reservation_excels(staff_api_client, list_url, detail_url, reservation,
     assert len(response.content) > 0
 
 
+def get_xlsx_worksheet(response):
+    with zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content))) as xlsx:
+        return xlsx.read('xl/worksheets/sheet1.xml').decode()
+
+
+@pytest.mark.django_db
+def test_reservation_export(api_client, staff_api_client, staff_user, reservation, resource_in_unit):
+    """
+    Tests that the export endpoint streams all the reservations with the fields the user may see
+    """
+    resource_in_unit.reservation_metadata_set = ReservationMetadataSet.objects.get(name='default')
+    resource_in_unit.save()
+    export_url = reverse('reservation-export')
+
+    response = api_client.get(export_url)
+    assert response.status_code == 200
+    assert response['Content-Disposition'] == 'attachment; filename="reservations.xlsx"'
+    worksheet = get_xlsx_worksheet(response)
+    assert resource_in_unit.name in worksheet
+    assert reservation.user.email not in worksheet
+    assert reservation.reserver_name not in worksheet
+
+    UnitAuthorization.objects.create(
+        subject=resource_in_unit.unit, level=UnitAuthorizationLevel.manager, authorized=staff_user)
+    response = staff_api_client.get(export_url)
+    assert response.status_code == 200
+    worksheet = get_xlsx_worksheet(response)
+    assert reservation.user.email in worksheet
+    assert reservation.reserver_name in worksheet
+
+
+@pytest.mark.django_db
+def test_reservation_csv_and_ndjson(api_client, staff_api_client, staff_user, list_url, reservation, reservation2,
+                                    resource_in_unit):
+    UnitAuthorization.objects.create(
+        subject=resource_in_unit.unit, level=UnitAuthorizationLevel.manager, authorized=staff_user)
+
+    response = staff_api_client.get(list_url, data={'format': 'csv'})
+    assert response.status_code == 200
+    assert response['Content-Type'] == 'text/csv; charset=utf-8'
+    rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+    assert [row['id'] for row in rows] == [str(reservation.id), str(reservation2.id)]
+    # the user is visible only for the reservations of the managed unit
+    assert rows[0]['user'] == reservation.user.email
+    assert rows[1]['user'] == ''
+
+    response = api_client.get(list_url, data={'format': 'ndjson'})
+    assert response.status_code == 200
+    rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+    assert [row['id'] for row in rows] == [reservation.id, reservation2.id]
+    assert rows[0]['resource_id'] == resource_in_unit.id
+    reservation.refresh_from_db()
+    assert rows[0]['begin'] == timezone.localtime(reservation.begin).isoformat()
+    assert 'user' not in rows[0]
+
+
+@pytest.mark.django_db
+def test_iterate_reservation_values_in_chunks(resource_in_unit, resource_in_unit2, user):
+    begin = datetime.datetime(2115, 4, 4, 9, tzinfo=datetime.timezone.utc)
+    reservations = [
+        Reservation.objects.create(
+            resource=(resource_in_unit, resource_in_unit2)[i % 2], begin=begin + datetime.timedelta(hours=i // 2),
+            end=begin + datetime.timedelta(hours=i // 2 + 1), user=user
+        ) for i in range(5)
+    ]
+    values = list(iterate_reservation_values(Reservation.objects.all(), ['resource'], chunk_size=2))
+    assert [value['id'] for value in values] == [reservation.id for reservation in reservations]
+
+
+@pytest.mark.django_db
+def test_reservation_cursor_pagination(api_client, list_url, reservation, reservation2, reservation3):
+    response = api_client.get(list_url, data={'cursor': '', 'page_size': 2})
+    assert response.status_code == 200
+    assert 'count' not in response.data
+    assert [r['id'] for r in response.data['results']] == [reservation.id, reservation2.id]
+
+    response = api_client.get(response.data['next'])
+    assert response.status_code == 200
+    assert [r['id'] for r in response.data['results']] == [reservation3.id]
+    assert response.data['next'] is None
+
+
+@pytest.mark.django_db
+def test_reservation_list_without_count(api_client, list_url, reservation, reservation2, reservation3):
+    response = api_client.get(list_url, data={'count': 'false', 'page_size': 2})
+    assert response.status_code == 200
+    assert response.data['count'] is None
+    assert response.data['previous'] is None
+    assert len(response.data['results']) == 2
+
+    response = api_client.get(response.data['next'])
+    assert response.status_code == 200
+    assert len(response.data['results']) == 1
+    assert response.data['next'] is None
+    assert response.data['previous'] is not None
+
+
 @pytest.mark.parametrize('need_manual_confirmation, expected_state', [
     (False, Reservation.CONFIRMED),
     (True, Reservation.REQUESTED)
@@ -2712,3 +2863,118 @@ def test_reservation_cancellation_with_message(user_api_client, api_client, gene
     assert cancel_reason_category.description_en in mail_body
     assert cancel_with_message_data['cancel_reason']['description'] in mail_body
 
+
+@pytest.fixture
+def bulk_url():
+    return reverse('reservation-bulk')
+
+
+@pytest.mark.django_db
+def test_admin_can_make_reservation_series(
+        resource_in_unit, bulk_url, reservation_data, unit_admin_user, api_client):
+    reservation_data['recurrence'] = {'frequency': 'weekly', 'count': 4}
+    api_client.force_authenticate(user=unit_admin_user)
+    response = api_client.post(bulk_url, data=reservation_data, format='json')
+    assert response.status_code == 201, "Request failed with: %s" % (str(response.content, 'utf8'))
+    assert response.data['skipped'] == []
+
+    reservations = Reservation.objects.filter(resource=resource_in_unit).order_by('begin')
+    assert [reservation.begin for reservation in reservations] == [
+        dateparse.parse_datetime('2115-04-%02dT11:00:00+02:00' % day) for day in (4, 11, 18, 25)
+    ]
+    assert all(reservation.state == Reservation.CONFIRMED for reservation in reservations)
+    assert [item['id'] for item in response.data['reservations']] == [reservation.id for reservation in reservations]
+
+
+@pytest.mark.django_db
+def test_reservation_series_conflicts(
+        resource_in_unit, bulk_url, reservation_data, unit_admin_user, user, api_client):
+    Reservation.objects.create(
+        resource=resource_in_unit, user=user, state=Reservation.CONFIRMED,
+        begin='2115-04-11T11:00:00+02:00', end='2115-04-11T12:00:00+02:00',
+    )
+    reservation_data['recurrence'] = {'frequency': 'weekly', 'until': '2115-04-25'}
+    api_client.force_authenticate(user=unit_admin_user)
+
+    response = api_client.post(bulk_url, data=reservation_data, format='json')
+    assert response.status_code == 400
+    assert len(response.data['occurrences']) == 1
+    skipped_begin = dateparse.parse_datetime(response.data['occurrences'][0]['begin'])
+    assert skipped_begin == dateparse.parse_datetime('2115-04-11T11:00:00+02:00')
+    assert Reservation.objects.filter(resource=resource_in_unit).count() == 1
+
+    reservation_data['skip_conflicts'] = True
+    response = api_client.post(bulk_url, data=reservation_data, format='json')
+    assert response.status_code == 201, "Request failed with: %s" % (str(response.content, 'utf8'))
+    assert len(response.data['reservations']) == 3
+    assert len(response.data['skipped']) == 1
+    assert Reservation.objects.filter(resource=resource_in_unit).count() == 4
+
+
+@pytest.mark.django_db
+def test_reservation_series_requires_admin(resource_in_unit, bulk_url, reservation_data, user_api_client):
+    reservation_data['recurrence'] = {'frequency': 'daily', 'count': 2}
+    response = user_api_client.post(bulk_url, data=reservation_data, format='json')
+    assert response.status_code == 403
+    assert not Reservation.objects.filter(resource=resource_in_unit).exists()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('end', ('2115-04-04T10:00:00+02:00', '2115-04-04T11:00:00+02:00'))
+def test_reservation_series_must_end_after_begin(
+        resource_in_unit, bulk_url, reservation_data, unit_admin_user, api_client, end):
+    reservation_data['end'] = end
+    reservation_data['recurrence'] = {'frequency': 'weekly', 'count': 2}
+    api_client.force_authenticate(user=unit_admin_user)
+    response = api_client.post(bulk_url, data=reservation_data, format='json')
+    assert response.status_code == 400
+    assert [occurrence['errors'] for occurrence in response.data['occurrences']] == [
+        ['You must end the reservation after it has begun']
+    ] * 2
+    assert not Reservation.objects.filter(resource=resource_in_unit).exists()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('access_code, status_code', (('1234', 201), ('12345', 400)))
+def test_reservation_series_access_code_is_validated(
+        resource_in_unit, bulk_url, reservation_data, unit_admin_user, api_client, access_code, status_code):
+    resource_in_unit.access_code_type = Resource.ACCESS_CODE_TYPE_PIN4
+    resource_in_unit.generate_access_codes = False
+    resource_in_unit.save()
+    reservation_data['access_code'] = access_code
+    reservation_data['recurrence'] = {'frequency': 'weekly', 'count': 2}
+    api_client.force_authenticate(user=unit_admin_user)
+    response = api_client.post(bulk_url, data=reservation_data, format='json', HTTP_ACCEPT_LANGUAGE='en')
+    assert response.status_code == status_code
+    if status_code == 400:
+        assert response.data['access_code'] == ['Invalid value']
+        assert not Reservation.objects.filter(resource=resource_in_unit).exists()
+    else:
+        assert set(Reservation.objects.filter(resource=resource_in_unit).values_list('access_code', flat=True)) == {
+            access_code
+        }
+
+
+@override_settings(RESPA_MAILS_ENABLED=True)
+@pytest.mark.django_db
+def test_reservation_series_created_mail(
+        resource_in_unit, bulk_url, reservation_data, unit_admin_user, api_client, reservation_created_notification):
+    with switch_language(reservation_created_notification, 'en'):
+        reservation_created_notification.body = \
+            '{% for reservation in reservations %}<{{ reservation.time_range }}>{% endfor %}'
+        reservation_created_notification.save()
+    # staff members don't get mails of the reservations they make for themselves
+    unit_admin_user.is_staff = False
+    unit_admin_user.save()
+    reservation_data['recurrence'] = {'frequency': 'weekly', 'count': 3}
+    api_client.force_authenticate(user=unit_admin_user)
+    response = api_client.post(bulk_url, data=reservation_data, format='json')
+    assert response.status_code == 201, "Request failed with: %s" % (str(response.content, 'utf8'))
+
+    # a single mail lists the whole series
+    assert len(mail.outbox) == 1
+    assert mail.outbox[0].to == [unit_admin_user.email]
+    series = Reservation.objects.filter(resource=resource_in_unit).order_by('begin')
+    assert ''.join('<%s>' % reservation.format_time() for reservation in series) in mail.outbox[0].body
+    ical_file_name, ical_file, mimetype = mail.outbox[0].attachments[0]
+    assert len(Calendar.from_ical(ical_file).walk('vevent')) == 3
@@ -0,0 +1,115 @@
+import datetime
+
+import pytest
+from django.core.management import call_command
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from resources.models import Reservation, ReservationEventJob
+from resources.models import event as event_module
+from resources.models.event import register_reservation_event_handler
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    monkeypatch.setattr(event_module, '_handlers', {})
+    monkeypatch.setattr(event_module, '_handler_names_by_event', {})
+    monkeypatch.setattr(event_module, '_concurrency_by_name', {})
+    calls = []
+    register_reservation_event_handler(
+        ReservationEventJob.CONFIRMED, 'test.record', lambda reservation, user: calls.append((reservation, user))
+    )
+    register_reservation_event_handler(
+        ReservationEventJob.CANCELLED, 'test.record', lambda reservation, user: calls.append((reservation, user))
+    )
+    return calls
+
+
+@pytest.fixture
+def reservation(resource_in_unit, user):
+    return Reservation.objects.create(
+        resource=resource_in_unit,
+        begin='2115-04-04T09:00:00+02:00',
+        end='2115-04-04T10:00:00+02:00',
+        user=user,
+        state=Reservation.CREATED,
+    )
+
+
+@pytest.mark.django_db
+@override_settings(RESPA_RESERVATION_EVENTS_RUN_IMMEDIATELY=False)
+def test_reservation_events_are_handled_by_worker(calls, reservation, user):
+    reservation.set_state(Reservation.CONFIRMED, user)
+
+    assert calls == []
+    job = ReservationEventJob.objects.get()
+    assert (job.event, job.handler, job.reservation_id, job.state) == (
+        ReservationEventJob.CONFIRMED, 'test.record', reservation.id, ReservationEventJob.PENDING
+    )
+
+    call_command('process_reservation_events')
+
+    assert calls == [(reservation, user)]
+    assert calls[0][0].state == Reservation.CONFIRMED
+    job.refresh_from_db()
+    assert job.state == ReservationEventJob.DONE
+    assert job.attempts == 1
+
+    # done jobs are not run again
+    call_command('process_reservation_events')
+    assert len(calls) == 1
+
+
+@pytest.mark.django_db
+@override_settings(RESPA_RESERVATION_EVENTS_RUN_IMMEDIATELY=True)
+def test_reservation_events_run_immediately(calls, reservation, user):
+    reservation.set_state(Reservation.CONFIRMED, user)
+    assert calls == [(reservation, user)]
+    assert not ReservationEventJob.objects.exists()
+
+
+@pytest.mark.django_db
+@override_settings(RESPA_RESERVATION_EVENTS_RUN_IMMEDIATELY=False, RESPA_RESERVATION_EVENTS_MAX_ATTEMPTS=2)
+def test_failed_reservation_event_jobs_are_retried(calls, reservation, user):
+    def fail(reservation, user):
+        raise Exception('access control system is down')
+
+    register_reservation_event_handler(ReservationEventJob.CONFIRMED, 'test.fail', fail)
+    reservation.set_state(Reservation.CONFIRMED, user)
+    call_command('process_reservation_events')
+
+    job = ReservationEventJob.objects.get(handler='test.fail')
+    assert job.state == ReservationEventJob.PENDING
+    assert job.attempts == 1
+    assert job.last_error == 'access control system is down'
+    assert job.run_after > timezone.now()
+    assert ReservationEventJob.objects.get(handler='test.record').state == ReservationEventJob.DONE
+
+    job.run_after = timezone.now() - datetime.timedelta(seconds=1)
+    job.save()
+    call_command('process_reservation_events')
+
+    job.refresh_from_db()
+    assert job.state == ReservationEventJob.FAILED
+    assert job.attempts == 2
+
+
+@pytest.mark.django_db
+@override_settings(RESPA_RESERVATION_EVENTS_RUN_IMMEDIATELY=False)
+def test_reservation_events_are_handled_in_order(calls, reservation, user):
+    reservation.set_state(Reservation.CONFIRMED, user)
+    reservation.set_state(Reservation.CANCELLED, user)
+    confirmed_job, cancelled_job = ReservationEventJob.objects.order_by('id')
+
+    # the cancellation waits until the confirmation has been handled
+    confirmed_job.run_after = timezone.now() + datetime.timedelta(minutes=5)
+    confirmed_job.save()
+    assert not ReservationEventJob.objects.due().exists()
+
+    confirmed_job.run_after = timezone.now()
+    confirmed_job.save()
+    assert list(ReservationEventJob.objects.due()) == [confirmed_job]
+
+    call_command('process_reservation_events')
+    assert [job.state for job in ReservationEventJob.objects.order_by('id')] == [ReservationEventJob.DONE] * 2
+    assert len(calls) == 2
@@ -0,0 +1,101 @@
+import datetime
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from psycopg2.extras import DateTimeTZRange
+
+from resources.api.resource import get_resource_reservations_queryset
+from resources.models import Reservation, Resource
+
+User = get_user_model()
+
+FUTURE = datetime.datetime(2115, 4, 4, 9, tzinfo=datetime.timezone.utc)
+
+
+@pytest.fixture
+def reservation_table(resource_in_unit, space_resource_type, test_unit):
+    """
+    Fill the reservation table with enough rows for the planner to prefer indexes
+    """
+    resources = [resource_in_unit] + [
+        Resource.objects.create(type=space_resource_type, name='resource %d' % i, unit=test_unit)
+        for i in range(39)
+    ]
+    users = [User.objects.create(username='user_%d' % i) for i in range(20)]
+    past = datetime.datetime(2015, 1, 1, 8, tzinfo=datetime.timezone.utc)
+    reservations = []
+    for resource_index, resource in enumerate(resources):
+        for i in range(250):
+            begin = past + datetime.timedelta(hours=i * 2)
+            end = begin + datetime.timedelta(hours=1)
+            reservations.append(Reservation(
+                resource=resource, user=users[(resource_index + i) % len(users)], begin=begin, end=end,
+                duration=DateTimeTZRange(begin, end, '[)'),
+                state=Reservation.CANCELLED if i % 10 == 0 else Reservation.CONFIRMED,
+            ))
+    Reservation.objects.bulk_create(reservations)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE resources_reservation')
+    return resources, users
+
+
+def get_reservation_query_plans(func):
+    """
+    Run func and return the query plans of the reservation queries it made
+    """
+    with CaptureQueriesContext(connection) as context:
+        func()
+    plans = []
+    with connection.cursor() as cursor:
+        for query in context.captured_queries:
+            if not query['sql'].startswith('SELECT') or 'FROM "resources_reservation"' not in query['sql']:
+                continue
+            cursor.execute('EXPLAIN ' + query['sql'])
+            plans.append('\n'.join(row[0] for row in cursor.fetchall()))
+    assert plans
+    return plans
+
+
+def assert_index_scans(plans):
+    for plan in plans:
+        assert 'Seq Scan on resources_reservation' not in plan, plan
+        assert 'Index' in plan, plan
+
+
+@pytest.mark.django_db
+def test_check_reservation_collision_uses_index(reservation_table, resource_in_unit):
+    plans = get_reservation_query_plans(
+        lambda: resource_in_unit.check_reservation_collision(FUTURE, FUTURE + datetime.timedelta(hours=1), None)
+    )
+    assert_index_scans(plans)
+
+
+@pytest.mark.django_db
+def test_validate_max_reservations_per_user_uses_index(reservation_table, resource_in_unit):
+    resources, users = reservation_table
+    plans = get_reservation_query_plans(lambda: resource_in_unit.validate_max_reservations_per_user(users[0]))
+    assert_index_scans(plans)
+
+
+@pytest.mark.django_db
+def test_get_resource_reservations_queryset_uses_index(reservation_table, resource_in_unit):
+    resources, users = reservation_table
+    queryset = get_resource_reservations_queryset(FUTURE, FUTURE + datetime.timedelta(days=7))
+    assert_index_scans(get_reservation_query_plans(lambda: list(queryset.filter(resource=resource_in_unit))))
+    assert_index_scans(get_reservation_query_plans(lambda: list(queryset.filter(resource__in=resources[:20]))))
+
+
+@pytest.mark.django_db
+def test_disallow_overlapping_reservations_uses_index(reservation_table, resource_in_unit, test_unit):
+    resources, users = reservation_table
+    test_unit.disallow_overlapping_reservations = True
+    test_unit.save()
+    reservation = Reservation(
+        resource=resource_in_unit, begin=FUTURE, end=FUTURE + datetime.timedelta(hours=1), user=users[0]
+    )
+    plans = get_reservation_query_plans(lambda: reservation.clean(user=users[0]))
+    # the unit check and the collision check
+    assert len(plans) == 2
+    assert_index_scans(plans)
@@ -2,14 +2,26 @@
 from decimal import Decimal
 import pytest
 import datetime
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.core.exceptions import ValidationError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.utils.translation import activate
+from guardian.shortcuts import assign_perm
 from PIL import Image
 
 from resources.enums import UnitAuthorizationLevel, UnitGroupAuthorizationLevel
+from resources.auth import PermissionResolver, is_unit_admin, is_unit_manager, is_unit_viewer
+from resources.checks import check_shared_cache
 from resources.errors import InvalidImage
-from resources.models import ResourceImage, Resource
+from resources.middleware import RequestCacheMiddleware, request_cache
+from resources.models import Day, Period, Reservation, ResourceImage, Resource, UnitGroup
+from resources.models.resource import get_available_hours_for_resources
+from resources.models.unit import MANAGED_UNIT_IDS_CACHE_KEY, get_managed_unit_ids
 from resources.tests.utils import create_resource_image, get_test_image_data, get_field_errors
 
 
@@ -158,3 +170,341 @@ def test_queryset_with_perm(resource_in_unit, user):
     assert resource_in_unit in resources
 
 
+@pytest.mark.django_db
+def test_queryset_with_perm_is_cached_per_request(resource_in_unit, resource_in_unit2, user,
+                                                  django_assert_num_queries):
+    user.unit_authorizations.create(level=UnitAuthorizationLevel.manager, subject=resource_in_unit.unit)
+    resource_group = resource_in_unit2.groups.create(identifier='rg1', name='rg1')
+    assign_perm('group:can_view_reservation_catering_orders', user, resource_group)
+
+    def view(request):
+        resources = Resource.objects.with_perm('can_view_reservation_catering_orders', user)
+        assert set(resources) == {resource_in_unit, resource_in_unit2}
+        with django_assert_num_queries(1):
+            resources = Resource.objects.with_perm('can_view_reservation_catering_orders', user)
+            assert set(resources) == {resource_in_unit, resource_in_unit2}
+
+    RequestCacheMiddleware(view)(None)
+
+
+def _create_permission_setup(setup, user, group, resource):
+    if setup == 'unit_admin':
+        user.unit_authorizations.create(level=UnitAuthorizationLevel.admin, subject=resource.unit)
+    elif setup == 'unit_manager':
+        user.unit_authorizations.create(level=UnitAuthorizationLevel.manager, subject=resource.unit)
+    elif setup == 'unit_viewer':
+        user.unit_authorizations.create(level=UnitAuthorizationLevel.viewer, subject=resource.unit)
+    elif setup == 'unit_group_admin':
+        unit_group = UnitGroup.objects.create(name='test unit group')
+        unit_group.members.add(resource.unit)
+        user.unit_group_authorizations.create(level=UnitGroupAuthorizationLevel.admin, subject=unit_group)
+    elif setup == 'general_admin':
+        user.is_general_admin = True
+        user.save()
+    elif setup == 'explicit':
+        user.groups.add(group)
+        assign_perm('unit:can_ignore_opening_hours', group, resource.unit)
+        resource_group = resource.groups.create(identifier='rg1', name='rg1')
+        assign_perm('group:can_approve_reservation', group, resource_group)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('setup', (
+    None, 'unit_admin', 'unit_manager', 'unit_viewer', 'unit_group_admin', 'general_admin', 'explicit'
+))
+def test_permission_resolver(resource_in_unit, resource_in_unit2, user, group, setup):
+    _create_permission_setup(setup, user, group, resource_in_unit)
+    resources = list(Resource.objects.filter(id__in=(resource_in_unit.id, resource_in_unit2.id))
+                     .select_related('unit').prefetch_related('groups'))
+    resolver = PermissionResolver(user, resources)
+
+    checks = ['is_admin', 'is_manager', 'is_viewer']
+    checks += [name for name in dir(Resource) if name.startswith('can_')]
+    for resource in resources:
+        expected = {check: getattr(Resource.objects.get(id=resource.id), check)(user) for check in checks}
+        resource._permission_resolver = resolver
+        assert {check: getattr(resource, check)(user) for check in checks} == expected
+
+
+@pytest.mark.django_db
+def test_unit_role_levels_are_memoized(resource_in_unit, resource_in_unit2, user, django_assert_num_queries):
+    user.unit_authorizations.create(level=UnitAuthorizationLevel.manager, subject=resource_in_unit.unit)
+    unit_group = UnitGroup.objects.create(name='test unit group')
+    unit_group.members.add(resource_in_unit2.unit)
+    user.unit_group_authorizations.create(level=UnitGroupAuthorizationLevel.admin, subject=unit_group)
+
+    prefetched_user = get_user_model().objects.prefetch_related(
+        'unit_authorizations', 'unit_group_authorizations__subject__members'
+    ).get(pk=user.pk)
+    with django_assert_num_queries(0):
+        for i in range(3):
+            assert resource_in_unit.is_manager(prefetched_user)
+            assert not resource_in_unit.is_admin(prefetched_user)
+            assert resource_in_unit2.is_admin(prefetched_user)
+            assert not resource_in_unit2.is_viewer(prefetched_user)
+
+
+@pytest.mark.django_db
+def test_unit_role_levels_are_memoized_per_request(test_unit, test_unit2, user, django_assert_num_queries):
+    user.unit_authorizations.create(level=UnitAuthorizationLevel.manager, subject=test_unit)
+    with request_cache():
+        assert is_unit_manager(user, test_unit)
+        with django_assert_num_queries(0):
+            assert is_unit_manager(user, test_unit)
+            assert not is_unit_admin(user, test_unit2)
+            assert not is_unit_viewer(user, test_unit2)
+
+        # the memoized levels are dropped when the authorizations change
+        unit_group = UnitGroup.objects.create(name='test unit group')
+        user.unit_group_authorizations.create(level=UnitGroupAuthorizationLevel.admin, subject=unit_group)
+        unit_group.members.add(test_unit2)
+        assert is_unit_admin(user, test_unit2)
+        user.unit_authorizations.all().delete()
+        assert not is_unit_manager(user, test_unit)
+
+
+@pytest.mark.django_db
+def test_managed_unit_ids_cache(test_unit, test_unit2, test_unit3, user, django_assert_num_queries):
+    authorization = user.unit_authorizations.create(level=UnitAuthorizationLevel.manager, subject=test_unit)
+    assert get_managed_unit_ids(user) == {test_unit.id}
+    with django_assert_num_queries(0):
+        assert get_managed_unit_ids(user) == {test_unit.id}
+
+    unit_group = UnitGroup.objects.create(name='test unit group')
+    user.unit_group_authorizations.create(level=UnitGroupAuthorizationLevel.admin, subject=unit_group)
+    unit_group.members.add(test_unit2)
+    assert get_managed_unit_ids(user) == {test_unit.id, test_unit2.id}
+
+    # in a request, the ids are also memoized until the authorizations change
+    with request_cache():
+        test_unit3.unit_groups.add(unit_group)
+        assert get_managed_unit_ids(user) == {test_unit.id, test_unit2.id, test_unit3.id}
+        cache.clear()
+        with django_assert_num_queries(0):
+            assert get_managed_unit_ids(user) == {test_unit.id, test_unit2.id, test_unit3.id}
+
+        test_unit3.unit_groups.clear()
+        assert get_managed_unit_ids(user) == {test_unit.id, test_unit2.id}
+
+    unit_group.members.clear()
+    authorization.delete()
+    assert get_managed_unit_ids(user) == set()
+
+
+@pytest.mark.django_db
+def test_managed_unit_ids_are_invalidated_on_commit(test_unit, user, monkeypatch):
+    on_commit_callbacks = []
+    monkeypatch.setattr('resources.models.unit.transaction.on_commit', on_commit_callbacks.append)
+    authorization = user.unit_authorizations.create(level=UnitAuthorizationLevel.manager, subject=test_unit)
+    assert get_managed_unit_ids(user) == {test_unit.id}
+
+    authorization.delete()
+    # another process caches the ids before the deletion is committed
+    cache.set(MANAGED_UNIT_IDS_CACHE_KEY % user.pk, {test_unit.id})
+    for callback in on_commit_callbacks:
+        callback()
+    assert get_managed_unit_ids(user) == set()
+
+
+@pytest.mark.parametrize('debug, backend, warning_ids', (
+    (False, 'django.core.cache.backends.locmem.LocMemCache', ['resources.W001']),
+    (True, 'django.core.cache.backends.locmem.LocMemCache', []),
+    (False, 'django.core.cache.backends.memcached.MemcachedCache', []),
+))
+def test_shared_cache_check(settings, debug, backend, warning_ids):
+    settings.DEBUG = debug
+    settings.CACHES = {'default': {'BACKEND': backend}}
+    assert [warning.id for warning in check_shared_cache(None)] == warning_ids
+
+
+def _get_free_intervals(resource):
+    return [
+        (r.lower, r.upper)
+        for r in resource.free_intervals.order_by('free_between').values_list('free_between', flat=True)
+    ]
+
+
+def _dt(time_str):
+    return datetime.datetime.strptime('2115-04-08 ' + time_str, '%Y-%m-%d %H:%M').replace(
+        tzinfo=datetime.timezone(datetime.timedelta(hours=2))
+    )
+
+
+@pytest.mark.django_db
+def test_free_intervals_are_maintained(resource_in_unit, user):
+    p1 = Period.objects.create(start=datetime.date(2115, 4, 8),
+                               end=datetime.date(2115, 4, 8),
+                               resource=resource_in_unit)
+    Day.objects.create(period=p1, weekday=0, opens=datetime.time(8, 0), closes=datetime.time(16, 0))
+    resource_in_unit.update_opening_hours()
+    assert _get_free_intervals(resource_in_unit) == [(_dt('08:00'), _dt('16:00'))]
+
+    reservation = Reservation.objects.create(
+        resource=resource_in_unit, begin=_dt('10:00'), end=_dt('11:00'), user=user
+    )
+    assert _get_free_intervals(resource_in_unit) == [(_dt('08:00'), _dt('10:00')), (_dt('11:00'), _dt('16:00'))]
+
+    reservation = Reservation.objects.get(pk=reservation.pk)
+    reservation.begin = _dt('12:00')
+    reservation.end = _dt('13:00')
+    reservation.save()
+    assert _get_free_intervals(resource_in_unit) == [(_dt('08:00'), _dt('12:00')), (_dt('13:00'), _dt('16:00'))]
+
+    reservation.set_state(Reservation.CANCELLED, user)
+    assert _get_free_intervals(resource_in_unit) == [(_dt('08:00'), _dt('16:00'))]
+
+    Day.objects.filter(period=p1).update(closes=datetime.time(14, 0))
+    resource_in_unit.update_opening_hours()
+    assert _get_free_intervals(resource_in_unit) == [(_dt('08:00'), _dt('14:00'))]
+
+    assert resource_in_unit.get_free_hours(_dt('09:00'), _dt('18:00')) == [
+        {'starts': _dt('09:00'), 'ends': _dt('14:00')}
+    ]
+    assert resource_in_unit.get_free_hours(_dt('09:00'), _dt('18:00'), datetime.timedelta(hours=6)) == []
+
+
+@pytest.mark.django_db
+def test_rebuild_free_intervals_command(resource_in_unit, user):
+    p1 = Period.objects.create(start=datetime.date(2115, 4, 8),
+                               end=datetime.date(2115, 4, 8),
+                               resource=resource_in_unit)
+    Day.objects.create(period=p1, weekday=0, opens=datetime.time(8, 0), closes=datetime.time(16, 0))
+    resource_in_unit.update_opening_hours()
+    Reservation.objects.create(resource=resource_in_unit, begin=_dt('10:00'), end=_dt('11:00'), user=user)
+    call_command('rebuild_free_intervals', '--verify')
+
+    # queryset updates bypass the incremental maintenance
+    Reservation.objects.update(state=Reservation.CANCELLED)
+    with pytest.raises(CommandError):
+        call_command('rebuild_free_intervals', '--verify')
+
+    call_command('rebuild_free_intervals')
+    call_command('rebuild_free_intervals', '--verify')
+    assert _get_free_intervals(resource_in_unit) == [(_dt('08:00'), _dt('16:00'))]
+
+
+def _get_opening_hours(resource):
+    tz = resource.unit.get_tz()
+    hours = resource.opening_hours.order_by('open_between').values_list('open_between', flat=True)
+    return {
+        r.lower.astimezone(tz).date(): (r.lower.astimezone(tz).time(), r.upper.astimezone(tz).time())
+        for r in hours
+    }
+
+
+@pytest.mark.django_db
+def test_unit_update_opening_hours(resource_in_unit, test_unit, space_resource_type, django_assert_num_queries):
+    resource2 = Resource.objects.create(type=space_resource_type, name='resource 2', unit=test_unit)
+    resource3 = Resource.objects.create(type=space_resource_type, name='resource 3', unit=test_unit)
+    unit_period = Period.objects.create(start=datetime.date(2115, 4, 6), end=datetime.date(2115, 4, 12),
+                                        unit=test_unit)
+    for weekday in range(0, 7):
+        Day.objects.create(period=unit_period, weekday=weekday, opens=datetime.time(8, 0), closes=datetime.time(16, 0))
+    # resource periods override the unit schedule on the days they cover
+    p1 = Period.objects.create(start=datetime.date(2115, 4, 8), end=datetime.date(2115, 4, 8), resource=resource2)
+    Day.objects.create(period=p1, weekday=0, opens=datetime.time(10, 0), closes=datetime.time(12, 0))
+    Period.objects.create(start=datetime.date(2115, 4, 9), end=datetime.date(2115, 4, 9), resource=resource3)
+
+    test_unit.update_opening_hours()
+    unit_hours = {
+        datetime.date(2115, 4, day): (datetime.time(8, 0), datetime.time(16, 0)) for day in range(6, 13)
+    }
+    assert _get_opening_hours(resource_in_unit) == unit_hours
+    assert _get_opening_hours(resource2) == {
+        **unit_hours, datetime.date(2115, 4, 8): (datetime.time(10, 0), datetime.time(12, 0))
+    }
+    assert _get_opening_hours(resource3) == {
+        date: hours for date, hours in unit_hours.items() if date != datetime.date(2115, 4, 9)
+    }
+    assert _get_free_intervals(resource2)[2] == (_dt('10:00'), _dt('12:00'))
+
+    # resources, unit periods, resource periods, days and the stored hours
+    with django_assert_num_queries(5):
+        test_unit.update_opening_hours()
+
+    # only the days in the given window are recalculated
+    Day.objects.filter(period=unit_period).update(closes=datetime.time(14, 0))
+    test_unit.update_opening_hours(datetime.date(2115, 4, 10), datetime.date(2115, 4, 11))
+    expected = {
+        **unit_hours,
+        datetime.date(2115, 4, 10): (datetime.time(8, 0), datetime.time(14, 0)),
+        datetime.date(2115, 4, 11): (datetime.time(8, 0), datetime.time(14, 0)),
+    }
+    assert _get_opening_hours(resource_in_unit) == expected
+    assert _get_free_intervals(resource_in_unit)[4] == (
+        _dt('08:00') + datetime.timedelta(days=2), _dt('14:00') + datetime.timedelta(days=2)
+    )
+
+    resource_in_unit.update_opening_hours()
+    assert set(_get_opening_hours(resource_in_unit).values()) == {(datetime.time(8, 0), datetime.time(14, 0))}
+
+    # hours in the window are removed when no period covers them anymore
+    unit_period.delete()
+    test_unit.update_opening_hours(datetime.date(2115, 4, 12), datetime.date(2115, 4, 12))
+    assert datetime.date(2115, 4, 12) not in _get_opening_hours(resource2)
+    assert datetime.date(2115, 4, 11) in _get_opening_hours(resource2)
+
+
+@pytest.mark.django_db
+def test_unit_update_opening_hours_queries_do_not_depend_on_resources(resource_in_unit, test_unit, space_resource_type):
+    unit_period = Period.objects.create(start=datetime.date(2115, 4, 6), end=datetime.date(2115, 4, 12),
+                                        unit=test_unit)
+    for weekday in range(0, 7):
+        Day.objects.create(period=unit_period, weekday=weekday, opens=datetime.time(8, 0), closes=datetime.time(16, 0))
+    test_unit.update_opening_hours()
+
+    def count_update_queries(closes):
+        Day.objects.filter(period=unit_period).update(closes=closes)
+        with CaptureQueriesContext(connection) as context:
+            test_unit.update_opening_hours()
+        return len(context.captured_queries)
+
+    single_resource_queries = count_update_queries(datetime.time(14, 0))
+    resources = [
+        Resource.objects.create(type=space_resource_type, name='resource %d' % i, unit=test_unit) for i in range(5)
+    ]
+    test_unit.update_opening_hours()
+    assert count_update_queries(datetime.time(12, 0)) == single_resource_queries
+    for resource in [resource_in_unit] + resources:
+        assert _get_free_intervals(resource)[0] == (
+            _dt('08:00') - datetime.timedelta(days=2), _dt('12:00') - datetime.timedelta(days=2)
+        )
+
+
+@pytest.mark.django_db
+def test_get_available_hours(resource_in_unit, resource_in_unit2, user, django_assert_num_queries):
+    for resource in (resource_in_unit, resource_in_unit2):
+        p1 = Period.objects.create(start=datetime.date(2115, 4, 6),
+                                   end=datetime.date(2115, 4, 12),
+                                   resource=resource)
+        for weekday in range(0, 7):
+            Day.objects.create(period=p1, weekday=weekday, opens=datetime.time(8, 0), closes=datetime.time(16, 0))
+        resource.update_opening_hours()
+    Reservation.objects.create(resource=resource_in_unit, begin=_dt('10:00'), end=_dt('11:00'), user=user)
+    Reservation.objects.create(resource=resource_in_unit, begin=_dt('14:00'), end=_dt('15:00'), user=user)
+
+    start = _dt('00:00') - datetime.timedelta(days=1)
+    end = _dt('00:00') + datetime.timedelta(days=2)
+    next_day = datetime.timedelta(days=1)
+    expected = [
+        {'starts': _dt('08:00') - next_day, 'ends': _dt('16:00') - next_day},
+        {'starts': _dt('08:00'), 'ends': _dt('10:00')},
+        {'starts': _dt('11:00'), 'ends': _dt('14:00')},
+        {'starts': _dt('15:00'), 'ends': _dt('16:00')},
+        {'starts': _dt('08:00') + next_day, 'ends': _dt('16:00') + next_day},
+    ]
+    # opening hours and reservations are both fetched once for the whole range
+    with django_assert_num_queries(2):
+        assert resource_in_unit.get_available_hours(start, end) == expected
+
+    assert resource_in_unit.get_available_hours(start, end, duration=datetime.timedelta(hours=5)) == [
+        expected[0], expected[4]
+    ]
+
+    resources = Resource.objects.filter(id__in=(resource_in_unit.id, resource_in_unit2.id))
+    with django_assert_num_queries(3):
+        hours_by_resource = get_available_hours_for_resources(resources, start, end)
+    assert hours_by_resource == {
+        resource_in_unit.id: expected,
+        resource_in_unit2.id: resource_in_unit2.get_available_hours(start, end),
+    }
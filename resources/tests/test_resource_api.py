@@ -1,6 +1,8 @@
 import datetime
 import pytest
 from copy import deepcopy
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.contrib.gis.geos import Point
 from django.utils import timezone
@@ -8,8 +10,9 @@
 from guardian.shortcuts import assign_perm, remove_perm
 from ..enums import UnitAuthorizationLevel, UnitGroupAuthorizationLevel
 
-from resources.models import (Day, Equipment, Period, Reservation, ReservationMetadataSet, ResourceEquipment,
-                              ResourceType, Unit, UnitAuthorization, UnitGroup)
+from resources.api.resource import ResourceFilterSet
+from resources.models import (Day, Equipment, Period, Reservation, ReservationMetadataSet, Resource,
+                              ResourceEquipment, ResourceType, Unit, UnitAuthorization, UnitGroup)
 from .utils import assert_response_objects, check_only_safe_methods_allowed, is_partial_dict_in_list, MAX_QUERIES
 
 
@@ -300,6 +303,19 @@ def test_api_resource_geo_queries(api_client, resource_in_unit):
     assert results[0]['distance'] == 53907
 
 
+@pytest.mark.django_db
+def test_resource_cursor_pagination(api_client, list_url, resource_in_unit, resource_in_unit2, resource_in_unit3):
+    resource_ids = []
+    url = list_url + '?cursor=&page_size=2'
+    while url:
+        response = api_client.get(url)
+        assert response.status_code == 200
+        assert 'count' not in response.data
+        resource_ids += [resource['id'] for resource in response.data['results']]
+        url = response.data['next']
+    assert resource_ids == sorted([resource_in_unit.id, resource_in_unit2.id, resource_in_unit3.id])
+
+
 @pytest.mark.django_db
 def test_resource_favorite(staff_api_client, staff_user, resource_in_unit):
     url = '%sfavorite/' % get_detail_url(resource_in_unit)
@@ -573,6 +589,9 @@ def test_resource_equipment_filter(api_client, resource_in_unit, resource_in_uni
     ({'available_between': '2115-04-08T10:59:59+02:00,2115-04-08T12:00:00+02:00'}, [1]),
     ({'available_between': '2115-04-08T10:59:59+02:00,2115-04-08T12:00:01+02:00'}, []),
     ({'available_between': '2115-04-08T13:00:00+02:00,2115-04-08T18:00:00+02:00'}, [0, 1]),
+    ({'available_between': '2115-04-08T12:30:00+02:00,2115-04-09T10:00:00+02:00'}, [0]),
+    ({'available_between': '2115-04-07T08:00:00+02:00,2115-04-08T09:00:00+02:00'}, [0, 1]),
+    ({'available_between': '2115-04-07T08:00:00+02:00,2115-04-09T09:00:00+02:00'}, []),
 ))
 @pytest.mark.django_db
 def test_resource_available_between_filter_reservations(user_api_client, list_url, user, resource_in_unit,
@@ -615,7 +634,8 @@ def test_resource_available_between_filter_reservations(user_api_client, list_ur
     ({'available_between': '2115-04-08T08:00:00+02:00,2115-04-08T16:00:01+02:00'}, []),
     ({'available_between': '2115-04-08T12:00:00+02:00,2115-04-08T14:00:00+02:00'}, [0, 1]),
     ({'available_between': '2115-04-14T12:00:00+02:00,2115-04-14T14:00:00+02:00'}, [0]),
-
+    ({'available_between': '2115-04-13T00:00:00+02:00,2115-04-15T00:00:00+02:00'}, [0, 1]),
+    ({'available_between': '2115-04-14T00:00:00+02:00,2115-04-15T08:00:00+02:00'}, [0]),
 ))
 @pytest.mark.django_db
 def test_resource_available_between_filter_opening_hours(user_api_client, list_url, resource_in_unit, resource_in_unit2,
@@ -646,6 +666,59 @@ def test_resource_available_between_filter_opening_hours(user_api_client, list_u
     assert_response_objects(response, [resources[index] for index in expected_resource_indexes])
 
 
+@pytest.mark.django_db
+def test_resource_available_between_filter_query_count(user, resource_in_unit, resource_in_unit2, resource_in_unit3,
+                                                       django_assert_max_num_queries):
+    for resource in (resource_in_unit, resource_in_unit2, resource_in_unit3):
+        p1 = Period.objects.create(start=datetime.date(2115, 4, 1),
+                                   end=datetime.date(2115, 4, 30),
+                                   resource=resource)
+        for weekday in range(0, 7):
+            Day.objects.create(period=p1, weekday=weekday,
+                               opens=datetime.time(8, 0),
+                               closes=datetime.time(16, 0))
+        resource.update_opening_hours()
+
+    params = {'available_between': '2115-04-08T08:00:00+02:00,2115-04-12T16:00:00+02:00'}
+    filterset = ResourceFilterSet(params, queryset=Resource.objects.all(), user=user)
+    # one query for the opening hours and one for the resources themselves
+    with django_assert_max_num_queries(2):
+        resources = list(filterset.qs)
+    assert {resource.id for resource in resources} == {
+        resource_in_unit.id, resource_in_unit2.id, resource_in_unit3.id
+    }
+
+
+@pytest.mark.django_db
+def test_opening_hours_cache_with_mixed_time_zones(user_api_client, list_url, resource_in_unit, resource_in_unit2):
+    resource_in_unit2.unit.time_zone = 'America/New_York'
+    resource_in_unit2.unit.save()
+    for resource in (resource_in_unit, resource_in_unit2):
+        p1 = Period.objects.create(start=datetime.date(2115, 4, 1),
+                                   end=datetime.date(2115, 4, 30),
+                                   resource=resource)
+        for weekday in range(0, 7):
+            Day.objects.create(period=p1, weekday=weekday,
+                               opens=datetime.time(8, 0),
+                               closes=datetime.time(16, 0))
+        resource.update_opening_hours()
+
+    params = {'start': '2115-04-08T00:00:00+02:00', 'end': '2115-04-09T00:00:00+02:00'}
+    with CaptureQueriesContext(connection) as context:
+        response = user_api_client.get(list_url, params)
+    assert response.status_code == 200
+    # opening hours of both time zones are fetched in a single query
+    hours_queries = [q for q in context.captured_queries if 'resources_resourcedailyopeninghours' in q['sql']]
+    assert len(hours_queries) == 1
+
+    hours_by_resource = {
+        obj['id']: {hours['date']: hours for hours in obj['opening_hours']} for obj in response.json()['results']
+    }
+    assert hours_by_resource[resource_in_unit.id]['2115-04-08']['opens'].startswith('2115-04-08T08:00:00')
+    assert hours_by_resource[resource_in_unit2.id]['2115-04-08']['opens'].startswith('2115-04-08T08:00:00')
+    assert hours_by_resource[resource_in_unit2.id]['2115-04-07']['opens'].startswith('2115-04-07T08:00:00')
+
+
 @pytest.mark.django_db
 def test_resource_available_between_filter_constraints(user_api_client, list_url, resource_in_unit):
     response = user_api_client.get(list_url, {
@@ -661,16 +734,10 @@ def test_resource_available_between_filter_constraints(user_api_client, list_url
     assert 'available_between takes two or three comma-separated values.' in str(response.data)
 
     response = user_api_client.get(list_url, {
-        'available_between': '2115-04-08T00:00:00+02:00,2115-04-09T00:00:00+02:00'
+        'available_between': '2115-04-09T00:00:00+02:00,2115-04-08T00:00:00+02:00'
     })
     assert response.status_code == 400
-    assert 'available_between timestamps must be on the same day.' in str(response.data)
-
-    response = user_api_client.get(list_url, {
-        'available_between': '2115-04-08T00:00:00+02:00,2115-04-09T00:00:00+02:00,60'
-    })
-    assert response.status_code == 400
-    assert 'available_between timestamps must be on the same day.' in str(response.data)
+    assert 'available_between end must not be before start.' in str(response.data)
 
     response = user_api_client.get(list_url, {
         'available_between': '2115-04-08T00:00:00+02:00,2115-04-08T00:00:00+02:00,xyz'
@@ -794,6 +861,76 @@ def test_available_between_with_period(list_url, resource_in_unit, resource_in_u
     assert_response_objects(response, expected_resources)
 
 
+@pytest.mark.parametrize('start, end, period, expected', (
+    ('08:00', '16:00', 240, True),
+    ('08:00', '16:00', 241, False),
+    ('06:00', '16:00', 240, True),
+    ('06:00', '16:00', 241, False),
+    ('08:00', '12:00', 60, True),
+    ('08:00', '12:00', 61, False),
+))
+@pytest.mark.django_db
+def test_available_between_with_period_overlapping_reservations(list_url, resource_in_unit, user, user_api_client,
+                                                                start, end, period, expected):
+    p1 = Period.objects.create(start=datetime.date(2115, 4, 1),
+                               end=datetime.date(2115, 4, 8),
+                               resource=resource_in_unit)
+    for weekday in range(0, 7):
+        Day.objects.create(period=p1, weekday=weekday,
+                           opens=datetime.time(8, 0),
+                           closes=datetime.time(16, 00))
+    resource_in_unit.update_opening_hours()
+
+    # reservations outside opening hours can be created by admins, and the reserved
+    # time may consist of several consecutive reservations
+    for begin, end_ in (('06:00', '07:00'), ('09:00', '10:00'), ('10:00', '12:00')):
+        Reservation.objects.create(
+            resource=resource_in_unit,
+            begin='2115-04-08T{}:00+02:00'.format(begin),
+            end='2115-04-08T{}:00+02:00'.format(end_),
+            user=user,
+        )
+
+    params = {'available_between': '2115-04-08T{}:00+02:00,2115-04-08T{}:00+02:00,{}'.format(start, end, period)}
+    response = user_api_client.get(list_url, params)
+    assert response.status_code == 200
+    assert_response_objects(response, [resource_in_unit] if expected else [])
+
+
+@pytest.mark.django_db
+def test_available_hours(list_url, resource_in_unit, user, user_api_client):
+    p1 = Period.objects.create(start=datetime.date(2115, 4, 1),
+                               end=datetime.date(2115, 4, 8),
+                               resource=resource_in_unit)
+    for weekday in range(0, 7):
+        Day.objects.create(period=p1, weekday=weekday,
+                           opens=datetime.time(8, 0),
+                           closes=datetime.time(16, 00))
+    resource_in_unit.update_opening_hours()
+    Reservation.objects.create(
+        resource=resource_in_unit,
+        begin='2115-04-08T10:00:00+02:00',
+        end='2115-04-08T11:00:00+02:00',
+        user=user,
+    )
+
+    params = {'start': '2115-04-08T09:00:00+02:00', 'end': '2115-04-08T15:00:00+02:00'}
+    response = user_api_client.get(list_url, params)
+    assert response.status_code == 200
+    available_hours = response.data['results'][0]['available_hours']
+    assert [(hours['starts'].isoformat(), hours['ends'].isoformat()) for hours in available_hours] == [
+        ('2115-04-08T09:00:00+02:00', '2115-04-08T10:00:00+02:00'),
+        ('2115-04-08T11:00:00+02:00', '2115-04-08T15:00:00+02:00'),
+    ]
+
+    params['duration'] = 90
+    response = user_api_client.get(list_url, params)
+    assert response.status_code == 200
+    available_hours = response.data['results'][0]['available_hours']
+    assert len(available_hours) == 1
+    assert available_hours[0]['starts'].isoformat() == '2115-04-08T11:00:00+02:00'
+
+
 @pytest.mark.django_db
 def test_filtering_free_of_charge(list_url, api_client, resource_in_unit,
                                   resource_in_unit2, resource_in_unit3):
@@ -1133,3 +1270,32 @@ def test_query_counts(user_api_client, staff_api_client, list_url, django_assert
 
     with django_assert_max_num_queries(MAX_QUERIES):
         staff_api_client.get(list_url)
+
+
+@pytest.mark.django_db
+def test_permission_query_count_does_not_grow_with_page_size(user_api_client, user, group, list_url,
+                                                             space_resource_type):
+    user.groups.add(group)
+
+    def create_resources(count):
+        for i in range(count):
+            unit = Unit.objects.create(name='unit %d' % i, time_zone='Europe/Helsinki')
+            resource = Resource.objects.create(type=space_resource_type, authentication='none', unit=unit,
+                                               name='resource %d' % i)
+            user.unit_authorizations.create(level=UnitAuthorizationLevel.manager, subject=unit)
+            assign_perm('unit:can_ignore_opening_hours', group, unit)
+            resource_group = resource.groups.create(identifier='rg %d' % i, name='rg %d' % i)
+            assign_perm('group:can_approve_reservation', group, resource_group)
+
+    def get_query_count():
+        with CaptureQueriesContext(connection) as context:
+            response = user_api_client.get(list_url)
+        assert response.status_code == 200
+        for obj in response.data['results']:
+            assert obj['user_permissions']['is_manager']
+        return len(context.captured_queries)
+
+    create_resources(2)
+    query_count = get_query_count()
+    create_resources(8)
+    assert get_query_count() == query_count
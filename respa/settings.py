@@ -58,6 +58,8 @@ def get_git_revision_hash():
     COOKIE_PREFIX=(str, 'respa'),
     INTERNAL_IPS=(list, []),
     MAIL_ENABLED=(bool, False),
+    MAIL_SEND_IMMEDIATELY=(bool, False),
+    RESERVATION_EVENTS_RUN_IMMEDIATELY=(bool, False),
     MAIL_DEFAULT_FROM=(str, ''),
     MAIL_MAILGUN_KEY=(str, ''),
     MAIL_MAILGUN_DOMAIN=(str, ''),
@@ -172,6 +174,7 @@ def get_git_revision_hash():
     'django.middleware.csrf.CsrfViewMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'resources.middleware.RequestCacheMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -318,9 +321,23 @@ def get_git_revision_hash():
 
 RESPA_MAILS_ENABLED = env('MAIL_ENABLED')
 RESPA_MAILS_FROM_ADDRESS = env('MAIL_DEFAULT_FROM')
+RESPA_MAILS_SEND_IMMEDIATELY = env('MAIL_SEND_IMMEDIATELY')
+RESPA_MAILS_OUTBOX_MAX_ATTEMPTS = 5
 RESPA_CATERINGS_ENABLED = False
 RESPA_COMMENTS_ENABLED = False
 RESPA_DOCX_TEMPLATE = os.path.join(BASE_DIR, 'reports', 'data', 'default.docx')
+# Days the report jobs and their files are kept before process_report_jobs deletes them
+RESPA_REPORT_JOB_RETENTION_DAYS = 7
+# Seconds the ids of the units a user manages are kept in the cache. The cache backend must be
+# shared by all the processes, e.g. memcached or Redis, so that changed authorizations take
+# effect everywhere; the resources.W001 check warns about the default per-process cache.
+RESPA_MANAGED_UNITS_CACHE_TIMEOUT = 10 * 60
+# Maximum number of reservations created at once by the reservation series endpoint
+RESPA_MAX_RESERVATION_SERIES_LENGTH = 200
+RESPA_RESERVATION_EVENTS_RUN_IMMEDIATELY = env('RESERVATION_EVENTS_RUN_IMMEDIATELY')
+RESPA_RESERVATION_EVENTS_MAX_ATTEMPTS = 5
+# Jobs of a reservation event handler run at the same time, unless the handler sets its own limit
+RESPA_RESERVATION_EVENTS_HANDLER_CONCURRENCY = 4
 
 RESPA_ACCESSIBILITY_API_BASE_URL = env('ACCESSIBILITY_API_BASE_URL')
 RESPA_ACCESSIBILITY_API_SYSTEM_ID = env('ACCESSIBILITY_API_SYSTEM_ID')
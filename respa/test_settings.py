@@ -3,6 +3,9 @@
 
 RESPA_CATERINGS_ENABLED = True
 RESPA_COMMENTS_ENABLED = True
+RESPA_MAILS_SEND_IMMEDIATELY = True
+RESPA_RESERVATION_EVENTS_RUN_IMMEDIATELY = True
+RESPA_EXCHANGE_UPLOAD_IMMEDIATELY = True
 RESPA_PAYMENTS_ENABLED = True
 # Bambora Payform provider settings
 RESPA_PAYMENTS_PROVIDER_CLASS = 'payments.providers.BamboraPayformProvider'
@@ -34,10 +34,12 @@
 ]
 
 if 'reports' in settings.INSTALLED_APPS:
-    from reports.api import DailyReservationsReport, ReservationDetailsReport
+    from reports.api import DailyReservationsReport, ReservationDetailsReport, ReportJobDownloadView, ReportJobView
     urlpatterns.extend([
         path('reports/daily_reservations/', DailyReservationsReport.as_view(), name='daily-reservations-report'),
         path('reports/reservation_details/', ReservationDetailsReport.as_view(), name='reservation-details-report'),
+        path('reports/jobs/<uuid:pk>/', ReportJobView.as_view(), name='report-job'),
+        path('reports/jobs/<uuid:pk>/download/', ReportJobDownloadView.as_view(), name='report-job-download'),
     ])
 
 if settings.RESPA_PAYMENTS_ENABLED:
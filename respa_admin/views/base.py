@@ -37,11 +37,32 @@ def get_period_formset(self):
             parent_class=self.model,
         )
 
-    def save_period_formset(self, period_formset):
-        self._delete_extra_periods_days(period_formset)
+    def save_period_formset(self, period_formset, update_all_hours=False):
+        period_filter_args = {self.object._meta.model_name: self.object}
+        old_ranges = {
+            period.id: (period.start, period.end) for period in Period.objects.filter(**period_filter_args)
+        }
+        changed_period_ids = self._delete_extra_periods_days(period_formset)
         period_formset.instance = self.object
         period_formset.save()
-        self.object.update_opening_hours()
+
+        if update_all_hours:
+            self.object.update_opening_hours()
+            return
+        # Only recalculate the opening hours of the days the changed periods cover
+        changed_ranges = [old_ranges[period_id] for period_id in changed_period_ids if period_id in old_ranges]
+        for form in period_formset.forms:
+            period = form.instance
+            if period.pk is None:
+                continue
+            if form.has_changed() or form.days.has_changed() or period.pk in changed_period_ids:
+                changed_ranges.append((period.start, period.end))
+                if period.pk in old_ranges:
+                    changed_ranges.append(old_ranges[period.pk])
+        if changed_ranges:
+            self.object.update_opening_hours(
+                min(start for start, end in changed_ranges), max(end for start, end in changed_ranges)
+            )
 
     def add_empty_forms(self, period_formset):
         # Extra forms are not added upon post so they
@@ -56,18 +77,26 @@ def add_empty_forms(self, period_formset):
         return period_formset
 
     def _delete_extra_periods_days(self, period_formset_with_days):
+        """
+        Delete the periods and days removed in the form
+
+        Returns the ids of the periods that were deleted or had days deleted.
+        """
         data = period_formset_with_days.data
         period_ids = self.get_formset_ids('periods', data)
+        changed_period_ids = set()
 
         if period_ids is None:
-            return
+            return changed_period_ids
 
         period_filter_args = {self.object._meta.model_name: self.object}
-        Period.objects.filter(**period_filter_args).exclude(pk__in=period_ids).delete()
+        deleted_periods = Period.objects.filter(**period_filter_args).exclude(pk__in=period_ids)
+        changed_period_ids.update(deleted_periods.values_list('id', flat=True))
+        deleted_periods.delete()
         period_count = self.to_int(data.get('periods-TOTAL_FORMS'))
 
         if not period_count:
-            return
+            return changed_period_ids
 
         for i in range(period_count):
             period_id = self.to_int(data.get('periods-{}-id'.format(i)))
@@ -77,7 +106,11 @@ def _delete_extra_periods_days(self, period_formset_with_days):
 
             day_ids = self.get_formset_ids('days-periods-{}'.format(i), data)
             if day_ids is not None:
-                Day.objects.filter(period=period_id).exclude(pk__in=day_ids).delete()
+                deleted_count = Day.objects.filter(period=period_id).exclude(pk__in=day_ids).delete()[0]
+                if deleted_count:
+                    changed_period_ids.add(period_id)
+
+        return changed_period_ids
 
     def get_formset_ids(self, formset_name, data):
         count = self.to_int(data.get('{}-TOTAL_FORMS'.format(formset_name)))
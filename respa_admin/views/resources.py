@@ -353,11 +353,13 @@ def get_form(self, form_class=None):
         return form
 
     def forms_valid(self, form, period_formset_with_days, resource_image_formset):
+        is_creating_new = self.object is None
         self.object = form.save()
         self._save_resource_purposes()
         self._delete_extra_images(resource_image_formset)
         self._save_resource_images(resource_image_formset)
-        self.save_period_formset(period_formset_with_days)
+        # A new resource gets the opening hours of its unit for all days
+        self.save_period_formset(period_formset_with_days, update_all_hours=is_creating_new)
         return HttpResponseRedirect(self.get_success_url())
 
     def forms_invalid(self, form, period_formset_with_days, resource_image_formset):
@@ -1,7 +1,9 @@
 from django.contrib.admin import ModelAdmin, site
 from django.forms.widgets import PasswordInput
 
-from respa_exchange.models import ExchangeConfiguration, ExchangeReservation, ExchangeResource
+from respa_exchange.models import (
+    ExchangeConfiguration, ExchangeReservation, ExchangeResource, ExchangeUploadOperation
+)
 
 
 class ExchangeResourceAdmin(ModelAdmin):
@@ -21,6 +23,13 @@ def has_delete_permission(self, request, obj=None):
         return False  # pragma: no cover
 
 
+class ExchangeUploadOperationAdmin(ModelAdmin):
+    list_display = ('exchange_resource', 'operation', 'reservation_id', 'state', 'attempts', 'created_at', 'sent_at')
+    list_filter = ('state', 'operation')
+    readonly_fields = ('attempts', 'last_error', 'created_at', 'sent_at')
+    raw_id_fields = ('exchange_resource', 'reservation')
+
+
 class ExchangeConfigurationAdmin(ModelAdmin):
     list_display = ('name', 'url', 'enabled')
     list_filter = ('enabled',)
@@ -35,3 +44,4 @@ def get_form(self, request, obj=None, **kwargs):  # pragma: no cover
 site.register(ExchangeReservation, ExchangeReservationAdmin)
 site.register(ExchangeResource, ExchangeResourceAdmin)
 site.register(ExchangeConfiguration, ExchangeConfigurationAdmin)
+site.register(ExchangeUploadOperation, ExchangeUploadOperationAdmin)
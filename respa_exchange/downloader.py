@@ -6,13 +6,17 @@
 import iso8601
 
 from lxml import etree
+from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.db.transaction import atomic
 from django.utils.timezone import now
 
 from sentry_sdk import configure_scope, push_scope, capture_message
 
-from resources.models.reservation import Reservation
-from respa_exchange.ews.calendar import GetCalendarItemsRequest, FindCalendarItemsRequest
+from resources.models.reservation import Reservation, reservation_collision_check
+from respa_exchange.ews.calendar import (
+    FindCalendarItemsRequest, GetCalendarItemsRequest, ItemError, SyncCalendarItemsRequest
+)
 from respa_exchange.ews.user import ResolveNamesRequest
 from respa_exchange.ews.objs import ItemID
 from respa_exchange.ews.xml import NAMESPACES
@@ -303,8 +307,68 @@ def fetch_reservation_data(ex_reservation):
     return items[0]
 
 
+def _get_sync_range(future_days):
+    start_date = now().replace(hour=0, minute=0, second=0)
+    return start_date, start_date + datetime.timedelta(days=future_days)
+
+
+def _sync_item(ex_resource, item_id, item, ex_reservation=None):
+    """
+    Create or update the reservation of an Exchange calendar item
+
+    :type ex_resource: respa_exchange.models.ExchangeResource
+    :type item_id: respa_exchange.ews.objs.ItemID
+    :type item: lxml.etree.Element
+    :param ex_reservation: the reservation of the item, if it already has one
+    :type ex_reservation: respa_exchange.models.ExchangeReservation|None
+    """
+    if ex_reservation and ex_reservation._change_key == item_id.change_key:
+        return  # Nothing changed
+
+    with configure_scope() as scope:
+        # Send the raw XML to Sentry for better debugging
+        scope.set_extra('item_xml', element_to_string(item))
+
+    item_props = _parse_item_props(ex_resource, item)
+
+    try:
+        with reservation_collision_check():
+            if not ex_reservation:  # It's a new one!
+                _create_reservation_from_exchange(item_id, ex_resource, item_props)
+            else:
+                # Things changed, so edit the reservation
+                _update_reservation_from_exchange(item_id, ex_reservation, ex_resource, item_props)
+    except ValidationError:
+        # The resource is double booked in Exchange. Respa doesn't allow
+        # overlapping reservations, so the item is left out.
+        log.warning("%s: Skipping item overlapping another reservation: %s", ex_resource.principal_email, item_id)
+        with push_scope() as scope:
+            scope.level = 'warning'
+            capture_message('Exchange item overlaps an existing reservation')
+
+
+def _delete_reservations(ex_reservations):
+    for ex_reservation in ex_reservations:
+        log.info("Deleting: %s", ex_reservation)
+        reservation = ex_reservation.reservation
+        ex_reservation.delete()
+        reservation.delete()
+
+
+def _get_latest_sync_state(ex_resource, session):
+    """
+    Get the sync state of the current contents of the calendar of an Exchange resource
+    """
+    sync_state = None
+    while True:
+        result = SyncCalendarItemsRequest(ex_resource.principal_email, sync_state, id_only=True).send(session)
+        sync_state = result.sync_state
+        if result.includes_last_item:
+            return sync_state
+
+
 @atomic
-def sync_from_exchange(ex_resource, future_days=365, no_op=False):
+def sync_from_exchange(ex_resource, future_days=365, no_op=False, update_sync_state=False):
     """
     Synchronize from Exchange to Respa
 
@@ -317,6 +381,8 @@ def sync_from_exchange(ex_resource, future_days=365, no_op=False):
     :type future_days: int
     :param no_op: If True, do not save the reservations
     :type no_op: bool
+    :param update_sync_state: If True, store the sync state for the following incremental syncs
+    :type update_sync_state: bool
     """
 
     # To avoid race conditions with the Respa API processes, we lock the
@@ -325,12 +391,16 @@ def sync_from_exchange(ex_resource, future_days=365, no_op=False):
 
     if not ex_resource.sync_to_respa and not no_op:
         return
-    start_date = now().replace(hour=0, minute=0, second=0)
-    end_date = start_date + datetime.timedelta(days=future_days)
+    start_date, end_date = _get_sync_range(future_days)
 
     with configure_scope() as scope:
         scope.set_extra('resource', str(ex_resource))
 
+    session = ex_resource.exchange.get_ews_session()
+    if update_sync_state and not no_op:
+        # The state is taken first, so that the changes made during the sync are applied by the next one
+        sync_state = _get_latest_sync_state(ex_resource, session)
+
     log.info(
         "%s: Requesting items between (%s..%s)",
         ex_resource.principal_email,
@@ -342,7 +412,6 @@ def sync_from_exchange(ex_resource, future_days=365, no_op=False):
         start_date=start_date,
         end_date=end_date
     )
-    session = ex_resource.exchange.get_ews_session()
     calendar_items = {}
     for item in gcir.send(session):
         calendar_items[ItemID.from_tree(item)] = item
@@ -361,18 +430,12 @@ def sync_from_exchange(ex_resource, future_days=365, no_op=False):
         return
 
     # First handle deletions . . .
-    items_to_delete = ExchangeReservation.objects.select_related("reservation").filter(
+    _delete_reservations(ExchangeReservation.objects.select_related("reservation").filter(
         managed_in_exchange=True,  # Reservations we've downloaded ...
         reservation__begin__gte=start_date,  # that are in ...
         reservation__end__lte=end_date,  # ... our get items range ...
         reservation__resource__exchange_resource=ex_resource,  # and belong to this resource,
-    ).exclude(item_id_hash__in=hashes)  # but aren't ones we're going to mangle
-
-    for ex_reservation in items_to_delete:
-        log.info("Deleting: %s", ex_reservation)
-        reservation = ex_reservation.reservation
-        ex_reservation.delete()
-        reservation.delete()
+    ).exclude(item_id_hash__in=hashes))  # but aren't ones we're going to mangle
 
     # And then creations/additions
 
@@ -383,23 +446,131 @@ def sync_from_exchange(ex_resource, future_days=365, no_op=False):
     }
 
     for item_id, item in calendar_items.items():
-        with configure_scope() as scope:
-            # Send the raw XML to Sentry for better debugging
-            scope.set_extra('item_xml', element_to_string(item))
+        _sync_item(ex_resource, item_id, item, extant_exchange_reservations.get(item_id.hash))
 
-        ex_reservation = extant_exchange_reservations.get(item_id.hash)
+    if update_sync_state:
+        ex_resource.sync_state = sync_state
+        ex_resource.last_full_sync_at = now()
+        ex_resource.save(update_fields=('sync_state', 'last_full_sync_at'))
 
-        item_props = _parse_item_props(ex_resource, item)
+    with configure_scope() as scope:
+        scope.remove_extra('item_xml')
+        scope.remove_extra('resource')
 
-        if not ex_reservation:  # It's a new one!
-            ex_reservation = _create_reservation_from_exchange(item_id, ex_resource, item_props)
-        else:
-            if ex_reservation._change_key != item_id.change_key:
-                # Things changed, so edit the reservation
-                _update_reservation_from_exchange(item_id, ex_reservation, ex_resource, item_props)
+    log.info("%s: download processing complete", ex_resource.principal_email)
+
+
+def _is_recurring(item):
+    calendar_item_type = item.find('t:CalendarItemType', namespaces=NAMESPACES)
+    return calendar_item_type is not None and calendar_item_type.text == 'RecurringMaster'
+
+
+def _is_in_range(item, start_date, end_date):
+    start = iso8601.parse_date(item.find('t:Start', namespaces=NAMESPACES).text)
+    end = iso8601.parse_date(item.find('t:End', namespaces=NAMESPACES).text)
+    return end > start_date and start < end_date
+
+
+def _needs_full_sync(ex_resource):
+    if not ex_resource.sync_state or not ex_resource.last_full_sync_at:
+        return True
+    interval = datetime.timedelta(hours=getattr(settings, "RESPA_EXCHANGE_FULL_SYNC_INTERVAL", 24))
+    return ex_resource.last_full_sync_at < now() - interval
+
+
+def _get_changes(ex_resource, session):
+    """
+    Get the calendar items changed and deleted since the sync state of an Exchange resource
+
+    :return: the new sync state, the changed items by their hash and the hashes of the deleted items
+    """
+    sync_state = ex_resource.sync_state
+    changed_items = {}
+    deleted_hashes = set()
+    while True:
+        result = SyncCalendarItemsRequest(ex_resource.principal_email, sync_state).send(session)
+        for item in result.changed_items:
+            item_id = ItemID.from_tree(item)
+            changed_items[item_id.hash] = (item_id, item)
+            deleted_hashes.discard(item_id.hash)
+        for item_id in result.deleted_item_ids:
+            changed_items.pop(item_id.hash, None)
+            deleted_hashes.add(item_id.hash)
+        sync_state = result.sync_state
+        if result.includes_last_item:
+            return sync_state, changed_items, deleted_hashes
+
+
+@atomic
+def sync_changes_from_exchange(ex_resource, future_days=365):
+    """
+    Synchronize the changes made in Exchange since the previous sync to Respa
+
+    Only the changed items are fetched, using the EWS sync state stored on
+    the resource. A full sync_from_exchange is done instead when there is no
+    sync state, when the previous full sync is older than
+    RESPA_EXCHANGE_FULL_SYNC_INTERVAL hours, when Exchange rejects the
+    state, or when a recurring item has changed, as only the full sync lists
+    the occurrences of recurring items.
+
+    :param ex_resource: The Exchange resource to sync
+    :type ex_resource: respa_exchange.models.ExchangeResource
+    :param future_days: How many days into the future new items are downloaded
+    :type future_days: int
+    """
+    ex_resource = ExchangeResource.objects.select_for_update().get(id=ex_resource.id)
+    if not ex_resource.sync_to_respa:
+        return
+    if _needs_full_sync(ex_resource):
+        return sync_from_exchange(ex_resource, future_days, update_sync_state=True)
+
+    session = ex_resource.exchange.get_ews_session()
+    try:
+        sync_state, changed_items, deleted_hashes = _get_changes(ex_resource, session)
+    except ItemError as error:
+        if error.code != 'ErrorInvalidSyncStateData':
+            raise
+        log.warning("%s: Sync state rejected, doing a full sync", ex_resource.principal_email)
+        return sync_from_exchange(ex_resource, future_days, update_sync_state=True)
+
+    if any(_is_recurring(item) for item_id, item in changed_items.values()):
+        log.info("%s: Recurring item changed, doing a full sync", ex_resource.principal_email)
+        return sync_from_exchange(ex_resource, future_days, update_sync_state=True)
+
+    log.info(
+        "%s: Received %d changed and %d deleted items",
+        ex_resource.principal_email,
+        len(changed_items),
+        len(deleted_hashes)
+    )
+
+    with configure_scope() as scope:
+        scope.set_extra('resource', str(ex_resource))
+
+    _delete_reservations(ExchangeReservation.objects.select_related("reservation").filter(
+        managed_in_exchange=True,
+        item_id_hash__in=deleted_hashes,
+        reservation__resource__exchange_resource=ex_resource,
+    ))
+
+    extant_exchange_reservations = {
+        ex_reservation.item_id_hash: ex_reservation
+        for ex_reservation
+        in ExchangeReservation.objects.select_related("reservation").filter(item_id_hash__in=changed_items.keys())
+    }
+    start_date, end_date = _get_sync_range(future_days)
+    for item_hash, (item_id, item) in changed_items.items():
+        ex_reservation = extant_exchange_reservations.get(item_hash)
+        # Like in the full sync, only the items in the sync range are downloaded
+        if ex_reservation is None and not _is_in_range(item, start_date, end_date):
+            continue
+        _sync_item(ex_resource, item_id, item, ex_reservation)
+
+    ex_resource.sync_state = sync_state
+    ex_resource.save(update_fields=('sync_state',))
 
     with configure_scope() as scope:
         scope.remove_extra('item_xml')
         scope.remove_extra('resource')
 
-    log.info("%s: download processing complete", ex_resource.principal_email)
+    log.info("%s: incremental download processing complete", ex_resource.principal_email)
@@ -1,3 +1,5 @@
+from collections import namedtuple
+
 from .base import EWSRequest
 from .folders import get_distinguished_folder_id_element
 from .objs import ItemID
@@ -78,6 +80,77 @@ def send(self, sess):
         return resp.xpath("//t:CalendarItem", namespaces=NAMESPACES)
 
 
+class ItemError(Exception):
+    """
+    The error of a single item of a request manipulating several items
+    """
+
+    def __init__(self, code, text=None):
+        self.code = code
+        self.text = text
+        super(ItemError, self).__init__("%s (%s)" % (text, code))
+
+
+SyncCalendarItemsResult = namedtuple('SyncCalendarItemsResult', (
+    'sync_state', 'includes_last_item', 'changed_items', 'deleted_item_ids'
+))
+
+
+class SyncCalendarItemsRequest(EWSRequest):
+    """
+    An EWS request for the changes in a principal's calendar folder since a sync state.
+    """
+
+    def __init__(self, principal, sync_state=None, max_changes=512, id_only=False):
+        """
+        Initialize the request.
+
+        :param principal: The principal email whose calendar to query.
+        :param sync_state: The sync state returned by the previous request, or None to get all the items
+        :param max_changes: Maximum number of changes returned at once
+        :param id_only: Whether to return only the IDs of the changed items
+        """
+        body = M.SyncFolderItems(
+            M.ItemShape(
+                T.BaseShape('IdOnly' if id_only else 'AllProperties')
+            ),
+            M.SyncFolderId(get_distinguished_folder_id_element(principal, "calendar")),
+            *([M.SyncState(sync_state)] if sync_state else []),
+            M.MaxChangesReturned(str(max_changes))
+        )
+        super().__init__(body, impersonation=principal)
+
+    def send(self, sess):
+        """
+        Send the request and return the changes.
+
+        A rejected sync state raises an ItemError with the code ErrorInvalidSyncStateData.
+
+        :type sess: respa_exchange.session.ExchangeSession
+        :rtype: SyncCalendarItemsResult
+        """
+        resp = sess.soap(self)
+        message = resp.find("*//m:SyncFolderItemsResponseMessage", namespaces=NAMESPACES)
+        if message.attrib.get("ResponseClass") == "Error":
+            code = message.find("m:ResponseCode", namespaces=NAMESPACES)
+            text = message.find("m:MessageText", namespaces=NAMESPACES)
+            raise ItemError(
+                code=(code.text if code is not None else None),
+                text=(text.text if text is not None else None),
+            )
+        includes_last_item = message.find("m:IncludesLastItemInRange", namespaces=NAMESPACES)
+        return SyncCalendarItemsResult(
+            sync_state=message.find("m:SyncState", namespaces=NAMESPACES).text,
+            includes_last_item=(includes_last_item is None or includes_last_item.text == "true"),
+            changed_items=message.xpath("m:Changes/t:Create/t:CalendarItem | m:Changes/t:Update/t:CalendarItem",
+                                        namespaces=NAMESPACES),
+            deleted_item_ids=[
+                ItemID(id=item_id.attrib["Id"], change_key=item_id.attrib.get("ChangeKey"))
+                for item_id in message.xpath("m:Changes/t:Delete/t:ItemId", namespaces=NAMESPACES)
+            ],
+        )
+
+
 class BaseCalendarItemRequest(EWSRequest):
     """
     Base class for requests somehow manipulating calendar items.
@@ -132,7 +205,83 @@ def send(self, sess):
         return ItemID.from_tree(sess.soap(self))
 
 
-class CreateCalendarItemRequest(BaseCalendarItemRequest):
+def _get_send_notifications_string(send_notifications):
+    return "SendToAllAndSaveCopy" if send_notifications else "SendToNone"
+
+
+def get_item_results(tree, message_tag):
+    """
+    Get the outcome of each item of a request manipulating several items
+
+    The response has a response message for each item, in the order of the
+    items in the request. An item is successful if its message has no error.
+
+    :type tree: lxml.etree.Element
+    :param message_tag: the tag of the response messages, e.g. CreateItemResponseMessage
+    :return: the ItemID (or None if the message has no item ID) or an ItemError for each item
+    :rtype: list[ItemID|None|ItemError]
+    """
+    results = []
+    for message in tree.xpath("//m:%s" % message_tag, namespaces=NAMESPACES):
+        if message.attrib.get("ResponseClass") == "Error":
+            code = message.find("m:ResponseCode", namespaces=NAMESPACES)
+            text = message.find("m:MessageText", namespaces=NAMESPACES)
+            results.append(ItemError(
+                code=(code.text if code is not None else None),
+                text=(text.text if text is not None else None),
+            ))
+            continue
+        item_id = message.find(".//t:ItemId", namespaces=NAMESPACES)
+        if item_id is None:
+            results.append(None)
+        else:
+            results.append(ItemID(id=item_id.attrib["Id"], change_key=item_id.attrib.get("ChangeKey")))
+    return results
+
+
+class CreateCalendarItemsRequest(BaseCalendarItemRequest):
+    """
+    Encapsulates a request to create several calendar items in a calendar.
+    """
+
+    def __init__(
+        self,
+        principal,
+        items_props,
+        send_notifications=True,
+    ):
+        """
+        Initialize the request.
+
+        :param principal: Principal email to impersonate
+        :type principal: str
+        :param items_props: Dicts of calendar item properties, one for each item
+        :type items_props: list[dict[str, object]]
+        """
+        # See http://msdn.microsoft.com/en-us/library/aa564690(v=exchg.140).aspx
+
+        items = [
+            T.CalendarItem(*[node for (field_id, node) in self._convert_props(item_props, add_defaults=True)])
+            for item_props in items_props
+        ]
+        root = M.CreateItem(
+            M.SavedItemFolderId(get_distinguished_folder_id_element(principal, "calendar")),
+            M.Items(*items),
+            SendMeetingInvitations=_get_send_notifications_string(send_notifications)
+        )
+        super(CreateCalendarItemsRequest, self).__init__(body=root, impersonation=principal)
+
+    def send_items(self, sess):
+        """
+        Send the request and return the outcome of each item
+
+        :type sess: respa_exchange.session.ExchangeSession
+        :rtype: list[ItemID|ItemError]
+        """
+        return get_item_results(sess.soap(self), "CreateItemResponseMessage")
+
+
+class CreateCalendarItemRequest(CreateCalendarItemsRequest):
     """
     Encapsulates a request to create a calendar item.
     """
@@ -151,27 +300,60 @@ def __init__(
         :param item_props: Dict of calendar item properties
         :type item_props: dict[str, object]
         """
-        # See http://msdn.microsoft.com/en-us/library/aa564690(v=exchg.140).aspx
+        super(CreateCalendarItemRequest, self).__init__(principal, [item_props], send_notifications)
 
-        fields = [
-            node
-            for (field_id, node)
-            in self._convert_props(item_props, add_defaults=True)
-        ]
-        if send_notifications:
-            send_notifications_string = "SendToAllAndSaveCopy"
-        else:
-            send_notifications_string = "SendToNone"
 
-        root = M.CreateItem(
-            M.SavedItemFolderId(get_distinguished_folder_id_element(principal, "calendar")),
-            M.Items(T.CalendarItem(*fields)),
-            SendMeetingInvitations=send_notifications_string
+class UpdateCalendarItemsRequest(BaseCalendarItemRequest):
+    """
+    Encapsulates a request to update several existing calendar items.
+    """
+
+    def __init__(
+        self,
+        principal,
+        item_updates,
+        send_notifications=True,
+    ):
+        """
+        Initialize the request.
+
+        :param principal: Principal email to impersonate
+        :type principal: str
+        :param item_updates: Item ID objects and the dicts of properties to update on them
+        :type item_updates: list[tuple[respa_exchange.objs.ItemID, dict[str, object]]]
+        """
+        item_changes = []
+        for item_id, update_props in item_updates:
+            updates = []
+            for field_uri, node in self._convert_props(update_props):
+                updates.append(T.SetItemField(
+                    T.FieldURI(FieldURI=field_uri),
+                    T.CalendarItem(node)
+                ))
+            if not updates:
+                raise ValueError("No updates")
+            item_changes.append(T.ItemChange(item_id.to_xml(), T.Updates(*updates)))
+
+        root = M.UpdateItem(
+            M.ItemChanges(*item_changes),
+            ConflictResolution="AlwaysOverwrite",
+            MessageDisposition="SendAndSaveCopy",
+            SendMeetingInvitationsOrCancellations=_get_send_notifications_string(send_notifications)
         )
-        super(CreateCalendarItemRequest, self).__init__(body=root, impersonation=principal)
+
+        super(UpdateCalendarItemsRequest, self).__init__(root, impersonation=principal)
+
+    def send_items(self, sess):
+        """
+        Send the request and return the outcome of each item
+
+        :type sess: respa_exchange.session.ExchangeSession
+        :rtype: list[ItemID|ItemError]
+        """
+        return get_item_results(sess.soap(self), "UpdateItemResponseMessage")
 
 
-class UpdateCalendarItemRequest(BaseCalendarItemRequest):
+class UpdateCalendarItemRequest(UpdateCalendarItemsRequest):
     """
     Encapsulates a request to update an existing calendar item.
     """
@@ -193,35 +375,47 @@ def __init__(
         :param update_props: Dict of properties to update
         :type update_props: dict[str, object]
         """
-        updates = []
-        for field_uri, node in self._convert_props(update_props):
-            updates.append(T.SetItemField(
-                T.FieldURI(FieldURI=field_uri),
-                T.CalendarItem(node)
-            ))
-        if not updates:
-            raise ValueError("No updates")
+        super(UpdateCalendarItemRequest, self).__init__(principal, [(item_id, update_props)], send_notifications)
 
-        if send_notifications:
-            send_notifications_string = "SendToAllAndSaveCopy"
-        else:
-            send_notifications_string = "SendToNone"
-        root = M.UpdateItem(
-            M.ItemChanges(
-                T.ItemChange(
-                    item_id.to_xml(),
-                    T.Updates(*updates)
-                )
-            ),
-            ConflictResolution="AlwaysOverwrite",
-            MessageDisposition="SendAndSaveCopy",
-            SendMeetingInvitationsOrCancellations=send_notifications_string
+
+class DeleteCalendarItemsRequest(EWSRequest):
+    """
+    Encapsulates a request to delete several existing calendar items.
+    """
+
+    def __init__(
+        self,
+        principal,
+        item_ids,
+        send_notifications=True,
+    ):
+        """
+        Initialize the request.
+
+        :param principal: Principal email to impersonate
+        :param item_ids: Item ID objects
+        :type item_ids: list[respa_exchange.objs.ItemID]
+        """
+        root = M.DeleteItem(
+            M.ItemIds(*[item_id.to_xml() for item_id in item_ids]),
+            DeleteType="HardDelete",
+            SendMeetingCancellations=_get_send_notifications_string(send_notifications),
+            AffectedTaskOccurrences="AllOccurrences"
         )
+        super(DeleteCalendarItemsRequest, self).__init__(root, impersonation=principal)
+
+    def send_items(self, sess):
+        """
+        Send the request and return the outcome of each item
 
-        super(UpdateCalendarItemRequest, self).__init__(root, impersonation=principal)
+        :type sess: respa_exchange.session.ExchangeSession
+        :return: None for each deleted item, an ItemError for the others
+        :rtype: list[None|ItemError]
+        """
+        return get_item_results(sess.soap(self), "DeleteItemResponseMessage")
 
 
-class DeleteCalendarItemRequest(EWSRequest):
+class DeleteCalendarItemRequest(DeleteCalendarItemsRequest):
     """
     Encapsulates a request to delete an existing calendar item.
     """
@@ -239,17 +433,7 @@ def __init__(
         :param item_id: Item ID object
         :type item_id: respa_exchange.objs.ItemID
         """
-        if send_notifications:
-            send_notifications_string = "SendToAllAndSaveCopy"
-        else:
-            send_notifications_string = "SendToNone"
-        root = M.DeleteItem(
-            M.ItemIds(item_id.to_xml()),
-            DeleteType="HardDelete",
-            SendMeetingCancellations=send_notifications_string,
-            AffectedTaskOccurrences="AllOccurrences"
-        )
-        super(DeleteCalendarItemRequest, self).__init__(root, impersonation=principal)
+        super(DeleteCalendarItemRequest, self).__init__(principal, [item_id], send_notifications)
 
     def send(self, sess):
         """
@@ -5,7 +5,7 @@
 
 from django.db import connections
 
-from respa_exchange.downloader import sync_from_exchange
+from respa_exchange.downloader import sync_changes_from_exchange
 from respa_exchange.ews.notifications import (
     GetStreamingEventsRequest, StreamingEventError, SubscribeRequest, UnsubscribeRequest
 )
@@ -243,6 +243,7 @@ class NotificationListener(object):
     """
 
     SUBSCRIPTION_MANAGE_INTERVAL = 180
+    RESOURCE_SYNC_INTERVAL = 900
     DATABASE_RECONNECT_INTERVAL = 1800
 
     def __init__(self, sync_after_start=False):
@@ -258,6 +259,10 @@ def __init__(self, sync_after_start=False):
             seconds=self.DATABASE_RECONNECT_INTERVAL,
             on_timeout=self.reconnect_database,
         )
+        self.resource_sync_timer = EventedTimeout(
+            seconds=self.RESOURCE_SYNC_INTERVAL,
+            on_timeout=self.sync_resources,
+        )
         self._please_stop = False
 
     def start(self):
@@ -269,6 +274,7 @@ def start(self):
         """
         self.subscription_manage_timer.reset()
         self.database_reconnect_timer.reset()
+        self.resource_sync_timer.reset()
         self._please_stop = False
 
         log.debug('Starting listeners.')
@@ -299,6 +305,7 @@ def step(self):
         """
         self.subscription_manage_timer.check()
         self.database_reconnect_timer.check()
+        self.resource_sync_timer.check()
         # handle_events() will sleep if no events are available
         self.handle_events()
 
@@ -336,6 +343,17 @@ def manage_subscriptions(self):
         for listener in self.listeners.values():
             listener.manage_subscriptions()
 
+    def sync_resources(self):
+        """
+        Queue a sync of all the subscribed resources.
+
+        The syncs are incremental, so this is cheap; it picks up changes
+        whose notifications were missed and starts the periodic full syncs.
+        """
+        for listener in self.listeners.values():
+            for resource in listener.resource_to_subscription_map:
+                self.post_event(SyncEvent(resource=resource))
+
     def handle_events(self):
         """
         Process whatever events are in the event queue.
@@ -366,12 +384,11 @@ def handle_events(self):
             if not event.resource:  # pragma: no cover
                 log.warn('Unable to handle resourceless event %r', event)
                 return
-            # TODO: Maybe process different events in different ways? ->
-            #       Right now, whatever happens we just re-sync everything.
+            # Whatever happens, the changes of the resource are synced since its last sync state.
             changed_resources.add(event.resource)
 
         for resource in changed_resources:
-            sync_from_exchange(resource)
+            sync_changes_from_exchange(resource)
 
     def close(self):
         for listener in self.listeners.values():
@@ -2,7 +2,7 @@
 
 from django.core.management import BaseCommand
 
-from respa_exchange.downloader import sync_from_exchange
+from respa_exchange.downloader import sync_changes_from_exchange, sync_from_exchange
 from respa_exchange.management.base import configure_logging, get_active_download_resources, select_resources
 from respa_exchange.models import ExchangeConfiguration
 
@@ -13,6 +13,8 @@ def add_arguments(self, parser):
                             help='List supported exchange resources')
         parser.add_argument('--resource', action='append', dest='resources',
                             help='Sync only specified resource(s)')
+        parser.add_argument('--incremental', action='store_true', dest='incremental', default=False,
+                            help='Sync only the changes made since the previous sync')
 
     def handle(self, verbosity, *args, **options):
         if verbosity >= 2:
@@ -32,4 +34,7 @@ def handle(self, verbosity, *args, **options):
             resources = select_resources(resources, options['resources'])
 
         for resource in resources:
-            sync_from_exchange(resource)
+            if options['incremental']:
+                sync_changes_from_exchange(resource)
+            else:
+                sync_from_exchange(resource, update_sync_state=True)
@@ -0,0 +1,44 @@
+import logging
+import time
+
+from django.core.management import BaseCommand
+
+from respa_exchange.management.base import configure_logging
+from respa_exchange.models import ExchangeResource, ExchangeUploadOperation
+from respa_exchange.uploader import send_pending_operations
+
+log = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Pushes the queued reservation changes to Exchange.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, dest='batch_size',
+                            help='Number of operations of a resource sent at once')
+        parser.add_argument('--loop', action='store_true', dest='loop', default=False,
+                            help='Keep polling the queue instead of exiting when it is empty')
+        parser.add_argument('--interval', type=float, default=5, dest='interval',
+                            help='Seconds to wait between polls when looping')
+
+    def handle(self, verbosity, *args, **options):
+        if verbosity >= 2:
+            configure_logging(level=logging.DEBUG)
+
+        while True:
+            sent = failed = 0
+            resource_ids = ExchangeUploadOperation.objects.due().order_by()\
+                .values_list('exchange_resource', flat=True).distinct()
+            for ex_resource in ExchangeResource.objects.filter(id__in=list(resource_ids)):
+                while True:
+                    # Resources locked by another worker or by a download are left for the next round
+                    result = send_pending_operations(ex_resource, batch_size=options['batch_size'])
+                    if not result or not any(result):
+                        break
+                    sent += result[0]
+                    failed += result[1]
+            if sent or failed:
+                log.info('Sent %d Exchange upload operation(s), %d failed.' % (sent, failed))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
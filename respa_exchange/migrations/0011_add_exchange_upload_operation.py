@@ -0,0 +1,46 @@
+# Generated by Django 2.2.28 on 2026-10-17 17:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('resources', '0101_add_reservation_event_job'),
+        ('respa_exchange', '0010_add_exchange_user_updated_at_field'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExchangeUploadOperation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('operation', models.CharField(choices=[('create', 'create'), ('update', 'update'), ('delete', 'delete')], max_length=16, verbose_name='operation')),
+                ('send_notifications', models.BooleanField(default=True, verbose_name='send notifications')),
+                ('_item_id', models.CharField(blank=True, db_column='item_id', editable=False, max_length=200)),
+                ('_change_key', models.CharField(blank=True, db_column='change_key', editable=False, max_length=100)),
+                ('state', models.CharField(choices=[('pending', 'pending'), ('done', 'done'), ('failed', 'failed')], default='pending', max_length=16, verbose_name='state')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='attempts')),
+                ('last_error', models.TextField(blank=True, verbose_name='last error')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='time of creation')),
+                ('send_after', models.DateTimeField(default=django.utils.timezone.now, verbose_name='send after')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='time of sending')),
+                ('exchange_resource', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_operations', to='respa_exchange.ExchangeResource', verbose_name='Exchange resource')),
+                ('reservation', models.ForeignKey(blank=True, db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='resources.Reservation', verbose_name='reservation')),
+            ],
+            options={
+                'verbose_name': 'Exchange upload operation',
+                'verbose_name_plural': 'Exchange upload operations',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='exchangeuploadoperation',
+            index=models.Index(fields=['exchange_resource', 'state', 'send_after'], name='respa_excha_exchang_f59bc2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exchangeuploadoperation',
+            index=models.Index(fields=['reservation', 'state'], name='respa_excha_reserva_83d725_idx'),
+        ),
+    ]
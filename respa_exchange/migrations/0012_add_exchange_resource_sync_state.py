@@ -0,0 +1,23 @@
+# Generated by Django 2.2.28 on 2026-10-17 17:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('respa_exchange', '0011_add_exchange_upload_operation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exchangeresource',
+            name='sync_state',
+            field=models.TextField(blank=True, editable=False, verbose_name='sync state'),
+        ),
+        migrations.AddField(
+            model_name='exchangeresource',
+            name='last_full_sync_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='time of last full sync'),
+        ),
+    ]
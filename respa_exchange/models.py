@@ -1,3 +1,5 @@
+import datetime
+
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db import models
@@ -107,6 +109,11 @@ class ExchangeResource(models.Model):
         unique=True,
         help_text=_('the email address for this resource in Exchange')
     )
+    # The state of the incremental download, see respa_exchange.downloader.sync_changes_from_exchange
+    sync_state = models.TextField(verbose_name=_('sync state'), blank=True, editable=False)
+    last_full_sync_at = models.DateTimeField(
+        verbose_name=_('time of last full sync'), null=True, blank=True, editable=False
+    )
 
     class Meta:
         verbose_name = _("Exchange resource")
@@ -221,6 +228,108 @@ def item_id(self, value):
         self.item_id_hash = value.hash
 
 
+class ExchangeUploadOperationQuerySet(models.QuerySet):
+    def due(self):
+        return self.filter(state=ExchangeUploadOperation.PENDING, send_after__lte=timezone.now())
+
+
+class ExchangeUploadOperation(models.Model):
+    """
+    A change of a Respa reservation waiting to be pushed to Exchange by the respa_exchange_upload worker.
+
+    Creations and updates are pushed as the reservation is when the operation
+    is sent, so a pending operation covers all the later changes too.
+    Deletions carry the item ID, as the reservation may be gone by then.
+    """
+    CREATE = 'create'
+    UPDATE = 'update'
+    DELETE = 'delete'
+    OPERATION_CHOICES = (
+        (CREATE, _('create')),
+        (UPDATE, _('update')),
+        (DELETE, _('delete')),
+    )
+
+    PENDING = 'pending'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATE_CHOICES = (
+        (PENDING, _('pending')),
+        (DONE, _('done')),
+        (FAILED, _('failed')),
+    )
+
+    exchange_resource = models.ForeignKey(
+        ExchangeResource, verbose_name=_('Exchange resource'), on_delete=models.CASCADE,
+        related_name='upload_operations',
+    )
+    operation = models.CharField(verbose_name=_('operation'), max_length=16, choices=OPERATION_CHOICES)
+    reservation = models.ForeignKey(
+        Reservation, verbose_name=_('reservation'), null=True, blank=True, related_name='+',
+        # Not constrained, so that deleting a reservation doesn't wait for a worker sending its operation
+        on_delete=models.DO_NOTHING, db_constraint=False, db_index=False,
+    )
+    send_notifications = models.BooleanField(verbose_name=_('send notifications'), default=True)
+    _item_id = models.CharField(max_length=200, blank=True, editable=False, db_column='item_id')
+    _change_key = models.CharField(max_length=100, blank=True, editable=False, db_column='change_key')
+
+    state = models.CharField(verbose_name=_('state'), max_length=16, choices=STATE_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(verbose_name=_('attempts'), default=0)
+    last_error = models.TextField(verbose_name=_('last error'), blank=True)
+    created_at = models.DateTimeField(verbose_name=_('time of creation'), auto_now_add=True)
+    send_after = models.DateTimeField(verbose_name=_('send after'), default=timezone.now)
+    sent_at = models.DateTimeField(verbose_name=_('time of sending'), null=True, blank=True)
+
+    objects = ExchangeUploadOperationQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = _("Exchange upload operation")
+        verbose_name_plural = _("Exchange upload operations")
+        indexes = [
+            models.Index(fields=['exchange_resource', 'state', 'send_after']),
+            models.Index(fields=['reservation', 'state']),
+        ]
+
+    def __str__(self):
+        return "%s of %s on %s (%s)" % (self.operation, self.reservation_id, self.exchange_resource_id, self.state)
+
+    @property
+    def item_id(self):
+        """
+        The Exchange item of a deleted reservation
+
+        :rtype: respa_exchange.objs.ItemID
+        """
+        return ItemID(id=self._item_id, change_key=self._change_key)
+
+    @item_id.setter
+    def item_id(self, value):
+        assert isinstance(value, ItemID)
+        self._item_id = value.id
+        self._change_key = value.change_key
+
+    def mark_sent(self):
+        self.attempts += 1
+        self.state = self.DONE
+        self.sent_at = timezone.now()
+        self.save(update_fields=('attempts', 'state', 'sent_at'))
+
+    def mark_failed(self, error):
+        """
+        Record a failed attempt to send the operation
+
+        The operation is retried with an exponential backoff until
+        RESPA_EXCHANGE_UPLOAD_MAX_ATTEMPTS is reached.
+        """
+        self.attempts += 1
+        self.last_error = str(error)
+        if self.attempts >= getattr(settings, "RESPA_EXCHANGE_UPLOAD_MAX_ATTEMPTS", 5):
+            self.state = self.FAILED
+        else:
+            self.send_after = timezone.now() + datetime.timedelta(minutes=2 ** self.attempts)
+        self.save(update_fields=('attempts', 'last_error', 'state', 'send_after'))
+
+
 class ExchangeUser(models.Model):
     exchange = models.ForeignKey(
         verbose_name=_('Exchange configuration'),
@@ -1,13 +1,20 @@
 from django.conf import settings
-from django.db import transaction
 
-from respa_exchange.models import ExchangeReservation, ExchangeResource
-from respa_exchange.uploader import create_on_remote, delete_on_remote, update_on_remote
+from respa_exchange.models import ExchangeReservation, ExchangeResource, ExchangeUploadOperation
+from respa_exchange.uploader import send_pending_operations
 
 
-def handle_reservation_save(instance, **kwargs):
+def _send_immediately(exchange_resource):
+    if getattr(settings, "RESPA_EXCHANGE_UPLOAD_IMMEDIATELY", False):
+        send_pending_operations(exchange_resource, skip_locked=False)
+
+
+def handle_reservation_save(instance, created=False, **kwargs):
     """
-    Django signal handler for updating changed/created reservations on remote Exchanges.
+    Django signal handler for queuing changed/created reservations to be uploaded to remote Exchanges.
+
+    The reservation is pushed by the respa_exchange_upload worker. If the
+    reservation already has a pending operation, it covers this change too.
 
     :param instance: A Reservation instance
     :type instance: resources.models.Reservation
@@ -22,34 +29,32 @@ def handle_reservation_save(instance, **kwargs):
         # we don't want to push it back up!
         return
 
-    with transaction.atomic():
-        exchange_resource = ExchangeResource.objects.filter(
-            sync_from_respa=True, resource=instance.resource
-        ).select_for_update().select_related("exchange").first()
-        if not exchange_resource:  # Not an Exchange-enabled resource; never mind.
-            return
+    exchange_resource = ExchangeResource.objects.filter(sync_from_respa=True, resource=instance.resource_id).first()
+    if not exchange_resource:  # Not an Exchange-enabled resource; never mind.
+        return
 
-        exchange_reservation = ExchangeReservation.objects.filter(
+    send_notifications = not getattr(instance, "_skip_notifications", False)
+    # The operations being sent by a worker are locked, and a new one is queued after them.
+    pending_operation = ExchangeUploadOperation.objects.filter(
+        reservation=instance, state=ExchangeUploadOperation.PENDING
+    ).exclude(operation=ExchangeUploadOperation.DELETE).select_for_update(skip_locked=True).first()
+    if pending_operation:
+        if send_notifications and not pending_operation.send_notifications:
+            pending_operation.send_notifications = True
+            pending_operation.save(update_fields=('send_notifications',))
+    else:
+        ExchangeUploadOperation.objects.create(
+            exchange_resource=exchange_resource,
             reservation=instance,
-            # If this reservation has come from Exchange,
-            # we don't want to upload changes made to it.
-            managed_in_exchange=False
-        ).first()
-        if not exchange_reservation:  # First sync? How exciting!
-            exchange_reservation = ExchangeReservation(
-                reservation=instance,
-                exchange=exchange_resource.exchange,
-                principal_email=exchange_resource.principal_email
-            )
-
-            create_on_remote(exchange_reservation)
-        else:
-            update_on_remote(exchange_reservation)
+            operation=(ExchangeUploadOperation.CREATE if created else ExchangeUploadOperation.UPDATE),
+            send_notifications=send_notifications,
+        )
+    _send_immediately(exchange_resource)
 
 
 def handle_reservation_delete(instance, **kwargs):
     """
-    Django signal handler for deleting reservation-related appointments from Exchange
+    Django signal handler for queuing the deletion of reservation-related appointments from Exchange
 
     :param instance: A Reservation instance
     :type instance: resources.models.Reservation
@@ -59,19 +64,33 @@ def handle_reservation_delete(instance, **kwargs):
     if not getattr(settings, "RESPA_EXCHANGE_ENABLED", True):
         return
 
-    with transaction.atomic():
-        exchange_resource = ExchangeResource.objects.filter(
-            sync_from_respa=True, resource=instance.resource
-        ).select_for_update().select_related("exchange").first()
-        if not exchange_resource:  # Not an Exchange-enabled resource; never mind.
-            return
+    exchange_resource = ExchangeResource.objects.filter(sync_from_respa=True, resource=instance.resource_id).first()
+    if not exchange_resource:  # Not an Exchange-enabled resource; never mind.
+        return
 
-        exchange_reservation = ExchangeReservation.objects.filter(
-            reservation=instance,
-            # If this reservation has come from Exchange,
-            # we don't want to upload deletions.
-            managed_in_exchange=False
-        ).first()
-        if exchange_reservation:
-            delete_on_remote(exchange_reservation)
-            assert not exchange_reservation.pk
+    # The pending creations and updates of the reservation are superseded by its deletion
+    superseded_ids = list(ExchangeUploadOperation.objects.filter(
+        reservation=instance, state=ExchangeUploadOperation.PENDING
+    ).select_for_update(skip_locked=True).values_list('id', flat=True))
+    ExchangeUploadOperation.objects.filter(id__in=superseded_ids).delete()
+
+    exchange_reservation = ExchangeReservation.objects.filter(
+        reservation=instance,
+        # If this reservation has come from Exchange,
+        # we don't want to upload deletions.
+        managed_in_exchange=False
+    ).first()
+    if not exchange_reservation:
+        return
+
+    operation = ExchangeUploadOperation(
+        exchange_resource=exchange_resource,
+        reservation=instance,
+        operation=ExchangeUploadOperation.DELETE,
+        send_notifications=not getattr(instance, "_skip_notifications", False),
+    )
+    operation.item_id = exchange_reservation.item_id
+    operation.save()
+    # The link has to go with the reservation; the operation remembers the item
+    exchange_reservation.delete()
+    _send_immediately(exchange_resource)
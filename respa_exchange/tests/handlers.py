@@ -67,6 +67,8 @@ def handle_update(self, request):
 class FindItemsHandler(object):
     def __init__(self):
         self._email_to_props = defaultdict(dict)
+        # The sync state of a calendar is the number of changes in its log already returned
+        self._email_to_changes = defaultdict(list)
 
     def handle_find_items(self, request):
         if not request.xpath("//m:FindItem", namespaces=NAMESPACES):
@@ -94,6 +96,44 @@ def handle_find_items(self, request):
             )
         )
 
+    def handle_sync_folder_items(self, request):
+        if not request.xpath("//m:SyncFolderItems", namespaces=NAMESPACES):
+            return  # pragma: no cover
+        email_address = request.xpath("//t:EmailAddress", namespaces=NAMESPACES)[0].text
+        sync_state = request.xpath("//m:SyncState", namespaces=NAMESPACES)
+        max_changes = int(request.xpath("//m:MaxChangesReturned", namespaces=NAMESPACES)[0].text)
+        if sync_state and not sync_state[0].text.isdigit():
+            return M.SyncFolderItemsResponse(
+                M.ResponseMessages(
+                    M.SyncFolderItemsResponseMessage(
+                        {'ResponseClass': 'Error'},
+                        M.MessageText('Synchronization state data is corrupt or otherwise invalid.'),
+                        M.ResponseCode('ErrorInvalidSyncStateData'),
+                    )
+                )
+            )
+
+        start = int(sync_state[0].text) if sync_state else 0
+        changes = self._email_to_changes[email_address]
+        end = min(start + max_changes, len(changes))
+        elements = []
+        for change_type, props in changes[start:end]:
+            if change_type == 'Delete':
+                elements.append(T.Delete(props['id'].to_xml()))
+            else:
+                elements.append(getattr(T, change_type)(self._generate_calendar_item(props)))
+        return M.SyncFolderItemsResponse(
+            M.ResponseMessages(
+                M.SyncFolderItemsResponseMessage(
+                    {'ResponseClass': 'Success'},
+                    M.ResponseCode('NoError'),
+                    M.SyncState(str(end)),
+                    M.IncludesLastItemInRange('true' if end == len(changes) else 'false'),
+                    M.Changes(*elements),
+                )
+            )
+        )
+
     def handle_resolve_names(self, request):
         if not request.xpath("//m:ResolveNames", namespaces=NAMESPACES):
             return  # pragma: no cover
@@ -136,7 +176,7 @@ def _generate_calendar_item(self, props):
             T.End(format_date_for_xml(props['end'])),
             T.LegacyFreeBusyStatus('Busy'),
             T.Location(""),
-            T.CalendarItemType('Single'),
+            T.CalendarItemType(props.get('calendar_item_type', 'Single')),
             T.Organizer(
                 T.Mailbox(
                     T.Name(props['organizer_name']),
@@ -148,7 +188,11 @@ def _generate_calendar_item(self, props):
         )
 
     def add_item(self, email, props):
-        self._email_to_props[email][props["id"]] = props
+        change_type = ('Update' if props["id"].hash in self._email_to_props[email] else 'Create')
+        self._email_to_props[email][props["id"].hash] = props
+        self._email_to_changes[email].append((change_type, dict(props)))
 
     def delete_item(self, email, id):
-        self._email_to_props[email].pop(id, None)
+        props = self._email_to_props[email].pop(id.hash, None)
+        if props:
+            self._email_to_changes[email].append(('Delete', props))
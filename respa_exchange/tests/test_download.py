@@ -4,7 +4,8 @@
 from django.utils.crypto import get_random_string
 from django.utils.timezone import now
 
-from respa_exchange.downloader import sync_from_exchange
+from respa_exchange import downloader
+from respa_exchange.downloader import sync_changes_from_exchange, sync_from_exchange
 from respa_exchange.ews.objs import ItemID
 from respa_exchange.models import ExchangeReservation, ExchangeResource
 from respa_exchange.tests.handlers import FindItemsHandler
@@ -12,13 +13,14 @@
 from respa_exchange.tests.utils import moments_close_enough
 
 
-def _generate_item_dict():
+def _generate_item_dict(start_hours=0):
     item_id = ItemID(get_random_string(), get_random_string())
+    start = now() + timedelta(hours=start_hours)
     item_dict = {
         'id': item_id,
         'subject': get_random_string(),
-        'start': now(),
-        'end': now() + timedelta(hours=1),
+        'start': start,
+        'end': start + timedelta(hours=1),
         'organizer_name': 'Bob Dummy'
     }
     return item_dict
@@ -33,7 +35,8 @@ def test_download(
     email = "%s@example.com" % get_random_string()
     other_email = "%s@example.com" % get_random_string()
     item_dict = _generate_item_dict()
-    other_item_dict = _generate_item_dict()
+    # Overlapping items would double book the resource
+    other_item_dict = _generate_item_dict(start_hours=5)
     item_id = item_dict["id"]
     delegate = FindItemsHandler()
     delegate.add_item(email, item_dict)
@@ -80,3 +83,82 @@ def _check_imported_reservation(item_id, item_dict):
     assert moments_close_enough(ex.reservation.end, item_dict['end'])
 
     return ex
+
+
+@pytest.mark.django_db
+def test_incremental_download(settings, space_resource, exchange, monkeypatch):
+    email = "%s@example.com" % get_random_string()
+    item_dict = _generate_item_dict()
+    other_item_dict = _generate_item_dict(start_hours=5)
+    delegate = FindItemsHandler()
+    delegate.add_item(email, item_dict)
+    delegate.add_item(email, other_item_dict)
+    SoapSeller.wire(settings, delegate)
+    ex_resource = ExchangeResource.objects.create(
+        resource=space_resource,
+        principal_email=email,
+        exchange=exchange,
+        sync_to_respa=True
+    )
+
+    full_syncs = []
+
+    def full_sync(ex_resource, *args, **kwargs):
+        full_syncs.append(ex_resource)
+        return sync_from_exchange(ex_resource, *args, **kwargs)
+
+    monkeypatch.setattr(downloader, 'sync_from_exchange', full_sync)
+
+    # Without a sync state, everything is downloaded
+    sync_changes_from_exchange(ex_resource)
+    assert len(full_syncs) == 1
+    assert ex_resource.reservations.count() == 2
+    ex_resource.refresh_from_db()
+    assert ex_resource.sync_state == '2'
+    assert ex_resource.last_full_sync_at
+
+    # After that, only the changes are downloaded
+    updated_item_dict = dict(
+        item_dict,
+        id=ItemID(item_dict['id'].id, get_random_string()),
+        end=item_dict['end'] + timedelta(hours=2),
+    )
+    delegate.add_item(email, updated_item_dict)
+    delegate.delete_item(email, other_item_dict['id'])
+    new_item_dict = _generate_item_dict(start_hours=10)
+    delegate.add_item(email, new_item_dict)
+    far_item_dict = _generate_item_dict(start_hours=24 * 400)  # Outside of the sync range
+    delegate.add_item(email, far_item_dict)
+    sync_changes_from_exchange(ex_resource)
+    assert len(full_syncs) == 1
+    assert ex_resource.reservations.count() == 2
+    ex = ExchangeReservation.objects.get(item_id_hash=item_dict['id'].hash)
+    assert ex.item_id.change_key == updated_item_dict['id'].change_key
+    assert abs((ex.reservation.end - updated_item_dict['end']).total_seconds()) < 0.1
+    assert not ExchangeReservation.objects.filter(item_id_hash=other_item_dict['id'].hash).exists()
+    _check_imported_reservation(new_item_dict['id'], new_item_dict)
+    ex_resource.refresh_from_db()
+    assert ex_resource.sync_state == '6'
+    delegate.delete_item(email, far_item_dict['id'])
+
+    # A rejected sync state is replaced by a full sync
+    ex_resource.sync_state = 'corrupt'
+    ex_resource.save()
+    sync_changes_from_exchange(ex_resource)
+    assert len(full_syncs) == 2
+    ex_resource.refresh_from_db()
+    assert ex_resource.sync_state == '7'
+
+    # So is a changed recurring item, whose occurrences only the full sync lists
+    recurring_item_dict = dict(_generate_item_dict(start_hours=30), calendar_item_type='RecurringMaster')
+    delegate.add_item(email, recurring_item_dict)
+    sync_changes_from_exchange(ex_resource)
+    assert len(full_syncs) == 3
+    assert ex_resource.reservations.count() == 3
+
+    # And the full sync is repeated every now and then
+    ex_resource.refresh_from_db()
+    ex_resource.last_full_sync_at -= timedelta(days=2)
+    ex_resource.save()
+    sync_changes_from_exchange(ex_resource)
+    assert len(full_syncs) == 4
@@ -107,7 +107,7 @@ def sync_resource(resource):  # Our pretend sync handler
         # so this test actually ends someday:
         notification_listener.stop()
 
-    monkeypatch.setattr(listener, 'sync_from_exchange', sync_resource)
+    monkeypatch.setattr(listener, 'sync_changes_from_exchange', sync_resource)
     notification_listener.start()
     # ... so when `sync_resource` is called, this'll eventually happen:
     assert ex_resource in synced_resources
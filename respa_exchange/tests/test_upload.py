@@ -1,11 +1,13 @@
 from datetime import timedelta
 
 import pytest
+from django.core.management import call_command
 from django.utils.crypto import get_random_string
 from django.utils.timezone import now
 
 from resources.models.reservation import Reservation
-from respa_exchange.models import ExchangeReservation, ExchangeResource
+from respa_exchange.ews.xml import M, NAMESPACES, T
+from respa_exchange.models import ExchangeReservation, ExchangeResource, ExchangeUploadOperation
 from respa_exchange.tests.handlers import CRUDItemHandlers
 from respa_exchange.tests.session import SoapSeller
 
@@ -69,3 +71,101 @@ def test_crud_reservation(
     # ... so our Exchange reservation gets destroyed.
 
     assert not ExchangeReservation.objects.filter(reservation=res).exists()
+
+
+class BatchItemHandlers(object):
+    def __init__(self):
+        self.requests = []
+
+    def handle_create(self, request):
+        if not request.xpath("//m:CreateItem", namespaces=NAMESPACES):
+            return  # pragma: no cover
+        items = request.xpath("//m:Items/t:CalendarItem", namespaces=NAMESPACES)
+        self.requests.append(("create", len(items)))
+        return M.CreateItemResponse(M.ResponseMessages(*[
+            M.CreateItemResponseMessage(
+                {"ResponseClass": "Success"},
+                M.ResponseCode("NoError"),
+                M.Items(T.CalendarItem(T.ItemId(Id=get_random_string(), ChangeKey="created")))
+            ) for item in items
+        ]))
+
+    def handle_delete(self, request):
+        if not request.xpath("//m:DeleteItem", namespaces=NAMESPACES):
+            return  # pragma: no cover
+        item_ids = request.xpath("//m:ItemIds/t:ItemId", namespaces=NAMESPACES)
+        self.requests.append(("delete", len(item_ids)))
+        return M.DeleteItemResponse(M.ResponseMessages(*[
+            M.DeleteItemResponseMessage({"ResponseClass": "Success"}, M.ResponseCode("NoError"))
+            for item_id in item_ids
+        ]))
+
+
+@pytest.mark.django_db
+def test_queued_upload(settings, space_resource, exchange):
+    settings.RESPA_EXCHANGE_UPLOAD_IMMEDIATELY = False
+    delegate = BatchItemHandlers()
+    SoapSeller.wire(settings, delegate)
+    ex_resource = ExchangeResource.objects.create(
+        resource=space_resource,
+        principal_email="test@example.com",
+        exchange=exchange
+    )
+    begin = now() + timedelta(days=1)
+    reservations = [
+        Reservation.objects.create(
+            resource=space_resource,
+            begin=begin + timedelta(hours=i),
+            end=begin + timedelta(hours=i, minutes=30),
+            state=Reservation.CONFIRMED
+        ) for i in range(3)
+    ]
+    # repeated changes are merged into the pending operation
+    reservations[0].reserver_name = "John Doe"
+    reservations[0].save()
+
+    assert delegate.requests == []
+    assert not ExchangeReservation.objects.exists()
+    assert ExchangeUploadOperation.objects.filter(state=ExchangeUploadOperation.PENDING).count() == 3
+
+    call_command("respa_exchange_upload")
+
+    assert delegate.requests == [("create", 3)]
+    assert ExchangeReservation.objects.filter(reservation__in=reservations).count() == 3
+    assert not ExchangeUploadOperation.objects.exclude(state=ExchangeUploadOperation.DONE).exists()
+
+    reservations[0].set_state(Reservation.CANCELLED, user=None)
+    reservations[1].delete()
+    assert ExchangeReservation.objects.count() == 1
+
+    call_command("respa_exchange_upload")
+
+    assert delegate.requests == [("create", 3), ("delete", 2)]
+    assert list(ExchangeReservation.objects.values_list("reservation", flat=True)) == [reservations[2].id]
+    assert ex_resource.upload_operations.filter(state=ExchangeUploadOperation.DONE).count() == 5
+
+
+@pytest.mark.django_db
+def test_failed_upload_is_retried(settings, space_resource, exchange):
+    settings.RESPA_EXCHANGE_UPLOAD_IMMEDIATELY = False
+    ExchangeResource.objects.create(
+        resource=space_resource,
+        principal_email="test@example.com",
+        exchange=exchange
+    )
+    Reservation.objects.create(
+        resource=space_resource,
+        begin=now(),
+        end=now() + timedelta(minutes=30),
+        state=Reservation.CONFIRMED
+    )
+    # no handlers, so every request fails
+    SoapSeller.wire(settings, object())
+    call_command("respa_exchange_upload")
+
+    operation = ExchangeUploadOperation.objects.get()
+    assert operation.state == ExchangeUploadOperation.PENDING
+    assert operation.attempts == 1
+    assert operation.last_error
+    assert operation.send_after > now()
+    assert not ExchangeReservation.objects.exists()
@@ -2,11 +2,18 @@
 Upload Respa reservations into Exchange as calendar events.
 """
 import logging
+from collections import defaultdict
 
+from django.db.transaction import atomic
 from django.utils.encoding import force_text
 
 from resources.models import Reservation
-from respa_exchange.ews.calendar import CreateCalendarItemRequest, DeleteCalendarItemRequest, UpdateCalendarItemRequest
+from respa_exchange.ews.calendar import (
+    CreateCalendarItemRequest, CreateCalendarItemsRequest, DeleteCalendarItemRequest, DeleteCalendarItemsRequest,
+    UpdateCalendarItemRequest, UpdateCalendarItemsRequest
+)
+from respa_exchange.ews.objs import ItemID
+from respa_exchange.models import ExchangeReservation, ExchangeResource, ExchangeUploadOperation
 
 log = logging.getLogger(__name__)
 
@@ -135,3 +142,179 @@ def delete_on_remote(exres):
     dcir.send(exres.exchange.get_ews_session())
     log.info("Deleted %s", exres)
     exres.delete()
+
+
+def _send_items(request, sess, count):
+    """
+    Send a request manipulating several items and return the outcome of each item
+
+    If the whole request fails, its error is the outcome of every item.
+    """
+    try:
+        results = request.send_items(sess)
+    except Exception as exc:
+        return [exc] * count
+    if len(results) != count:
+        return [ValueError("Exchange returned %d results instead of %d" % (len(results), count))] * count
+    return results
+
+
+def _group_operations(ex_resource, operations):
+    """
+    Sort upload operations into creations, updates and deletions by their notification setting
+
+    The operations that need nothing sent are marked sent. Returns the
+    groups and the number of those operations.
+    """
+    exchange_reservations = {
+        exres.reservation_id: exres for exres in ExchangeReservation.objects.filter(
+            reservation__in=[op.reservation_id for op in operations if op.operation != ExchangeUploadOperation.DELETE]
+        )
+    }
+    creates = defaultdict(list)
+    updates = defaultdict(list)
+    deletes = defaultdict(list)
+    seen_reservations = set()
+    unsent = []
+    for op in operations:
+        if op.operation == ExchangeUploadOperation.DELETE:
+            deletes[op.send_notifications].append((op, op.item_id, None))
+            continue
+
+        res = op.reservation
+        # A reservation is pushed as it is now, so an earlier operation of the same one covers this one.
+        # A deleted reservation has a delete operation of its own.
+        if res is None or res.id in seen_reservations:
+            unsent.append(op)
+            continue
+        seen_reservations.add(res.id)
+
+        exres = exchange_reservations.get(res.id)
+        if exres is None:
+            if res.state != Reservation.CONFIRMED:
+                unsent.append(op)
+                continue
+            exres = ExchangeReservation(
+                reservation=res,
+                exchange=ex_resource.exchange,
+                principal_email=ex_resource.principal_email
+            )
+            creates[op.send_notifications].append((op, exres))
+        elif exres.managed_in_exchange:
+            # Changes to reservations that came from Exchange are not uploaded
+            unsent.append(op)
+        elif res.state in (Reservation.DENIED, Reservation.CANCELLED):
+            deletes[op.send_notifications].append((op, exres.item_id, exres))
+        else:
+            updates[op.send_notifications].append((op, exres))
+
+    for op in unsent:
+        op.mark_sent()
+    return creates, updates, deletes, len(unsent)
+
+
+def _send_creates(sess, principal, send_notifications, items):
+    request = CreateCalendarItemsRequest(
+        principal=principal,
+        items_props=[_get_calendar_item_props(exres) for op, exres in items],
+        send_notifications=send_notifications
+    )
+    results = []
+    for (op, exres), result in zip(items, _send_items(request, sess, len(items))):
+        if isinstance(result, ItemID):
+            exres.item_id = result
+            exres.save()
+            op.mark_sent()
+            log.info("Created calendar item for %s", exres)
+        else:
+            op.mark_failed(result)
+        results.append(isinstance(result, ItemID))
+    return results
+
+
+def _send_updates(sess, principal, send_notifications, items):
+    request = UpdateCalendarItemsRequest(
+        principal=principal,
+        item_updates=[(exres.item_id, _get_calendar_item_props(exres)) for op, exres in items],
+        send_notifications=send_notifications
+    )
+    results = []
+    for (op, exres), result in zip(items, _send_items(request, sess, len(items))):
+        if isinstance(result, ItemID):
+            exres.item_id = result
+            exres.save()
+            op.mark_sent()
+            log.info("Updated calendar item for %s", exres)
+        else:
+            op.mark_failed(result)
+        results.append(isinstance(result, ItemID))
+    return results
+
+
+def _send_deletes(sess, principal, send_notifications, items):
+    request = DeleteCalendarItemsRequest(
+        principal=principal,
+        item_ids=[item_id for op, item_id, exres in items],
+        send_notifications=send_notifications
+    )
+    results = []
+    for (op, item_id, exres), result in zip(items, _send_items(request, sess, len(items))):
+        # An item that is already gone counts as deleted
+        deleted = result is None or getattr(result, 'code', None) == 'ErrorItemNotFound'
+        if deleted:
+            if exres is not None:
+                exres.delete()
+            op.mark_sent()
+            log.info("Deleted calendar item %s of %s", item_id.id, principal)
+        else:
+            op.mark_failed(result)
+        results.append(deleted)
+    return results
+
+
+def send_operations(ex_resource, operations):
+    """
+    Push upload operations of an Exchange resource to Exchange
+
+    The operations are sent as a CreateItem, an UpdateItem and a DeleteItem
+    request, one each for the operations with and without notifications,
+    and the outcome of each operation is recorded. Returns a tuple of the
+    numbers of sent and failed operations.
+
+    :type ex_resource: respa_exchange.models.ExchangeResource
+    :type operations: list[respa_exchange.models.ExchangeUploadOperation]
+    """
+    creates, updates, deletes, unsent_count = _group_operations(ex_resource, operations)
+    sess = ex_resource.exchange.get_ews_session()
+    principal = force_text(ex_resource.principal_email)
+    results = [True] * unsent_count
+    for send, groups in ((_send_creates, creates), (_send_updates, updates), (_send_deletes, deletes)):
+        for send_notifications, items in groups.items():
+            results += send(sess, principal, send_notifications, items)
+    return results.count(True), results.count(False)
+
+
+def send_pending_operations(ex_resource, batch_size=100, skip_locked=True):
+    """
+    Push the due upload operations of an Exchange resource to Exchange
+
+    The resource is locked meanwhile, like in sync_from_exchange, so that the
+    items created here are linked to their reservations before a download
+    can see them. Returns a tuple of the numbers of sent and failed
+    operations, or None if the resource is locked by another worker.
+
+    :type ex_resource: respa_exchange.models.ExchangeResource
+    :param skip_locked: if False, wait for the resource to be unlocked
+    """
+    with atomic():
+        ex_resource = ExchangeResource.objects.select_for_update(skip_locked=skip_locked, of=('self',))\
+            .select_related('exchange').filter(id=ex_resource.id).first()
+        if ex_resource is None:
+            return None
+        operations = list(
+            ex_resource.upload_operations.due().select_for_update(skip_locked=True, of=('self',))
+            .select_related('reservation__resource__unit', 'reservation__user').order_by('id')[:batch_size]
+        )
+        if not operations:
+            return 0, 0
+        return send_operations(ex_resource, operations)